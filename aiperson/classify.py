@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Score a directory tree of photos offline with the trained Pro AI / Anti AI model.
+
+Files are decoded and resized on a process pool while the previous batch
+runs through the model, and each batch's scores are appended to the output
+file as soon as they are ready. Re-running with the same output skips every
+file already in it, so an interrupted run just picks up where it stopped.
+Files that fail to decode are listed in a separate errors file next to the
+output (scores.errors.csv for scores.csv) and are retried on the next run.
+
+Usage:
+    python classify.py photos/ --output scores.csv
+    python classify.py photos/ --output scores.jsonl --model model.h5 --batch-size 128
+    python classify.py photos/ --output scores.csv --model saved_model/
+    python classify.py photos/ --output scores.csv --model model.tflite
+
+Output columns: path, score (probability of "pro AI"), label, error
+(the errors file has the same columns, with only path and error filled in).
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from image_cache import decode_resized
+
+os.environ['TF_USE_LEGACY_KERAS'] = '1'  # Force Keras 2 to load the training model.h5
+
+IMG_SIZE = 224
+SUPPORTED_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.avif'}
+BASE_DIR = Path(__file__).parent
+FIELDS = ['path', 'score', 'label', 'error']
+
+
+def iter_images(root):
+    """Yield image paths under root in a stable order, without listing the whole tree first."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if Path(name).suffix.lower() in SUPPORTED_EXTS:
+                yield os.path.join(dirpath, name)
+
+
+def decode(path):
+    """Pool worker: (path, uint8 pixels or None, error)."""
+    try:
+        return path, np.asarray(decode_resized(path, IMG_SIZE), dtype=np.uint8), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def decode_batch(paths):
+    return [decode(p) for p in paths]
+
+
+def load_predictor(model_path):
+    """Return a function mapping a float32 [N, 224, 224, 3] batch in [-1, 1] to N scores."""
+    import tensorflow as tf
+
+    model_path = Path(model_path)
+    if model_path.suffix == '.tflite':
+        interpreter = tf.lite.Interpreter(model_path=str(model_path))
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        state = {'batch': None}
+
+        def predict(x):
+            if state['batch'] != len(x):
+                interpreter.resize_tensor_input(input_index, x.shape)
+                interpreter.allocate_tensors()
+                state['batch'] = len(x)
+            interpreter.set_tensor(input_index, x)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index).reshape(-1)
+        return predict
+
+    if model_path.is_dir():
+        loaded = tf.saved_model.load(str(model_path))
+        fn = loaded.signatures['serving_default']
+
+        def predict(x):
+            out = fn(tf.constant(x))
+            return next(iter(out.values())).numpy().reshape(-1)
+        return predict
+
+    import tf_keras as keras
+    model = keras.models.load_model(str(model_path), compile=False)
+    return lambda x: model.predict_on_batch(x).reshape(-1)
+
+
+def errors_path(output):
+    return output.with_name(f"{output.stem}.errors{output.suffix}")
+
+
+def trim_partial_line(output):
+    """Cut off a last line left unfinished by an interrupted run, so appending
+    doesn't glue the next row onto it."""
+    if not output.exists():
+        return
+    with open(output, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+
+
+def read_done(output):
+    """Paths already scored in an existing output file."""
+    if not output.exists():
+        return set()
+    done = set()
+    with open(output, newline='') as f:
+        if output.suffix == '.jsonl':
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # blank or unfinished line
+            return done
+        return {row['path'] for row in csv.DictReader(f) if row.get('path')}
+
+
+class Writer:
+    """Append-only CSV / JSONL writer that flushes after every batch."""
+
+    def __init__(self, output, mode='a'):
+        self.jsonl = output.suffix == '.jsonl'
+        new = mode == 'w' or not output.exists() or output.stat().st_size == 0
+        self.f = open(output, mode, newline='')
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.f, fieldnames=FIELDS)
+            if new:
+                self.csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.f.write(json.dumps(row) + '\n')
+            else:
+                self.csv.writerow(row)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def batched(iterable, n):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-score photos with the Pro AI / Anti AI model")
+    parser.add_argument('input_dir', help="Directory tree of photos to score")
+    parser.add_argument('--output', required=True, help="Output file (.csv or .jsonl); appended to and resumed")
+    parser.add_argument('--model', default=str(BASE_DIR / 'model.h5'),
+                        help="Keras .h5 file, SavedModel directory or .tflite file")
+    parser.add_argument('--batch-size', type=int, default=64, help="Images per forward pass")
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: all cores)")
+    parser.add_argument('--prefetch', type=int, default=2, help="Batches decoded ahead of the model")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Score at or above which a photo is 'pro'")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    trim_partial_line(output)
+    done = read_done(output)
+    if done:
+        print(f"Resuming: {len(done)} images already scored in {output}")
+    todo = (p for p in iter_images(args.input_dir) if p not in done)
+
+    print(f"Loading model {args.model}...")
+    predict = load_predictor(args.model)
+
+    writer = Writer(output)
+    errors = Writer(errors_path(output), 'w')  # every failure is retried, so start afresh
+    scored = failed = 0
+    start = time.time()
+    last_report = start
+
+    workers = args.workers or os.cpu_count()
+    ctx = multiprocessing.get_context('spawn')  # TensorFlow is loaded, and is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        # Split each batch across the pool so decoding uses every core, and
+        # keep `prefetch` batches in flight while the model runs.
+        pending = deque()
+        batches = batched(todo, args.batch_size)
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            chunk = max(1, -(-len(batch) // workers))
+            pending.append([pool.submit(decode_batch, batch[i:i + chunk]) for i in range(0, len(batch), chunk)])
+            return True
+
+        for _ in range(args.prefetch + 1):
+            if not submit_next():
+                break
+
+        while pending:
+            results = [r for fut in pending.popleft() for r in fut.result()]
+            submit_next()
+
+            rows = []
+            good = [(path, pixels) for path, pixels, _ in results if pixels is not None]
+            if good:
+                # MobileNetV2 preprocessing: scale [0, 255] to [-1, 1]
+                x = np.stack([pixels for _, pixels in good]).astype(np.float32) / 127.5 - 1.0
+                for (path, _), score in zip(good, predict(x)):
+                    score = float(score)
+                    rows.append({'path': path, 'score': round(score, 6),
+                                 'label': 'pro' if score >= args.threshold else 'anti', 'error': ''})
+            writer.write(rows)
+            errors.write([{'path': path, 'score': '', 'label': '', 'error': error}
+                          for path, pixels, error in results if pixels is None])
+
+            scored += len(rows)
+            failed += len(results) - len(rows)
+            now = time.time()
+            if now - last_report >= 10:
+                print(f"  {scored} images, {scored / (now - start):.1f} images/sec")
+                last_report = now
+
+    writer.close()
+    errors.close()
+    elapsed = time.time() - start
+    rate = scored / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {scored} images in {elapsed:.1f}s ({rate:.1f} images/sec) → {output}")
+    if failed:
+        print(f"{failed} images could not be decoded (see {errors_path(output)}); "
+              f"they will be retried on the next run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+On-disk store for frozen-backbone features, used by `train_model.py --feature-cache`.
+
+MobileNetV2 is frozen during training, so its pooled 1280-d output for a
+given (image, augmentation) never changes. The store keeps one float32 row
+per key "<sha256 of file>:<augmentation seed>" so each pair only goes
+through the backbone once, ever.
+
+Layout inside the cache directory:
+    meta.json      {"tag": ..., "dim": ..., "keys": [key, ...]}  (row i = keys[i])
+    features.f32   rows appended in key order, float32, row-major
+
+`tag` identifies the backbone, input size and augmentation version; when
+it changes the store starts over.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class FeatureStore:
+    def __init__(self, cache_dir, tag, dim):
+        self.dir = Path(cache_dir)
+        self.tag = tag
+        self.dim = dim
+        self.meta_path = self.dir / "meta.json"
+        self.data_path = self.dir / "features.f32"
+        self.rows = {}
+        self.pending_keys = []
+        self.pending_rows = []
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self.meta_path.exists() and self.data_path.exists():
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            data = np.fromfile(self.data_path, dtype=np.float32)
+            size = len(meta["keys"]) * dim
+            if meta.get("tag") == tag and meta.get("dim") == dim and data.size >= size:
+                if data.size > size:
+                    # Rows appended by a run that died before updating meta.json
+                    data = data[:size]
+                    data.tofile(self.data_path)
+                data = data.reshape(-1, dim)
+                self.rows = {key: data[i] for i, key in enumerate(meta["keys"])}
+                return
+
+        # Missing, stale or inconsistent: start a fresh store
+        self.data_path.write_bytes(b"")
+        self._write_meta([])
+
+    def _write_meta(self, keys):
+        tmp = self.meta_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"tag": self.tag, "dim": self.dim, "keys": keys}, f)
+        tmp.replace(self.meta_path)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get(self, key):
+        return self.rows[key]
+
+    def add(self, key, row):
+        if key in self.rows:
+            return
+        row = np.asarray(row, dtype=np.float32).reshape(self.dim)
+        self.rows[key] = row
+        self.pending_keys.append(key)
+        self.pending_rows.append(row)
+
+    def flush(self):
+        """Append pending rows to disk, then publish them in meta.json."""
+        if not self.pending_keys:
+            return
+        with open(self.data_path, "ab") as f:
+            np.stack(self.pending_rows).astype(np.float32).tofile(f)
+        self._write_meta(list(self.rows.keys()))
+        self.pending_keys = []
+        self.pending_rows = []
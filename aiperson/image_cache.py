@@ -0,0 +1,166 @@
+"""
+Parallel decode + memory-mapped cache of resized training images.
+
+Decoding the HEIC/AVIF photos in `pro ai` / `anti ai` through pillow_heif
+is slow and used to happen again on every training run. build_cache()
+decodes and resizes every image once, spread across all cores with a
+process pool, and stores the pixels in a single uint8 array file that
+later runs memory-map instead of decoding anything.
+
+Layout inside the cache directory:
+    images.u8    N x size x size x 3 uint8, row-major
+    index.json   {"size": ..., "entries": {path: {"row", "mtime_ns", "bytes", "sha256"}}}
+
+An entry is reused when the file's mtime and size are unchanged. If they
+changed but the content hash still matches (e.g. after a fresh checkout)
+the row is reused too; otherwise the file is decoded again.
+
+The pool is started with the 'spawn' method, since the caller
+(train_model.py) has usually loaded TensorFlow already, and forking a
+process with TensorFlow's threads running isn't safe. This module doesn't
+import TensorFlow, but spawned workers re-import the main script, so
+when that is train_model.py each worker pays for importing TensorFlow
+once (a few seconds) before it starts decoding.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Register HEIF/AVIF support before any image loading
+import pillow_heif
+pillow_heif.register_heif_opener()
+
+from PIL import Image
+
+
+def decode_resized(path, size):
+    """Decode an image file (any supported format) to a size x size RGB PIL image."""
+    img = Image.open(path).convert('RGB')
+    return img.resize((size, size), Image.LANCZOS)
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _decode_worker(args):
+    """Pool worker: returns (path, sha256, pixels or None, error)."""
+    path, sha, size = args
+    try:
+        return path, sha, np.asarray(decode_resized(path, size), dtype=np.uint8), None
+    except Exception as e:
+        return path, sha, None, str(e)
+
+
+class DecodedImages:
+    """Read-only view of the cache: path -> uint8 [size, size, 3] array."""
+
+    def __init__(self, array, rows):
+        self.array = array
+        self.rows = rows
+
+    def __contains__(self, path):
+        return path in self.rows
+
+    def get(self, path):
+        return self.array[self.rows[path]]
+
+    def image(self, path):
+        return Image.fromarray(self.get(path))
+
+
+def build_cache(paths, cache_dir, size, workers=None):
+    """Make sure every file in `paths` is decoded in the cache and return a DecodedImages.
+
+    Files that fail to decode are reported and left out.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index_path = cache_dir / 'index.json'
+    data_path = cache_dir / 'images.u8'
+    row_shape = (size, size, 3)
+    row_bytes = size * size * 3
+
+    old_entries = {}
+    old_array = None
+    if index_path.exists() and data_path.exists():
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('size') == size and data_path.stat().st_size % row_bytes == 0:
+            old_entries = index['entries']
+            n_rows = data_path.stat().st_size // row_bytes
+            if n_rows:
+                old_array = np.memmap(data_path, dtype=np.uint8, mode='r', shape=(n_rows, *row_shape))
+
+    by_sha = {e['sha256']: e['row'] for e in old_entries.values()}
+    reuse = {}  # path -> (old row, entry)
+    to_decode = []  # (path, sha256)
+    for path in paths:
+        st = os.stat(path)
+        entry = old_entries.get(path)
+        if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['bytes'] == st.st_size:
+            reuse[path] = (entry['row'], entry)
+            continue
+        sha = _sha256(path)
+        if sha in by_sha:
+            reuse[path] = (by_sha[sha], {'sha256': sha})
+        else:
+            to_decode.append((path, sha))
+
+    if not to_decode and set(reuse) == set(old_entries) and all(
+            reuse[p][1] is old_entries[p] for p in reuse):
+        print(f"Decode cache: all {len(reuse)} images cached")
+        return DecodedImages(old_array, {p: r for p, (r, _) in reuse.items()})
+
+    decoded = {}
+    if to_decode:
+        workers = workers or os.cpu_count()
+        print(f"Decode cache: {len(reuse)} cached, decoding {len(to_decode)} on {workers} processes...")
+        ctx = multiprocessing.get_context('spawn')  # TensorFlow is not fork-safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            jobs = [(p, sha, size) for p, sha in to_decode]
+            for path, sha, pixels, error in pool.map(_decode_worker, jobs, chunksize=4):
+                if pixels is None:
+                    print(f"  SKIP: {Path(path).name} ({error})")
+                    continue
+                decoded[path] = (sha, pixels)
+
+    # Write a fresh array with reused rows copied over, then swap it in
+    kept = [p for p in paths if p in reuse or p in decoded]
+    tmp_path = data_path.with_suffix('.tmp')
+    new_array = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=(max(1, len(kept)), *row_shape))
+    entries = {}
+    for row, path in enumerate(kept):
+        st = os.stat(path)
+        if path in reuse:
+            old_row, entry = reuse[path]
+            new_array[row] = old_array[old_row]
+            sha = entry['sha256']
+        else:
+            sha, pixels = decoded[path]
+            new_array[row] = pixels
+        entries[path] = {'row': row, 'mtime_ns': st.st_mtime_ns, 'bytes': st.st_size, 'sha256': sha}
+    new_array.flush()
+    del new_array, old_array
+
+    # Drop the index before swapping the data so a crash in between can
+    # only cost a rebuild, never pair old rows with new pixels.
+    index_path.unlink(missing_ok=True)
+    os.replace(tmp_path, data_path)
+    with open(index_path.with_suffix('.tmp'), 'w') as f:
+        json.dump({'size': size, 'entries': entries}, f)
+    os.replace(index_path.with_suffix('.tmp'), index_path)
+
+    print(f"Decode cache: {len(kept)} images in {data_path}")
+    array = np.memmap(data_path, dtype=np.uint8, mode='r', shape=(max(1, len(kept)), *row_shape))
+    return DecodedImages(array, {p: e['row'] for p, e in entries.items()})
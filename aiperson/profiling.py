@@ -0,0 +1,119 @@
+"""
+Timing and memory instrumentation for train_model.py.
+
+Wall-clock phases of a run (decode cache, feature extraction, fit, export)
+are timed with `phase()`. Work that happens inside the tf.data pipeline is
+spread over several threads, so it is summed with `timed()` instead: those
+totals are seconds across all threads and can exceed the wall time of the
+phase they ran in. Comparing them with the training phase shows whether a
+run is input-bound.
+
+Peak memory comes from getrusage (not available on Windows). This module
+doesn't import TensorFlow.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident memory in MB of this process and of its reaped children
+    (e.g. the decode pool), or (None, None) where getrusage is unavailable."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 / (1024 * 1024) if sys.platform == 'darwin' else 1 / 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(own, 1), round(children, 1)
+
+
+class Profiler:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}    # name -> wall seconds
+        self.counters = {}  # name -> [seconds summed over threads, calls]
+        self.epochs = []
+        self.info = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a top-level, single-threaded section of the run."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t
+
+    @contextmanager
+    def timed(self, name, calls=1):
+        """Add the duration of a block to a thread-safe counter."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t
+            with self._lock:
+                counter = self.counters.setdefault(name, [0.0, 0])
+                counter[0] += elapsed
+                counter[1] += calls
+
+    def take_counters(self):
+        """Return the counters collected so far and start new ones."""
+        with self._lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def add_epoch(self, **stats):
+        self.epochs.append(stats)
+
+    def summary(self):
+        own, children = peak_rss_mb()
+        rates = [e['samples_per_sec'] for e in self.epochs]
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'total_seconds': round(time.perf_counter() - self.started, 3),
+            'phases': {name: round(s, 3) for name, s in self.phases.items()},
+            'pipeline': {
+                name: {'seconds': round(s, 3), 'calls': n, 'ms_per_call': round(1000 * s / n, 3) if n else None}
+                for name, (s, n) in self.counters.items()
+            },
+            'epochs': self.epochs,
+            'mean_samples_per_sec': round(sum(rates) / len(rates), 1) if rates else None,
+            'peak_rss_mb': own,
+            'peak_rss_children_mb': children,
+            **self.info,
+        }
+
+    def report(self, path=None):
+        """Print a readable summary and, if `path` is given, write it as JSON."""
+        summary = self.summary()
+        total = summary['total_seconds']
+
+        print(f"\nProfile ({total:.1f}s total)")
+        for name, seconds in summary['phases'].items():
+            print(f"  {name:<20}{seconds:>9.1f}s{seconds / total:>7.0%}")
+        if summary['pipeline']:
+            print("  in-pipeline work (summed over threads):")
+            for name, c in summary['pipeline'].items():
+                print(f"    {name:<18}{c['seconds']:>9.1f}s{c['calls']:>9} calls{c['ms_per_call'] or 0:>9.1f} ms/call")
+        if summary['mean_samples_per_sec'] is not None:
+            print(f"  training throughput  {summary['mean_samples_per_sec']:.1f} samples/sec (mean over epochs)")
+        if summary['peak_rss_mb'] is not None:
+            print(f"  peak memory          {summary['peak_rss_mb']:.0f} MB"
+                  f" (child processes: {summary['peak_rss_children_mb']:.0f} MB)")
+
+        if path:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=1)
+            print(f"  summary written to {path}")
+        return summary
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Grouped k-fold hyperparameter sweep for the Pro AI / Anti AI classifier.
+
+Every photo is assigned to one of k folds (stratified by label, and with
+byte-identical files kept together), so a photo and all of its augmented
+copies are always on the same side of a split. Each configuration in the
+grid is trained k times, once per held-out fold, and the configurations
+are ranked by mean validation accuracy across folds.
+
+The MobileNetV2 backbone is frozen, so its features don't depend on any
+of the swept parameters. They are computed once through the feature
+cache (see train_model.py --feature-cache) for the original plus the
+largest augment factor's copies, written to one memory-mapped file, and
+shared read-only by all pool workers, which only train the head.
+
+Usage:
+    python sweep.py
+    python sweep.py --folds 5 --lr 1e-3,3e-4 --units 64,128,256 --dropout 0.3,0.5 --augment 0,2,5
+    python sweep.py --workers 4 --epochs 20 --output sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import train_model as tm
+from image_cache import build_cache
+
+# Set in each pool worker by _init_worker
+_features = None  # memmapped [files, 1 + max augment, FEATURE_DIM] float32
+_labels = None
+_folds = None
+
+
+def parse_list(text, cast=float):
+    return [cast(v) for v in text.split(',') if v.strip()]
+
+
+def grouped_folds(items, shas, k, seed):
+    """Fold number for every (path, label) item.
+
+    Files are grouped by SHA-256 so copies of the same photo land in the
+    same fold, and groups are dealt round-robin per label so every fold
+    has about the same class balance.
+    """
+    rng = random.Random(seed)
+    fold_of = {}
+    n = 0
+    for label in sorted({l for _, l in items}):
+        groups = sorted({sha for (_, l), sha in zip(items, shas) if l == label and sha not in fold_of})
+        rng.shuffle(groups)
+        for sha in groups:
+            fold_of[sha] = n % k
+            n += 1
+    return np.array([fold_of[sha] for sha in shas])
+
+
+def _init_worker(path, shape, labels, folds, threads):
+    global _features, _labels, _folds
+    # Split the cores between workers instead of every worker using all of them
+    tm.tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tm.tf.config.threading.set_inter_op_parallelism_threads(1)
+    _features = np.memmap(path, dtype=np.float32, mode='r', shape=shape)
+    _labels = labels
+    _folds = folds
+
+
+def train_fold(config, fold, epochs, seed):
+    """Pool worker: train one head configuration with `fold` held out and
+    return its validation loss and accuracy."""
+    start = time.perf_counter()
+    tm.keras.utils.set_random_seed(seed + fold)
+
+    train_idx = np.flatnonzero(_folds != fold)
+    val_idx = np.flatnonzero(_folds == fold)
+    variants = 1 + config['augment']
+    X_train = _features[train_idx, :variants].reshape(-1, tm.FEATURE_DIM)
+    y_train = np.repeat(_labels[train_idx], variants)
+    X_val = np.asarray(_features[val_idx, 0])
+    y_val = _labels[val_idx]
+
+    model = tm.build_head_model(tm.build_head(config['units'], config['dropout']))
+    tm.compile_model(model, config['lr'])
+    model.fit(X_train, y_train, epochs=epochs, batch_size=tm.BATCH_SIZE, shuffle=True, verbose=0)
+    loss, acc = model.evaluate(X_val, y_val, batch_size=256, verbose=0)
+    tm.keras.backend.clear_session()
+    return {'fold': fold, 'loss': float(loss), 'accuracy': float(acc), 'seconds': time.perf_counter() - start}
+
+
+def print_table(ranked, folds, top):
+    print(f"\nRanked by mean validation accuracy over {folds} folds")
+    print(f"  {'#':>3}  {'lr':>8}{'units':>7}{'dropout':>9}{'augment':>9}{'val acc':>16}{'val loss':>10}{'time':>8}")
+    for rank, r in enumerate(ranked[:top], 1):
+        c = r['config']
+        print(f"  {rank:>3}  {c['lr']:>8.0e}{c['units']:>7}{c['dropout']:>9.2f}{c['augment']:>9}"
+              f"{r['accuracy_mean']:>9.2%} ±{r['accuracy_std'] * 100:>4.1f}"
+              f"{r['loss_mean']:>10.4f}{r['seconds']:>7.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grouped k-fold hyperparameter sweep for the Pro AI / Anti AI classifier")
+    parser.add_argument('--folds', type=int, default=5, help="Number of cross-validation folds")
+    parser.add_argument('--lr', default='1e-3,3e-4', help="Comma-separated learning rates")
+    parser.add_argument('--units', default='64,128', help="Comma-separated Dense layer widths")
+    parser.add_argument('--dropout', default='0.3,0.5', help="Comma-separated dropout rates")
+    parser.add_argument('--augment', default=f'0,{tm.AUGMENT_FACTOR}',
+                        help="Comma-separated augment factors (augmented copies per photo)")
+    parser.add_argument('--epochs', type=int, default=tm.EPOCHS, help="Epochs per fit")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Training processes (default: half the cores)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the fold assignment and weight init")
+    parser.add_argument('--top', type=int, default=20, help="Rows to print in the ranked table")
+    parser.add_argument('--output', help="Also write every configuration's fold results to this JSON file")
+    parser.add_argument('--cache-dir', default=str(tm.BASE_DIR / '.feature_cache'),
+                        help="Feature cache shared with train_model.py --feature-cache")
+    parser.add_argument('--decode-cache-dir', default=str(tm.BASE_DIR / '.decode_cache'),
+                        help="Decoded image cache shared with train_model.py")
+    parser.add_argument('--decode-workers', type=int, default=None,
+                        help="Processes used to decode images (default: all cores)")
+    args = parser.parse_args()
+
+    configs = [
+        {'lr': lr, 'units': units, 'dropout': dropout, 'augment': augment}
+        for lr, units, dropout, augment in itertools.product(
+            parse_list(args.lr), parse_list(args.units, int),
+            parse_list(args.dropout), parse_list(args.augment, int))
+    ]
+    max_augment = max(c['augment'] for c in configs)
+
+    items = tm.list_images(tm.BASE_DIR / "pro ai", 1.0) + tm.list_images(tm.BASE_DIR / "anti ai", 0.0)
+    tm._decoded = build_cache([p for p, _ in items], args.decode_cache_dir, tm.IMG_SIZE, args.decode_workers)
+    items = [item for item in items if item[0] in tm._decoded]
+    print(f"{len(items)} images, {len(configs)} configurations x {args.folds} folds\n")
+
+    base_model = tm.MobileNetV2(weights='imagenet', include_top=False, input_shape=(tm.IMG_SIZE, tm.IMG_SIZE, 3))
+    base_model.trainable = False
+    seeds = range(1 + max_augment)
+    features, _ = tm.cached_features(items, seeds, base_model, args.cache_dir)
+    if len(features) != len(items) * len(seeds):
+        raise SystemExit("Some images produced no features; check the SKIP lines above")
+    features = features.reshape(len(items), len(seeds), tm.FEATURE_DIM)
+    labels = np.array([l for _, l in items], dtype=np.float32)
+    folds = grouped_folds(items, [tm.file_sha256(p) for p, _ in items], args.folds, args.seed)
+    del base_model
+
+    workers = args.workers or max(1, (os.cpu_count() or 2) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    results = [[] for _ in configs]
+    start = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'features.f32'
+        shared = np.memmap(path, dtype=np.float32, mode='w+', shape=features.shape)
+        shared[:] = features
+        shared.flush()
+        shape = features.shape
+        del shared, features
+
+        print(f"\nTraining {len(configs) * args.folds} folds on {workers} processes x {threads} threads...")
+        ctx = multiprocessing.get_context('spawn')  # TensorFlow is not fork-safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(str(path), shape, labels, folds, threads)) as pool:
+            futures = {
+                pool.submit(train_fold, config, fold, args.epochs, args.seed): i
+                for i, config in enumerate(configs)
+                for fold in range(args.folds)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]].append(future.result())
+                if done % 10 == 0 or done == len(futures):
+                    print(f"  {done}/{len(futures)} folds done ({time.time() - start:.0f}s)")
+
+    ranked = []
+    for config, fold_results in zip(configs, results):
+        fold_results.sort(key=lambda r: r['fold'])
+        accs = [r['accuracy'] for r in fold_results]
+        losses = [r['loss'] for r in fold_results]
+        ranked.append({
+            'config': config,
+            'accuracy_mean': float(np.mean(accs)),
+            'accuracy_std': float(np.std(accs)),
+            'loss_mean': float(np.mean(losses)),
+            'seconds': sum(r['seconds'] for r in fold_results),
+            'folds': fold_results,
+        })
+    ranked.sort(key=lambda r: (-r['accuracy_mean'], r['loss_mean']))
+
+    print_table(ranked, args.folds, args.top)
+    print(f"\nSweep finished in {time.time() - start:.0f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'folds': args.folds, 'epochs': args.epochs, 'images': len(items), 'results': ranked}, f, indent=1)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
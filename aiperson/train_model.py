@@ -2,16 +2,34 @@
 """
 Train a Pro AI vs Anti AI image classifier using MobileNetV2 transfer learning.
 Exports the model to TensorFlow.js format for browser-based inference.
+
+Usage:
+    python train_model.py                    # stream images through the full model each epoch
+    python train_model.py --feature-cache    # run the frozen backbone once, train the head on cached features
+    python train_model.py --no-decode-cache  # decode source files every run instead of using .decode_cache
+    python train_model.py --quantize uint8 --graph-model --export-report
+    python train_model.py --export-only --export-report   # re-export an existing model.h5
+    python train_model.py --benchmark-input --profile-dir logs/profile
+    python sweep.py                          # k-fold hyperparameter sweep (see sweep.py)
+
+Every run prints a profile (phase times, samples/sec per epoch, peak
+memory) and writes it to train_summary.json for comparing runs.
+
+Source images are decoded and resized once, in parallel, into a
+memory-mapped cache (see image_cache.py); later runs skip decoding.
 """
 
+import argparse
+import hashlib
 import os
+import shutil
+import subprocess
+import tempfile
+import time
 import numpy as np
 from pathlib import Path
 
-# Register HEIF/AVIF support before any image loading
-import pillow_heif
-pillow_heif.register_heif_opener()
-
+from image_cache import build_cache, decode_resized
 from PIL import Image, ImageEnhance
 import random
 import os
@@ -23,151 +41,558 @@ from tf_keras import layers
 from tf_keras.applications import MobileNetV2
 from tf_keras.applications.mobilenet_v2 import preprocess_input
 
+from feature_cache import FeatureStore
+from profiling import Profiler, peak_rss_mb
+
 # Config
 IMG_SIZE = 224
 BATCH_SIZE = 8
 EPOCHS = 30
 AUGMENT_FACTOR = 5  # Generate this many augmented copies per image
+VAL_FRACTION = 0.2  # Fraction of source photos held out for validation
+SHUFFLE_BUFFER = 512  # Images held in the shuffle buffer (uint8, ~75 MB)
+SUPPORTED_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.avif'}
+FEATURE_DIM = 1280  # MobileNetV2 pooled output
+AUG_VERSION = 1  # Bump when augment_image changes, to invalidate cached features
 BASE_DIR = Path(__file__).parent
 
 
-def augment_image(img):
-    """Apply random augmentations to a PIL image."""
+def augment_image(img, rng=random):
+    """Apply random augmentations to a PIL image.
+
+    Pass a seeded random.Random as `rng` to get a reproducible augmentation.
+    """
     # Random horizontal flip
-    if random.random() > 0.5:
+    if rng.random() > 0.5:
         img = img.transpose(Image.FLIP_LEFT_RIGHT)
     # Random rotation (-15 to 15 degrees)
-    angle = random.uniform(-15, 15)
+    angle = rng.uniform(-15, 15)
     img = img.rotate(angle, resample=Image.BILINEAR, fillcolor=(128, 128, 128))
     # Random brightness
-    factor = random.uniform(0.8, 1.2)
+    factor = rng.uniform(0.8, 1.2)
     img = ImageEnhance.Brightness(img).enhance(factor)
     # Random zoom (crop and resize)
-    if random.random() > 0.5:
+    if rng.random() > 0.5:
         w, h = img.size
-        crop_frac = random.uniform(0.85, 1.0)
+        crop_frac = rng.uniform(0.85, 1.0)
         cw, ch = int(w * crop_frac), int(h * crop_frac)
-        left = random.randint(0, w - cw)
-        top = random.randint(0, h - ch)
+        left = rng.randint(0, w - cw)
+        top = rng.randint(0, h - ch)
         img = img.crop((left, top, left + cw, top + ch)).resize((w, h), Image.LANCZOS)
     return img
 
 
-def load_images_from_folder(folder, label, augment=True):
-    """Load and preprocess images from a folder, handling multiple formats."""
-    images = []
-    labels = []
-    supported_exts = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.avif'}
+def list_images(folder, label):
+    """Return (path, label) pairs for every supported image in a folder."""
+    return [
+        (str(f), label)
+        for f in sorted(folder.iterdir())
+        if f.suffix.lower() in SUPPORTED_EXTS
+    ]
+
+
+def split_items(items, val_fraction):
+    """Split (path, label) pairs into train/val by file, stratified per label.
+
+    Splitting files (not augmented copies) keeps every copy of a photo on
+    the same side, so validation never sees an augmented twin of a
+    training image. Every label with at least two files gets at least one
+    validation file (and keeps at least one for training).
+    """
+    train, val = [], []
+    for label in sorted({l for _, l in items}):
+        group = [item for item in items if item[1] == label]
+        random.shuffle(group)
+        n_val = int(round(len(group) * val_fraction))
+        if len(group) >= 2:
+            n_val = min(max(n_val, 1), len(group) - 1)
+        val += group[:n_val]
+        train += group[n_val:]
+    return train, val
+
+
+_decoded = None  # DecodedImages from image_cache, set by main()
+_profiler = Profiler()
+
+
+def load_image(path):
+    """Return an IMG_SIZE x IMG_SIZE RGB PIL image for a source file,
+    from the decode cache when it has one."""
+    with _profiler.timed('decode'):
+        if _decoded is not None and path in _decoded:
+            return _decoded.image(path)
+        return decode_resized(path, IMG_SIZE)
+
+
+_skipped = set()
+
+
+def _load_with_copies(path, copies):
+    """Decode one file and return it plus `copies` freshly augmented versions
+    as a uint8 array of shape [1 + copies, IMG_SIZE, IMG_SIZE, 3]."""
+    path, copies = path.decode(), int(copies)
+    try:
+        img = load_image(path)
+    except Exception as e:
+        if path not in _skipped:
+            _skipped.add(path)
+            print(f"  SKIP: {Path(path).name} ({e})")
+        return np.zeros((0, IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+
+    arrs = [np.asarray(img, dtype=np.uint8)]
+    if copies:
+        with _profiler.timed('augment', copies):
+            for _ in range(copies):
+                arrs.append(np.asarray(augment_image(img.copy()), dtype=np.uint8))
+    return np.stack(arrs)
+
+
+def make_dataset(items, augment_factor=0, training=False):
+    """Streaming tf.data pipeline over (path, label) pairs.
+
+    Each file is decoded once per epoch on a parallel map and expanded into
+    the original plus `augment_factor` augmented copies, drawn fresh every
+    epoch. Images stay uint8 through a bounded shuffle buffer and are only
+    converted to float32 / MobileNetV2 range per batch, so memory use does
+    not grow with the dataset.
+    """
+    paths = [p for p, _ in items]
+    labels = [l for _, l in items]
+    copies = augment_factor if training else 0
+
+    # Explicit dtypes: an empty list would otherwise come out as float32
+    ds = tf.data.Dataset.from_tensor_slices((tf.constant(paths, tf.string), tf.constant(labels, tf.float32)))
+    if training:
+        ds = ds.shuffle(len(items), reshuffle_each_iteration=True)
+
+    def load(path, label):
+        imgs = tf.numpy_function(_load_with_copies, [path, copies], tf.uint8)
+        imgs.set_shape([None, IMG_SIZE, IMG_SIZE, 3])
+        return imgs, tf.fill([tf.shape(imgs)[0]], label)
+
+    ds = ds.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    ds = ds.unbatch()
+    if training:
+        ds = ds.shuffle(SHUFFLE_BUFFER)
+
+    def preprocess(img, label):
+        # Preprocess for MobileNetV2 (scales to [-1, 1])
+        return preprocess_input(tf.cast(img, tf.float32)), label
+
+    ds = ds.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def seeded_variant(img, sha, seed):
+    """Augmentation `seed` of an image: 0 is the original, 1.. are
+    augmentations that are identical on every run for the same file."""
+    if seed == 0:
+        return img
+    return augment_image(img.copy(), random.Random(f"{sha}:{seed}"))
+
+
+def cached_features(items, seeds, base_model, cache_dir):
+    """Return (features, labels) for every (item, seed) pair, running the
+    frozen backbone only for pairs missing from the on-disk feature store."""
+    tag = f"{base_model.name}:{IMG_SIZE}:aug{AUG_VERSION}"
+    store = FeatureStore(cache_dir, tag, FEATURE_DIM)
+
+    keyed = []
+    for path, label in items:
+        sha = file_sha256(path)
+        keyed.append((path, label, sha))
+
+    missing = [(path, sha, seed) for path, _, sha in keyed for seed in seeds
+               if f"{sha}:{seed}" not in store]
+    print(f"Features: {len(keyed) * len(seeds) - len(missing)} cached, {len(missing)} to compute")
+
+    if missing:
+        extractor = keras.Sequential([base_model, layers.GlobalAveragePooling2D()])
+        batch, keys = [], []
+        decoded = {}
+
+        def run_batch():
+            with _profiler.timed('preprocess', len(batch)):
+                x = preprocess_input(np.stack(batch).astype(np.float32))
+            with _profiler.timed('backbone', len(batch)):
+                rows = extractor.predict(x, verbose=0)
+            for key, row in zip(keys, rows):
+                store.add(key, row)
+            store.flush()
+            batch.clear()
+            keys.clear()
+
+        for path, sha, seed in missing:
+            if path not in decoded:
+                decoded.clear()
+                try:
+                    decoded[path] = load_image(path)
+                except Exception as e:
+                    print(f"  SKIP: {Path(path).name} ({e})")
+                    decoded[path] = None
+            img = decoded[path]
+            if img is None:
+                continue
+            if seed:
+                with _profiler.timed('augment'):
+                    img = seeded_variant(img, sha, seed)
+            batch.append(np.asarray(img))
+            keys.append(f"{sha}:{seed}")
+            if len(batch) == 64:
+                run_batch()
+        if batch:
+            run_batch()
+
+    features, labels = [], []
+    for _, label, sha in keyed:
+        for seed in seeds:
+            key = f"{sha}:{seed}"
+            if key in store:
+                features.append(store.get(key))
+                labels.append(label)
+    if not features:
+        return np.zeros((0, FEATURE_DIM), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    return np.stack(features), np.array(labels, dtype=np.float32)
+
+
+def build_head(units=128, dropout=0.5):
+    """Classification head applied to the pooled MobileNetV2 features."""
+    return [
+        layers.Dense(units, activation='relu'),
+        layers.Dropout(dropout),
+        layers.Dense(1, activation='sigmoid'),
+    ]
+
+
+def build_model(base_model, head):
+    inputs = keras.Input(shape=(IMG_SIZE, IMG_SIZE, 3))
+    x = base_model(inputs, training=False)
+    x = layers.GlobalAveragePooling2D()(x)
+    for layer in head:
+        x = layer(x)
+    return keras.Model(inputs, x)
 
-    for f in sorted(folder.iterdir()):
-        if f.suffix.lower() not in supported_exts:
-            continue
-        try:
-            img = Image.open(f).convert('RGB')
-            img = img.resize((IMG_SIZE, IMG_SIZE), Image.LANCZOS)
 
-            # Original image
-            arr = np.array(img, dtype=np.float32)
-            images.append(arr)
-            labels.append(label)
+def build_head_model(head):
+    """Model running the head layers directly on cached FEATURE_DIM features."""
+    features_in = keras.Input(shape=(FEATURE_DIM,))
+    x = features_in
+    for layer in head:
+        x = layer(x)
+    return keras.Model(features_in, x)
+
 
-            # Augmented copies
-            if augment:
-                for _ in range(AUGMENT_FACTOR):
-                    aug_img = augment_image(img.copy())
-                    arr = np.array(aug_img, dtype=np.float32)
-                    images.append(arr)
-                    labels.append(label)
+def compile_model(model, learning_rate=1e-3):
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
 
-            print(f"  Loaded: {f.name}")
-        except Exception as e:
-            print(f"  SKIP: {f.name} ({e})")
 
-    return images, labels
+class EpochStats(keras.callbacks.Callback):
+    """Record per-epoch wall time, training samples/sec and peak memory in the profiler."""
+
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        # Validation runs at the end of each epoch; stop the training clock there
+        if self.train_seconds is None:
+            self.train_seconds = time.perf_counter() - self.epoch_start
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.epoch_start
+        train_seconds = self.train_seconds if self.train_seconds is not None else seconds
+        rate = self.samples_per_epoch / train_seconds if train_seconds > 0 else 0.0
+        rss, _ = peak_rss_mb()
+        _profiler.add_epoch(
+            epoch=epoch + 1,
+            seconds=round(seconds, 3),
+            train_seconds=round(train_seconds, 3),
+            samples=self.samples_per_epoch,
+            samples_per_sec=round(rate, 1),
+            peak_rss_mb=rss,
+            **{k: round(float(v), 5) for k, v in (logs or {}).items()},
+        )
+        print(f"  epoch {epoch + 1}: {rate:.1f} samples/sec, {seconds:.1f}s"
+              + (f", peak memory {rss:.0f} MB" if rss is not None else ""))
+
+
+def benchmark_input(ds):
+    """Drain one epoch of a dataset without the model and return samples/sec.
+
+    Covers decoding, augmentation, preprocess_input and batching; if this
+    is not much faster than training throughput, the run is input-bound.
+    """
+    samples = 0
+    start = time.perf_counter()
+    for images, _ in ds:
+        samples += int(images.shape[0])
+    seconds = time.perf_counter() - start
+    return samples / seconds if seconds > 0 else 0.0
 
 
 def main():
+    global _decoded
+
+    parser = argparse.ArgumentParser(description="Train the Pro AI vs Anti AI classifier")
+    parser.add_argument('--feature-cache', action='store_true',
+                        help="Compute frozen MobileNetV2 features once per (image, augmentation), "
+                             "cache them on disk and train only the head")
+    parser.add_argument('--cache-dir', default=str(BASE_DIR / '.feature_cache'),
+                        help="Where --feature-cache keeps its features")
+    parser.add_argument('--no-decode-cache', action='store_true',
+                        help="Don't pre-decode source images into the memory-mapped cache")
+    parser.add_argument('--decode-cache-dir', default=str(BASE_DIR / '.decode_cache'),
+                        help="Where decoded, resized source images are cached")
+    parser.add_argument('--decode-workers', type=int, default=None,
+                        help="Processes used to decode images (default: all cores)")
+    parser.add_argument('--quantize', choices=['none', 'float16', 'uint8'], default='none',
+                        help="Weight quantization for the TF.js export")
+    parser.add_argument('--shard-size-mb', type=float, default=4,
+                        help="Max size of each TF.js weight shard file")
+    parser.add_argument('--graph-model', action='store_true',
+                        help="Export a pruned tfjs_graph_model instead of a layers model")
+    parser.add_argument('--export-report', action='store_true',
+                        help="Compare size and validation accuracy of every export variant")
+    parser.add_argument('--export-only', action='store_true',
+                        help="Skip training and re-export the existing model.h5")
+    parser.add_argument('--summary', default=str(BASE_DIR / 'train_summary.json'),
+                        help="Where to write the machine-readable run profile")
+    parser.add_argument('--profile-dir', default=None,
+                        help="Write a TensorBoard profiler trace of some training batches here")
+    parser.add_argument('--profile-batches', default='10,20',
+                        help="First,last batch traced with --profile-dir")
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="Time one pass of the input pipeline alone before training")
+    args = parser.parse_args()
+    _profiler.info.update(args=vars(args), mode='feature-cache' if args.feature_cache else 'stream')
+
     pro_dir = BASE_DIR / "pro ai"
     anti_dir = BASE_DIR / "anti ai"
 
-    print("Loading Pro AI images...")
-    pro_imgs, pro_labels = load_images_from_folder(pro_dir, 1.0)  # 1 = pro AI
-    print(f"  → {len(pro_imgs)} images (with augmentation)\n")
+    pro_items = list_images(pro_dir, 1.0)  # 1 = pro AI
+    anti_items = list_images(anti_dir, 0.0)  # 0 = anti AI
+    print(f"Found {len(pro_items)} Pro AI and {len(anti_items)} Anti AI images")
 
-    print("Loading Anti AI images...")
-    anti_imgs, anti_labels = load_images_from_folder(anti_dir, 0.0)  # 0 = anti AI
-    print(f"  → {len(anti_imgs)} images (with augmentation)\n")
+    if not args.no_decode_cache:
+        with _profiler.phase('decode_cache'):
+            _decoded = build_cache([p for p, _ in pro_items + anti_items], args.decode_cache_dir,
+                                   IMG_SIZE, args.decode_workers)
+        pro_items = [item for item in pro_items if item[0] in _decoded]
+        anti_items = [item for item in anti_items if item[0] in _decoded]
 
-    X = np.array(pro_imgs + anti_imgs)
-    y = np.array(pro_labels + anti_labels)
+    train_items, val_items = split_items(pro_items + anti_items, VAL_FRACTION)
+    _profiler.info.update(train_images=len(train_items), val_images=len(val_items))
 
-    # Shuffle
-    indices = np.random.permutation(len(X))
-    X, y = X[indices], y[indices]
+    if args.export_only:
+        # No fixed split is saved with model.h5, so the report's validation
+        # images are a fresh random hold-out and may overlap its training set.
+        try:
+            with _profiler.phase('export'):
+                export(str(BASE_DIR / "model.h5"), val_items, args)
+        finally:
+            _profiler.report(args.summary)
+        return
+
+    print(f"Train: {len(train_items)} images x {1 + AUGMENT_FACTOR} per epoch, "
+          f"validation: {len(val_items)} images\n")
+    if not val_items:
+        print("Note: too few images to hold any out; training without validation\n")
+
+    # Build model (no augmentation layers - augmentation done in the input pipeline)
+    with _profiler.phase('build_model'):
+        base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(IMG_SIZE, IMG_SIZE, 3))
+        base_model.trainable = False
+
+        head = build_head()
+        model = build_model(base_model, head)
+        compile_model(model)
 
-    # Preprocess for MobileNetV2 (scales to [-1, 1])
-    X = preprocess_input(X)
+    model.summary()
+
+    callbacks = []
+    if args.profile_dir:
+        first, last = (int(b) for b in args.profile_batches.split(','))
+        callbacks.append(keras.callbacks.TensorBoard(log_dir=args.profile_dir, profile_batch=(first, last)))
+        print(f"Profiler trace of batches {first}-{last} will be written to {args.profile_dir}")
+
+    if args.feature_cache:
+        # The backbone is frozen, so train the (shared) head layers on cached
+        # features; `model` picks up the trained weights for export.
+        with _profiler.phase('features'):
+            X_train, y_train = cached_features(train_items, range(1 + AUGMENT_FACTOR), base_model, args.cache_dir)
+            X_val, y_val = cached_features(val_items, [0], base_model, args.cache_dir)
+        _profiler.info['feature_pipeline'] = _profiler.summary()['pipeline']
+        _profiler.take_counters()
+
+        head_model = build_head_model(head)
+        compile_model(head_model)
+
+        if args.benchmark_input:
+            print("Note: --benchmark-input has nothing to measure with --feature-cache")
+
+        print("\nTraining head on cached features...")
+        with _profiler.phase('train'):
+            history = head_model.fit(
+                X_train, y_train,
+                validation_data=(X_val, y_val) if len(X_val) else None,
+                epochs=EPOCHS,
+                batch_size=BATCH_SIZE,
+                shuffle=True,
+                callbacks=callbacks + [EpochStats(len(X_train))],
+                verbose=1
+            )
+    else:
+        train_ds = make_dataset(train_items, AUGMENT_FACTOR, training=True)
+        val_ds = make_dataset(val_items) if val_items else None
+
+        if args.benchmark_input:
+            print("\nTiming one pass of the input pipeline...")
+            with _profiler.phase('input_benchmark'):
+                rate = benchmark_input(train_ds)
+            print(f"  input pipeline alone: {rate:.1f} samples/sec")
+            _profiler.info['input_benchmark'] = {
+                'samples_per_sec': round(rate, 1),
+                'pipeline': _profiler.summary()['pipeline'],
+            }
+            _profiler.take_counters()
+
+        # Train
+        print("\nTraining...")
+        with _profiler.phase('train'):
+            history = model.fit(
+                train_ds,
+                validation_data=val_ds,
+                epochs=EPOCHS,
+                callbacks=callbacks + [EpochStats(len(train_items) * (1 + AUGMENT_FACTOR))],
+                verbose=1
+            )
+
+    if 'val_accuracy' in history.history:
+        val_acc = max(history.history['val_accuracy'])
+        print(f"\nBest validation accuracy: {val_acc:.2%}")
+        _profiler.info['best_val_accuracy'] = round(float(val_acc), 5)
 
-    print(f"Total dataset: {len(X)} images ({int(y.sum())} pro, {len(y) - int(y.sum())} anti)\n")
+    # Save as H5 format for tfjs conversion
+    h5_path = str(BASE_DIR / "model.h5")
+    with _profiler.phase('save'):
+        model.save(h5_path)
+    print(f"Saved H5 model to {h5_path}")
 
-    # Build model (no augmentation layers - augmentation done in preprocessing)
-    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(IMG_SIZE, IMG_SIZE, 3))
-    base_model.trainable = False
+    # Write the profile even if the conversion fails
+    try:
+        with _profiler.phase('export'):
+            export(h5_path, val_items, args)
+    finally:
+        _profiler.report(args.summary)
 
-    inputs = keras.Input(shape=(IMG_SIZE, IMG_SIZE, 3))
-    x = base_model(inputs, training=False)
-    x = layers.GlobalAveragePooling2D()(x)
-    x = layers.Dense(128, activation='relu')(x)
-    x = layers.Dropout(0.5)(x)
-    outputs = layers.Dense(1, activation='sigmoid')(x)
 
-    model = keras.Model(inputs, outputs)
-    model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=1e-3),
-        loss='binary_crossentropy',
-        metrics=['accuracy']
-    )
+def export(h5_path, val_items, args):
+    """Export model.h5 to tfjs_model/ (and optionally report on every variant)."""
+    if args.export_report:
+        export_report(h5_path, val_items, args.shard_size_mb)
 
-    model.summary()
+    # Convert to TensorFlow.js using command-line converter
+    tfjs_path = BASE_DIR / "tfjs_model"
+    if export_tfjs(h5_path, tfjs_path, args.quantize, args.shard_size_mb, args.graph_model):
+        print(f"Exported TF.js model to {tfjs_path}/")
 
-    # Train
-    print("\nTraining...")
-    history = model.fit(
-        X, y,
-        epochs=EPOCHS,
-        batch_size=BATCH_SIZE,
-        validation_split=0.2,
-        verbose=1
-    )
+    # List output files
+    for f in sorted(tfjs_path.iterdir()):
+        print(f"  {f.name} ({f.stat().st_size / 1024:.1f} KB)")
 
-    val_acc = max(history.history.get('val_accuracy', [0]))
-    print(f"\nBest validation accuracy: {val_acc:.2%}")
 
-    # Save as H5 format for tfjs conversion
-    h5_path = str(BASE_DIR / "model.h5")
-    model.save(h5_path)
-    print(f"Saved H5 model to {h5_path}")
+def export_tfjs(h5_path, out_dir, quantize='none', shard_size_mb=4, graph_model=False):
+    """Convert a Keras .h5 model with tensorflowjs_converter. Returns True on success.
 
-    # Convert to TensorFlow.js using command-line converter
-    tfjs_path = str(BASE_DIR / "tfjs_model")
-    import subprocess, shutil
-    if Path(tfjs_path).exists():
-        shutil.rmtree(tfjs_path)
-    result = subprocess.run([
+    quantize is 'none', 'float16' or 'uint8' (weights only; they are
+    dequantized when the browser loads them). graph_model emits a
+    tfjs_graph_model, which runs Grappler over the inference graph
+    (constant folding, pruning of training-only ops such as Dropout).
+    """
+    out_dir = Path(out_dir)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    cmd = [
         "tensorflowjs_converter",
         "--input_format=keras",
-        "--output_format=tfjs_layers_model",
-        h5_path,
-        tfjs_path
-    ], capture_output=True, text=True)
+        f"--output_format={'tfjs_graph_model' if graph_model else 'tfjs_layers_model'}",
+        f"--weight_shard_size_bytes={int(shard_size_mb * 1024 * 1024)}",
+    ]
+    if quantize != 'none':
+        cmd.append(f"--quantize_{quantize}")
+    cmd += [str(h5_path), str(out_dir)]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
         print(f"Conversion error: {result.stderr}")
-    else:
-        print(f"Exported TF.js model to {tfjs_path}/")
+        return False
+    return True
+
+
+def tfjs_accuracy(model_dir, val_ds):
+    """Validation accuracy of a TF.js layers model, loaded back with its
+    (dequantized) weights exactly as the browser would see them."""
+    from tensorflowjs.converters import load_keras_model
+
+    model = load_keras_model(str(Path(model_dir) / "model.json"))
+    compile_model(model)
+    return model.evaluate(val_ds, verbose=0)[1]
+
+
+def export_report(h5_path, val_items, shard_size_mb):
+    """Export every quantization / format variant to a temp dir and compare them."""
+    val_ds = make_dataset(val_items) if val_items else None
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for graph_model in (False, True):
+            for quantize in ('none', 'float16', 'uint8'):
+                name = f"{'graph' if graph_model else 'layers'}/{'float32' if quantize == 'none' else quantize}"
+                out_dir = Path(tmp) / name.replace('/', '_')
+                if not export_tfjs(h5_path, out_dir, quantize, shard_size_mb, graph_model):
+                    continue
+                files = sorted(out_dir.iterdir())
+                weight_bytes = sum(f.stat().st_size for f in files if f.suffix == '.bin')
+                load_bytes = sum(f.stat().st_size for f in files)
+                # Graph models can't be loaded back into Keras; their weights
+                # match the layers variant with the same quantization.
+                acc = None if graph_model or val_ds is None else tfjs_accuracy(out_dir, val_ds)
+                rows.append((name, len(files) - 1, weight_bytes, load_bytes, acc))
+
+    if not rows:
+        return
+    base_bytes = next((load for name, _, _, load, _ in rows if name == 'layers/float32'), None)
+    accs = {name.split('/')[1]: acc for name, _, _, _, acc in rows if acc is not None}
+    base_acc = accs.get('float32')
+
+    # Sizes are relative to the float32 layers model; without it, that column is left out
+    vs_header = f"{'vs f32':>8}" if base_bytes else ""
+    print(f"\nTF.js export report (validation: {len(val_items)} images)")
+    print(f"  {'variant':<16}{'shards':>7}{'weights':>12}{'load bytes':>13}{vs_header}{'val acc':>9}{'Δ acc':>8}")
+    for name, shards, weight_bytes, load_bytes, acc in rows:
+        acc = accs.get(name.split('/')[1]) if acc is None else acc
+        acc_s = f"{acc:.2%}" if acc is not None else "-"
+        delta_s = f"{(acc - base_acc) * 100:+.1f}pp" if acc is not None and base_acc is not None else "-"
+        vs_s = f"{load_bytes / base_bytes:>8.0%}" if base_bytes else ""
+        print(f"  {name:<16}{shards:>7}{weight_bytes / 1024:>10.0f}KB{load_bytes / 1024:>11.0f}KB"
+              f"{vs_s}{acc_s:>9}{delta_s:>8}")
+    print()
 
-    # List output files
-    for f in sorted(Path(tfjs_path).iterdir()):
-        print(f"  {f.name} ({f.stat().st_size / 1024:.1f} KB)")
 
 if __name__ == "__main__":
     main()
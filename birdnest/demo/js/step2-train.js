@@ -4,6 +4,7 @@
 
 (function () {
   let mobilenetModel = null;  // The @tensorflow-models/mobilenet instance
+  let embeddingPack = null;   // Precomputed embeddings from scripts/embed_dataset.py
   let trainedModel = null;
   let trainingLogs = { loss: [], val_loss: [], acc: [], val_acc: [] };
 
@@ -71,8 +72,99 @@
     return mobilenetModel.infer(imgElement, true);
   }
 
+  /* ---- Precomputed Embedding Pack ---- */
+  // Written by scripts/embed_dataset.py: manifest.json + embeddings.bin
+  // (N x dim float16). Training on it skips the per-image MobileNet pass.
+  function float16ToFloat32(halves) {
+    const out = new Float32Array(halves.length);
+    for (let i = 0; i < halves.length; i++) {
+      const h = halves[i];
+      const sign = h & 0x8000 ? -1 : 1;
+      const exp = (h >> 10) & 0x1f;
+      const frac = h & 0x03ff;
+      if (exp === 0) out[i] = sign * Math.pow(2, -14) * (frac / 1024);
+      else if (exp === 0x1f) out[i] = frac ? NaN : sign * Infinity;
+      else out[i] = sign * Math.pow(2, exp - 15) * (1 + frac / 1024);
+    }
+    return out;
+  }
+
+  async function loadEmbeddingPack(files) {
+    const manifestFile = files.find(f => f.name.endsWith('.json'));
+    const binFile = files.find(f => f.name.endsWith('.bin'));
+    if (!manifestFile || !binFile) {
+      throw new Error('select both manifest.json and embeddings.bin');
+    }
+
+    const manifest = JSON.parse(await manifestFile.text());
+    const halves = new Uint16Array(await binFile.arrayBuffer());
+    if (manifest.dtype !== 'float16' || halves.length !== manifest.count * manifest.dim) {
+      throw new Error('manifest does not match embeddings.bin');
+    }
+
+    return {
+      features: float16ToFloat32(halves),
+      labels: manifest.items.map(item => item.label),
+      dim: manifest.dim,
+      count: manifest.count
+    };
+  }
+
+  const btnLoadPack = document.getElementById('btn-load-pack');
+  const packFileInput = document.getElementById('pack-file-input');
+
+  btnLoadPack.addEventListener('click', () => packFileInput.click());
+
+  packFileInput.addEventListener('change', async (e) => {
+    const dot = document.getElementById('pack-dot');
+    const detail = document.getElementById('pack-detail');
+    try {
+      embeddingPack = await loadEmbeddingPack(Array.from(e.target.files));
+      dot.className = 'model-load-dot ready';
+      detail.textContent = `${embeddingPack.count} images — training will use these`;
+      // Step 3 still needs MobileNet for new photos, so wait for it too
+      btnTrain.disabled = !mobilenetModel;
+    } catch (err) {
+      embeddingPack = null;
+      dot.className = 'model-load-dot error';
+      detail.textContent = 'failed — ' + err.message;
+      console.error('Embedding pack load error:', err);
+    }
+    packFileInput.value = '';
+  });
+
+  function buildDatasetFromPack(pack) {
+    const { features, labels, dim, count } = pack;
+    const order = Array.from({ length: count }, (_, i) => i);
+
+    // Shuffle
+    for (let i = order.length - 1; i > 0; i--) {
+      const j = Math.floor(Math.random() * (i + 1));
+      [order[i], order[j]] = [order[j], order[i]];
+    }
+
+    const shuffled = new Float32Array(count * dim);
+    order.forEach((src, dst) => {
+      shuffled.set(features.subarray(src * dim, (src + 1) * dim), dst * dim);
+    });
+
+    const xs = tf.tensor2d(shuffled, [count, dim]);
+    const ys = tf.tensor1d(order.map(i => labels[i]), 'int32');
+    return { xs, ys, total: count };
+  }
+
   /* ---- Build Dataset Tensors ---- */
   async function buildDataset(statusFn) {
+    if (embeddingPack) {
+      const nests = embeddingPack.labels.filter(label => label === 1).length;
+      if (nests < 2 || embeddingPack.count - nests < 2) {
+        alert('Need at least 2 images per category to train.');
+        return null;
+      }
+      statusFn(`Using ${embeddingPack.count} precomputed embeddings`);
+      return buildDatasetFromPack(embeddingPack);
+    }
+
     const birdnestImages = await App.getImagesByCategory('birdnest');
     const notBirdnestImages = await App.getImagesByCategory('not_birdnest');
 
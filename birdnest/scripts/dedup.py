@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+dedup.py — Perceptual-hash duplicate detection for the birdnest dataset.
+
+Each image gets a 64-bit difference hash (dHash): the image is shrunk to
+9x8 greyscale and each bit records whether a pixel is brighter than its
+right-hand neighbour. Resized copies, recompressions and most reposts of
+the same photo land within a few bits of each other. Images are hashed
+upright (turned by their EXIF orientation, as ingest.py saves them), so a
+photo hashes the same whether it was stored as downloaded or re-encoded.
+
+Hashes are kept in a `.phash_index.json` file inside the output folder and
+loaded into a BK-tree, so "is there anything within N bits of this hash?"
+only visits a small part of the index. The scrapers call DedupIndex.claim()
+on every download and drop the image if it matches something already in
+the folder (whichever script saved it) or being saved right now; once the
+file is written they add() it, or release() the claim if that failed.
+
+Usage:
+    python dedup.py ../dataset/birdnest              # build/refresh the index, report duplicates
+    python dedup.py ../dataset/birdnest --delete     # also delete the duplicates
+"""
+
+import argparse
+import io
+import json
+import threading
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+INDEX_FILENAME = ".phash_index.json"
+DEFAULT_DISTANCE = 6
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a PIL image."""
+    small = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_bytes(data):
+    """dHash of encoded image bytes, or None if they don't decode."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return dhash(ImageOps.exif_transpose(img))
+    except Exception:
+        return None
+
+
+def hash_file(path):
+    try:
+        with Image.open(path) as img:
+            return dhash(ImageOps.exif_transpose(img))
+    except Exception:
+        return None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    Nodes are [hash, name, {distance: child}]. The triangle inequality lets
+    a radius search skip every subtree whose edge distance is outside
+    [d - radius, d + radius].
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, name):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, name, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, name, {}]
+                return
+            node = child
+
+    def find(self, value, radius):
+        """Return (distance, name) of the closest entry within `radius`, or None."""
+        if self.root is None:
+            return None
+        best = None
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius and (best is None or d < best[0]):
+                best = (d, node[1])
+                if d == 0:
+                    break
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return best
+
+
+class DedupIndex:
+    """Persistent, thread-safe perceptual-hash index for one dataset folder."""
+
+    def __init__(self, folder, distance=DEFAULT_DISTANCE):
+        self.folder = Path(folder)
+        self.path = self.folder / INDEX_FILENAME
+        self.distance = distance
+        self.entries = {}
+        self.tree = BKTree()
+        self.pending = []  # hashes claimed by images still being written
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, folder, distance=DEFAULT_DISTANCE):
+        """Load the folder's index and bring it in line with the files on disk."""
+        index = cls(folder, distance)
+        stored = {}
+        if index.path.exists():
+            with open(index.path) as f:
+                stored = json.load(f).get("hashes", {})
+
+        for path in sorted(index.folder.iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            value = int(stored[path.name], 16) if path.name in stored else hash_file(path)
+            if value is not None:
+                index._add(value, path.name)
+        return index
+
+    def _add(self, value, name):
+        self.entries[name] = value
+        self.tree.add(value, name)
+
+    def claim(self, value):
+        """Reserve `value` for an image about to be written, unless it
+        duplicates one already in the index or claimed by another download.
+
+        Returns the name of the near-duplicate (or "(being saved)"), or None
+        if the image is new; then call add() once it is written, or release().
+        """
+        with self.lock:
+            match = self.tree.find(value, self.distance)
+            if match is not None:
+                return match[1]
+            if any(hamming(value, other) <= self.distance for other in self.pending):
+                return "(being saved)"
+            self.pending.append(value)
+            return None
+
+    def add(self, value, name):
+        """Record a claimed image once it has been written as `name`."""
+        with self.lock:
+            self.pending.remove(value)
+            self._add(value, name)
+
+    def release(self, value):
+        """Drop the claim of an image that wasn't written after all."""
+        with self.lock:
+            self.pending.remove(value)
+
+    def check_and_add(self, value, name):
+        """Record `name`, already on disk, unless it duplicates an existing image.
+
+        Returns the name of the existing near-duplicate, or None if the
+        image is new (and has now been added).
+        """
+        match = self.claim(value)
+        if match is None:
+            self.add(value, name)
+        return match
+
+    def save(self):
+        with self.lock:
+            data = {
+                "algorithm": "dhash64",
+                "hashes": {name: f"{value:016x}" for name, value in sorted(self.entries.items())},
+            }
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=0)
+        tmp.replace(self.path)
+
+
+def add_dedup_args(parser):
+    """Shared --no-dedup / --dedup-distance flags for the scraper CLIs."""
+    parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate images")
+    parser.add_argument(
+        "--dedup-distance",
+        type=int,
+        default=DEFAULT_DISTANCE,
+        help=f"Max Hamming distance (of 64 bits) counted as a duplicate (default {DEFAULT_DISTANCE})",
+    )
+
+
+def index_from_args(args, output_dir):
+    if args.no_dedup:
+        return None
+    return DedupIndex.open(output_dir, args.dedup_distance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images in a dataset folder")
+    parser.add_argument("folder", help="Dataset folder, e.g. ../dataset/birdnest")
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE, help="Max Hamming distance")
+    parser.add_argument("--delete", action="store_true", help="Delete duplicates (keeps the first by name)")
+    args = parser.parse_args()
+
+    folder = Path(args.folder)
+    index = DedupIndex(folder, args.distance)
+    duplicates = 0
+    for path in sorted(folder.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        value = hash_file(path)
+        if value is None:
+            print(f"  Unreadable: {path.name}")
+            continue
+        match = index.check_and_add(value, path.name)
+        if match is not None:
+            duplicates += 1
+            print(f"  {path.name} duplicates {match}")
+            if args.delete:
+                path.unlink()
+
+    index.save()
+    action = "deleted" if args.delete else "found"
+    print(f"{len(index.entries)} unique images, {duplicates} duplicates {action}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+downloader.py — Shared download stage for the birdnest scraping scripts.
+
+One pooled requests.Session (keep-alive, retries) is shared by a bounded
+pool of worker threads. Every request — API pages and image downloads —
+goes through a per-host token bucket, so each site sees a steady request
+rate instead of bursts followed by fixed sleeps.
+
+Usage from a scraper:
+
+    dl = Downloader(workers=8, rate=5)
+    page = dl.get_json(api_url, params=...)
+    dl.download_all(image_url_iterator, output_dir, count)
+
+Image URLs are consumed lazily, so a paginated generator only fetches as
+many result pages as it takes to reach `count` successful downloads.
+If a DedupIndex (dedup.py) is passed, each image is hashed as it arrives
+and near-duplicates of anything already in the folder are dropped before
+they are written. With an Ingest (ingest.py), images are decoded as they
+stream in, then turned upright, downsized and re-encoded, and the image
+that was encoded is the one hashed, as dedup.py hashes the saved file.
+
+Everything is plain HTTP against whatever URLs it is given, so it can be
+pointed at a local http.server stand-in for testing.
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from dedup import dhash, hash_bytes
+from ingest import InvalidImage
+
+HEADERS = {"User-Agent": "BirdnestClassifier/1.0 (educational workshop)"}
+TIMEOUT = 15
+
+CONTENT_TYPE_EXTENSIONS = {
+    "png": ".png",
+    "gif": ".gif",
+    "webp": ".webp",
+}
+
+
+def next_free_index(output_dir):
+    """First numeric file index after those already in output_dir, so runs
+    from different sources add to the folder instead of overwriting it."""
+    indices = [int(m.group(1)) for p in Path(output_dir).iterdir() if (m := re.match(r"(\d+)\.", p.name))]
+    return max(indices, default=-1) + 1
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, up to `burst` saved."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def make_session(pool_size):
+    """Session with a keep-alive pool sized for `pool_size` threads and retries on 429/5xx."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class Downloader:
+    """Concurrent, rate-limited image downloader."""
+
+    def __init__(self, workers=8, rate=5.0, burst=None, session=None, dedup=None, ingest=None):
+        self.workers = max(1, workers)
+        self.dedup = dedup
+        self.ingest = ingest
+        self.duplicates = 0
+        self.rate = rate
+        self.burst = burst
+        self.session = session or make_session(self.workers)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._next_index = 0
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def get(self, url, **kwargs):
+        """Rate-limited GET through the shared session."""
+        self._bucket(url).acquire()
+        kwargs.setdefault("timeout", TIMEOUT)
+        resp = self.session.get(url, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    def get_json(self, url, params=None):
+        return self.get(url, params=params).json()
+
+    def _claim_index(self):
+        with self._index_lock:
+            index = self._next_index
+            self._next_index += 1
+            return index
+
+    def download_image(self, url, output_dir):
+        """Download a single image and save it. Returns the saved path or None."""
+        value = None
+        try:
+            with self.get(url, stream=True) as resp:
+                if self.ingest is not None:
+                    img = self.ingest.decode_stream(resp.iter_content(65536))
+                    data, ext, img = self.ingest.encode(img)
+                    if self.dedup is not None:
+                        value = dhash(img)
+                else:
+                    content_type = resp.headers.get("Content-Type", "")
+                    ext = ".jpg"
+                    for key, suffix in CONTENT_TYPE_EXTENSIONS.items():
+                        if key in content_type:
+                            ext = suffix
+                            break
+                    data = b"".join(resp.iter_content(65536))
+                    if self.dedup is not None:
+                        value = hash_bytes(data)
+        except InvalidImage as e:
+            print(f"  Skipping {url}: {e}")
+            return None
+        except Exception as e:
+            print(f"  Failed to download {url}: {e}")
+            return None
+
+        if self.dedup is not None:
+            if value is None:
+                print(f"  Not a readable image: {url}")
+                return None
+            if self.dedup.claim(value) is not None:
+                with self._index_lock:
+                    self.duplicates += 1
+                return None
+
+        # Only kept images take a file number, so duplicates leave no gaps
+        index = self._claim_index()
+        filepath = Path(output_dir) / f"{index:04d}{ext}"
+        try:
+            with open(filepath, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"  Failed to save {url}: {e}")
+            filepath.unlink(missing_ok=True)
+            if self.dedup is not None:
+                self.dedup.release(value)
+            return None
+        if self.dedup is not None:
+            self.dedup.add(value, filepath.name)
+        return filepath
+
+    def download_all(self, urls, output_dir, count):
+        """Download from the `urls` iterable until `count` images are saved.
+
+        At most `workers` downloads are in flight at once; the iterable is
+        only advanced when a worker frees up.
+        """
+        self._next_index = next_free_index(output_dir)
+        urls = iter(urls)
+        saved = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = set()
+            exhausted = False
+            while True:
+                while not exhausted and len(in_flight) < self.workers and len(saved) + len(in_flight) < count:
+                    url = next(urls, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    in_flight.add(pool.submit(self.download_image, url, output_dir))
+
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = future.result()
+                    if path is not None:
+                        saved.append(path)
+                        if len(saved) % 25 == 0:
+                            print(f"  ... {len(saved)}/{count}")
+
+        if self.dedup is not None:
+            self.dedup.save()
+            if self.duplicates:
+                print(f"  Skipped {self.duplicates} near-duplicate images")
+        return saved
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+embed_dataset.py — Precompute MobileNet v2 embeddings for the birdnest demo.
+
+Step 2 of the demo runs MobileNet over every dataset image in the browser
+before it can train the head, which takes minutes on workshop laptops.
+This script does that work once, ahead of time, and writes an embedding
+pack the demo can load instead ("Load Embedding Pack" in step 2):
+
+    <output-dir>/embeddings.bin   N x 1280 float16, little-endian, row-major
+    <output-dir>/manifest.json    model info + one entry per row:
+                                  {"file", "category", "label", "sha256"}
+
+Images are resized straight to 224x224 and scaled to [-1, 1], the same
+preprocessing @tensorflow-models/mobilenet applies, and embedded with
+MobileNet v2 (alpha 1.0, ImageNet weights, global average pooling) — the
+same 1280-d vector mobilenet.infer(img, true) returns.
+
+Each row is keyed by the SHA-256 of the image file. On re-runs, rows from
+the existing pack are reused for unchanged images and only new or changed
+files go through the network.
+
+Usage (needs TensorFlow: pip install -r requirements-embed.txt):
+    python embed_dataset.py --dataset-dir ../dataset
+    python embed_dataset.py --dataset-dir ../dataset --output-dir ../dataset/embeddings --batch-size 64
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 224
+EMBEDDING_DIM = 1280
+CATEGORIES = {"birdnest": 1, "not_birdnest": 0}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+MODEL_NAME = "mobilenet_v2_1.0_224"
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_pack(output_dir):
+    """Return {sha256: float16 row} from an existing pack, or {} if there is none."""
+    manifest_path = output_dir / "manifest.json"
+    bin_path = output_dir / "embeddings.bin"
+    if not manifest_path.exists() or not bin_path.exists():
+        return {}
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("model") != MODEL_NAME or manifest.get("dim") != EMBEDDING_DIM:
+        return {}
+
+    rows = np.fromfile(bin_path, dtype="<f2").reshape(-1, EMBEDDING_DIM)
+    if len(rows) != len(manifest["items"]):
+        return {}
+    return {item["sha256"]: rows[i] for i, item in enumerate(manifest["items"])}
+
+
+def load_image(path):
+    with Image.open(path) as img:
+        img = img.convert("RGB").resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+        return np.asarray(img, dtype=np.float32)
+
+
+def build_model():
+    import tensorflow as tf
+
+    return tf.keras.applications.MobileNetV2(
+        input_shape=(IMAGE_SIZE, IMAGE_SIZE, 3),
+        alpha=1.0,
+        include_top=False,
+        weights="imagenet",
+        pooling="avg",
+    )
+
+
+def embed(model, paths, batch_size):
+    """Embed image files in batches. Returns {path: float16 row}; unreadable files are skipped."""
+    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+    out = {}
+    for start in range(0, len(paths), batch_size):
+        batch_paths = []
+        batch = []
+        for path in paths[start:start + batch_size]:
+            try:
+                batch.append(load_image(path))
+                batch_paths.append(path)
+            except Exception as e:
+                print(f"  Skipping {path}: {e}")
+        if not batch:
+            continue
+
+        features = model.predict(preprocess_input(np.stack(batch)), verbose=0)
+        for path, row in zip(batch_paths, features):
+            out[path] = row.astype(np.float16)
+        print(f"  Embedded {min(start + batch_size, len(paths))}/{len(paths)}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute MobileNet v2 embeddings for the demo dataset")
+    parser.add_argument("--dataset-dir", required=True, help="Folder containing birdnest/ and not_birdnest/")
+    parser.add_argument("--output-dir", help="Where to write the pack (default: <dataset-dir>/embeddings)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass")
+    args = parser.parse_args()
+
+    dataset = Path(args.dataset_dir)
+    output = Path(args.output_dir) if args.output_dir else dataset / "embeddings"
+    output.mkdir(parents=True, exist_ok=True)
+
+    entries = []
+    for category, label in CATEGORIES.items():
+        folder = dataset / category
+        if not folder.is_dir():
+            print(f"Warning: {folder} not found, skipping")
+            continue
+        for path in sorted(folder.iterdir()):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                entries.append({"path": path, "category": category, "label": label, "sha256": sha256_file(path)})
+
+    if not entries:
+        print("No images found.")
+        return
+
+    cache = load_pack(output)
+    todo = [e["path"] for e in entries if e["sha256"] not in cache]
+    print(f"{len(entries)} images, {len(entries) - len(todo)} cached, {len(todo)} to embed")
+
+    if todo:
+        start = time.time()
+        model = build_model()
+        fresh = embed(model, todo, args.batch_size)
+        print(f"Embedded {len(fresh)} images in {time.time() - start:.1f}s")
+        for e in entries:
+            if e["path"] in fresh:
+                cache[e["sha256"]] = fresh[e["path"]]
+
+    items = []
+    rows = []
+    for e in entries:
+        row = cache.get(e["sha256"])
+        if row is None:
+            continue
+        items.append({
+            "file": e["path"].relative_to(dataset).as_posix(),
+            "category": e["category"],
+            "label": e["label"],
+            "sha256": e["sha256"],
+        })
+        rows.append(row)
+
+    matrix = np.stack(rows).astype("<f2")
+    manifest = {
+        "model": MODEL_NAME,
+        "dim": EMBEDDING_DIM,
+        "dtype": "float16",
+        "count": len(items),
+        "categories": CATEGORIES,
+        "items": items,
+    }
+
+    # Write the bin first and the manifest last, so a crash never leaves a
+    # manifest pointing at rows that don't exist.
+    matrix.tofile(output / "embeddings.bin")
+    with open(output / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    size_kb = (output / "embeddings.bin").stat().st_size / 1024
+    print(f"Wrote {len(items)} embeddings ({size_kb:.0f} KB) to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+ingest.py — Optional download-time resize and re-encode for the birdnest scrapers.
+
+The demo only ever feeds 224px images to MobileNet, so keeping 4000px
+originals just costs disk space and browser decode time. With --max-edge
+set, each image is decoded incrementally as its bytes arrive
+(PIL.ImageFile.Parser), validated, rotated upright from its EXIF
+orientation, shrunk so its longest edge is at most --max-edge and
+re-encoded (WebP by default) without metadata.
+
+Used by downloader.py for scrape_websites.py and by the IngestFileSystem
+storage backend in scrape_google.py.
+"""
+
+import io
+
+from PIL import Image, ImageFile, ImageOps
+
+MIN_EDGE = 32
+MAX_PIXELS = 80_000_000
+FORMATS = {
+    "webp": ("WEBP", ".webp", {"method": 6}),
+    "jpeg": ("JPEG", ".jpg", {"optimize": True, "progressive": True}),
+}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class Ingest:
+    """Decode → validate → downsize → re-encode."""
+
+    def __init__(self, max_edge, fmt="webp", quality=85):
+        self.max_edge = max_edge
+        self.format, self.ext, self.save_kwargs = FORMATS[fmt]
+        self.quality = quality
+
+    def decode_stream(self, chunks):
+        """Decode an image from an iterable of byte chunks as they arrive."""
+        parser = ImageFile.Parser()
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                img = parser.image
+                if img is not None and img.width * img.height > MAX_PIXELS:
+                    raise InvalidImage(f"image too large ({img.width}x{img.height})")
+            img = parser.close()
+        except InvalidImage:
+            raise
+        except Exception as e:
+            raise InvalidImage(str(e)) from e
+        return self.validate(img)
+
+    def decode_bytes(self, data):
+        return self.decode_stream([data])
+
+    def validate(self, img):
+        if min(img.size) < MIN_EDGE:
+            raise InvalidImage(f"image too small ({img.width}x{img.height})")
+        return img
+
+    def encode(self, img):
+        """Return (encoded_bytes, extension, image) for a decoded image, where
+        image is what was encoded: upright, RGB and downsized."""
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            if "A" in img.getbands() or img.mode == "P":
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            else:
+                img = img.convert("RGB")
+
+        img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS, reducing_gap=3.0)
+
+        buf = io.BytesIO()
+        img.save(buf, self.format, quality=self.quality, **self.save_kwargs)
+        return buf.getvalue(), self.ext, img
+
+
+def add_ingest_args(parser):
+    """Shared --max-edge / --format / --quality flags for the scraper CLIs."""
+    parser.add_argument(
+        "--max-edge",
+        type=int,
+        default=None,
+        help="Resize so the longest edge is at most this many pixels and re-encode (off by default)",
+    )
+    parser.add_argument("--format", choices=list(FORMATS), default="webp", help="Re-encode format (with --max-edge)")
+    parser.add_argument("--quality", type=int, default=85, help="Re-encode quality (with --max-edge)")
+
+
+def ingest_from_args(args):
+    if not args.max_edge:
+        return None
+    return Ingest(args.max_edge, args.format, args.quality)
+
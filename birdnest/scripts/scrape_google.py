@@ -12,12 +12,61 @@ Suggested queries for bird nests:
 Suggested queries for non-bird-nests:
     "empty tree branch", "basket weaving", "bowl on table", "tangled rope",
     "haystack", "bush no nest", "tree hollow"
+
+Near-duplicates of images already in --output-dir (from any scraper) are
+rejected as they are downloaded; see dedup.py. Pass --no-dedup to keep them.
+
+--max-edge N shrinks each image to at most N pixels on its longest side and
+re-encodes it (WebP by default) before it is written; see ingest.py.
 """
 
 import argparse
+import os
 from pathlib import Path
 
+from icrawler import ImageDownloader
 from icrawler.builtin import BingImageCrawler
+from icrawler.storage import FileSystem
+
+from dedup import DedupIndex, add_dedup_args, hash_bytes, index_from_args
+from ingest import InvalidImage, add_ingest_args, ingest_from_args
+
+
+class DedupImageDownloader(ImageDownloader):
+    """icrawler downloader that rejects near-duplicates via keep_file()."""
+
+    dedup = None
+
+    def keep_file(self, task, response, **kwargs):
+        if not super().keep_file(task, response, **kwargs):
+            return False
+        if self.dedup is None:
+            return True
+        # Upright, like the file --max-edge writes, so this matches the hash
+        # the index is rebuilt with from disk
+        value = hash_bytes(response.content)
+        if value is None:
+            return False
+        # The file name is only assigned after keep_file(), so the URL stands
+        # in for it here; the index is rebuilt from disk after the crawl.
+        return self.dedup.check_and_add(value, task["file_url"]) is None
+
+
+class IngestFileSystem(FileSystem):
+    """icrawler storage backend that resizes and re-encodes images before writing them."""
+
+    def __init__(self, root_dir, ingest):
+        super().__init__(root_dir)
+        self.ingest = ingest
+
+    def write(self, id, data):
+        try:
+            img = self.ingest.decode_bytes(data)
+            data, ext, _ = self.ingest.encode(img)
+        except InvalidImage as e:
+            print(f"  Skipping {id}: {e}")
+            return
+        super().write(os.path.splitext(id)[0] + ext, data)
 
 
 def main():
@@ -25,18 +74,29 @@ def main():
     parser.add_argument("--query", required=True, help="Search query string")
     parser.add_argument("--count", type=int, default=50, help="Number of images to download")
     parser.add_argument("--output-dir", required=True, help="Output directory for images")
+    add_dedup_args(parser)
+    add_ingest_args(parser)
     args = parser.parse_args()
 
     output = Path(args.output_dir)
     output.mkdir(parents=True, exist_ok=True)
 
+    DedupImageDownloader.dedup = index_from_args(args, output)
+
+    ingest = ingest_from_args(args)
+    storage = IngestFileSystem(str(output), ingest) if ingest else {"root_dir": str(output)}
+
     crawler = BingImageCrawler(
-        storage={"root_dir": str(output)},
+        downloader_cls=DedupImageDownloader,
+        storage=storage,
         log_level="WARNING",
     )
-    crawler.crawl(keyword=args.query, max_num=args.count)
+    crawler.crawl(keyword=args.query, max_num=args.count, file_idx_offset="auto")
+
+    if DedupImageDownloader.dedup is not None:
+        DedupIndex.open(output, args.dedup_distance).save()
 
-    count = len(list(output.glob("*")))
+    count = len([p for p in output.glob("*") if not p.name.startswith(".")])
     print(f"Downloaded {count} images to {output}")
 
 
@@ -11,6 +11,9 @@ Suggested hashtags:
 
 Note: Instagram may require login for larger downloads. Set INSTAGRAM_USER and
 INSTAGRAM_PASS environment variables for authenticated access.
+
+Near-duplicates of images already in --output-dir (from any scraper) are
+skipped; see dedup.py. Pass --no-dedup to keep them.
 """
 
 import argparse
@@ -20,16 +23,22 @@ from pathlib import Path
 
 import instaloader
 
+from dedup import add_dedup_args, hash_file, index_from_args
+from downloader import next_free_index
+
 
 def main():
     parser = argparse.ArgumentParser(description="Download images from Instagram hashtags")
     parser.add_argument("--hashtag", required=True, help="Instagram hashtag (without #)")
     parser.add_argument("--count", type=int, default=30, help="Max images to download")
     parser.add_argument("--output-dir", required=True, help="Output directory for images")
+    add_dedup_args(parser)
     args = parser.parse_args()
 
     output = Path(args.output_dir)
     output.mkdir(parents=True, exist_ok=True)
+    dedup = index_from_args(args, output)
+    next_index = next_free_index(output)
 
     L = instaloader.Instaloader(
         download_videos=False,
@@ -55,6 +64,8 @@ def main():
     print(f"Downloading from #{args.hashtag}...")
 
     downloaded = 0
+    duplicates = 0
+    unreadable = 0
     for post in hashtag.get_posts():
         if downloaded >= args.count:
             break
@@ -66,8 +77,24 @@ def main():
             temp_dir = output / "_temp"
             if temp_dir.exists():
                 for img_file in temp_dir.glob("*.jpg"):
-                    dest = output / f"{downloaded:04d}.jpg"
-                    shutil.move(str(img_file), str(dest))
+                    dest = output / f"{next_index:04d}.jpg"
+                    if dedup is not None:
+                        value = hash_file(img_file)
+                        if value is None:
+                            unreadable += 1
+                            break
+                        if dedup.claim(value) is not None:
+                            duplicates += 1
+                            break
+                    try:
+                        shutil.move(str(img_file), str(dest))
+                    except Exception:
+                        if dedup is not None:
+                            dedup.release(value)
+                        raise
+                    if dedup is not None:
+                        dedup.add(value, dest.name)
+                    next_index += 1
                     downloaded += 1
                     break  # One image per post
 
@@ -77,6 +104,12 @@ def main():
         except Exception as e:
             print(f"  Skipping post: {e}")
 
+    if dedup is not None:
+        dedup.save()
+        if duplicates:
+            print(f"Skipped {duplicates} near-duplicate images")
+        if unreadable:
+            print(f"Skipped {unreadable} images that could not be read")
     print(f"Downloaded {downloaded} images to {output}")
 
 
@@ -11,44 +11,34 @@ Usage:
     python scrape_websites.py --source wikimedia --count 30 --output-dir dataset/birdnest
     python scrape_websites.py --source flickr --count 30 --output-dir dataset/birdnest
     python scrape_websites.py --source inaturalist --count 30 --output-dir dataset/birdnest
+    python scrape_websites.py --source wikimedia --count 5000 --workers 16 --rate 10 --output-dir dataset/birdnest
+
+Results are paginated until --count images have been saved. Downloads run
+on --workers threads sharing one keep-alive session, rate-limited per host
+(--rate requests/second). See downloader.py.
+
+Near-duplicates of images already in --output-dir (from any scraper) are
+skipped at download time; see dedup.py. Pass --no-dedup to keep them.
+
+--max-edge N decodes each image as it streams in, shrinks it to at most N
+pixels on its longest side and re-encodes it (WebP by default); see ingest.py.
 """
 
 import argparse
 import os
-import time
 from pathlib import Path
 
-import requests
-
-HEADERS = {"User-Agent": "BirdnestClassifier/1.0 (educational workshop)"}
-
+from dedup import add_dedup_args, index_from_args
+from downloader import Downloader
+from ingest import add_ingest_args, ingest_from_args
 
-def download_image(url, output_dir, index):
-    """Download a single image and save it."""
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=15, stream=True)
-        resp.raise_for_status()
-        content_type = resp.headers.get("Content-Type", "")
-        ext = ".jpg"
-        if "png" in content_type:
-            ext = ".png"
-        elif "gif" in content_type:
-            ext = ".gif"
+WIKIMEDIA_API = "https://commons.wikimedia.org/w/api.php"
+FLICKR_API = "https://www.flickr.com/services/rest/"
+INATURALIST_API = "https://api.inaturalist.org/v1/observations"
 
-        filepath = output_dir / f"{index:04d}{ext}"
-        with open(filepath, "wb") as f:
-            for chunk in resp.iter_content(8192):
-                f.write(chunk)
-        return True
-    except Exception as e:
-        print(f"  Failed to download {url}: {e}")
-        return False
 
-
-def scrape_wikimedia(count, output_dir):
-    """Search Wikimedia Commons for bird nest images."""
-    print("Scraping Wikimedia Commons...")
-    url = "https://commons.wikimedia.org/w/api.php"
+def wikimedia_urls(dl, count):
+    """Yield Wikimedia Commons image URLs, following `continue` across result pages."""
     params = {
         "action": "query",
         "generator": "search",
@@ -61,35 +51,22 @@ def scrape_wikimedia(count, output_dir):
         "format": "json",
     }
 
-    resp = requests.get(url, params=params, headers=HEADERS, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
+    while True:
+        data = dl.get_json(WIKIMEDIA_API, params=params)
+        pages = data.get("query", {}).get("pages", {})
+        for page in sorted(pages.values(), key=lambda p: p.get("index", 0)):
+            info = page.get("imageinfo", [{}])[0]
+            img_url = info.get("thumburl") or info.get("url")
+            if img_url:
+                yield img_url
 
-    pages = data.get("query", {}).get("pages", {})
-    downloaded = 0
-    for page in pages.values():
-        if downloaded >= count:
-            break
-        info = page.get("imageinfo", [{}])[0]
-        img_url = info.get("thumburl") or info.get("url")
-        if img_url:
-            if download_image(img_url, output_dir, downloaded):
-                downloaded += 1
-            time.sleep(0.5)
+        if "continue" not in data:
+            return
+        params = {**params, **data["continue"]}
 
-    print(f"  Downloaded {downloaded} images from Wikimedia Commons")
 
-
-def scrape_flickr(count, output_dir):
-    """Search Flickr for bird nest photos (requires FLICKR_API_KEY)."""
-    api_key = os.environ.get("FLICKR_API_KEY")
-    if not api_key:
-        print("Error: Set FLICKR_API_KEY environment variable.")
-        print("  Get a free key at https://www.flickr.com/services/api/misc.api_keys.html")
-        return
-
-    print("Scraping Flickr...")
-    url = "https://www.flickr.com/services/rest/"
+def flickr_urls(dl, count, api_key):
+    """Yield Flickr photo URLs page by page."""
     params = {
         "method": "flickr.photos.search",
         "api_key": api_key,
@@ -101,52 +78,69 @@ def scrape_flickr(count, output_dir):
         "license": "1,2,3,4,5,6",  # Creative Commons licenses
     }
 
-    resp = requests.get(url, params=params, headers=HEADERS, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
+    page = 1
+    while True:
+        data = dl.get_json(FLICKR_API, params={**params, "page": page})
+        photos = data.get("photos", {})
+        for photo in photos.get("photo", []):
+            yield f"https://live.staticflickr.com/{photo['server']}/{photo['id']}_{photo['secret']}_z.jpg"
 
-    photos = data.get("photos", {}).get("photo", [])
-    downloaded = 0
-    for photo in photos:
-        if downloaded >= count:
-            break
-        img_url = f"https://live.staticflickr.com/{photo['server']}/{photo['id']}_{photo['secret']}_z.jpg"
-        if download_image(img_url, output_dir, downloaded):
-            downloaded += 1
-        time.sleep(0.3)
+        if page >= int(photos.get("pages", 0)):
+            return
+        page += 1
 
-    print(f"  Downloaded {downloaded} images from Flickr")
 
-
-def scrape_inaturalist(count, output_dir):
-    """Download bird nest observations from iNaturalist."""
-    print("Scraping iNaturalist...")
-    url = "https://api.inaturalist.org/v1/observations"
+def inaturalist_urls(dl, count):
+    """Yield iNaturalist observation photo URLs page by page."""
     params = {
         "q": "bird nest",
         "photos": "true",
-        "per_page": min(count, 50),
+        "per_page": min(count, 200),
         "order": "desc",
         "order_by": "votes",
     }
 
-    resp = requests.get(url, params=params, headers=HEADERS, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
+    page = 1
+    while True:
+        data = dl.get_json(INATURALIST_API, params={**params, "page": page})
+        results = data.get("results", [])
+        for obs in results:
+            photos = obs.get("photos", [])
+            if photos:
+                img_url = photos[0].get("url", "").replace("square", "medium")
+                if img_url:
+                    yield img_url
 
-    results = data.get("results", [])
-    downloaded = 0
-    for obs in results:
-        if downloaded >= count:
-            break
-        photos = obs.get("photos", [])
-        if photos:
-            img_url = photos[0].get("url", "").replace("square", "medium")
-            if img_url and download_image(img_url, output_dir, downloaded):
-                downloaded += 1
-            time.sleep(0.3)
+        if not results or page * params["per_page"] >= data.get("total_results", 0):
+            return
+        page += 1
 
-    print(f"  Downloaded {downloaded} images from iNaturalist")
+
+def scrape_wikimedia(dl, count, output_dir):
+    """Search Wikimedia Commons for bird nest images."""
+    print("Scraping Wikimedia Commons...")
+    saved = dl.download_all(wikimedia_urls(dl, count), output_dir, count)
+    print(f"  Downloaded {len(saved)} images from Wikimedia Commons")
+
+
+def scrape_flickr(dl, count, output_dir):
+    """Search Flickr for bird nest photos (requires FLICKR_API_KEY)."""
+    api_key = os.environ.get("FLICKR_API_KEY")
+    if not api_key:
+        print("Error: Set FLICKR_API_KEY environment variable.")
+        print("  Get a free key at https://www.flickr.com/services/api/misc.api_keys.html")
+        return
+
+    print("Scraping Flickr...")
+    saved = dl.download_all(flickr_urls(dl, count, api_key), output_dir, count)
+    print(f"  Downloaded {len(saved)} images from Flickr")
+
+
+def scrape_inaturalist(dl, count, output_dir):
+    """Download bird nest observations from iNaturalist."""
+    print("Scraping iNaturalist...")
+    saved = dl.download_all(inaturalist_urls(dl, count), output_dir, count)
+    print(f"  Downloaded {len(saved)} images from iNaturalist")
 
 
 SOURCES = {
@@ -166,12 +160,22 @@ def main():
     )
     parser.add_argument("--count", type=int, default=30, help="Number of images to download")
     parser.add_argument("--output-dir", required=True, help="Output directory for images")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--rate", type=float, default=5.0, help="Max requests per second per host")
+    add_dedup_args(parser)
+    add_ingest_args(parser)
     args = parser.parse_args()
 
     output = Path(args.output_dir)
     output.mkdir(parents=True, exist_ok=True)
 
-    SOURCES[args.source](args.count, output)
+    dl = Downloader(
+        workers=args.workers,
+        rate=args.rate,
+        dedup=index_from_args(args, output),
+        ingest=ingest_from_args(args),
+    )
+    SOURCES[args.source](dl, args.count, output)
 
 
 if __name__ == "__main__":
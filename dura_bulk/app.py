@@ -5,7 +5,6 @@ import threading
 import tempfile
 import zipfile
 import io
-import re
 from datetime import datetime
 from pathlib import Path
 
@@ -13,8 +12,8 @@ from flask import Flask, render_template, request, jsonify, send_file, send_from
 from flask_cors import CORS
 from PIL import Image
 import instaloader
-from ultralytics import YOLO
-import easyocr
+
+import detector
 
 app = Flask(__name__)
 CORS(app)
@@ -31,36 +30,9 @@ NON_DURA_DIR.mkdir(parents=True, exist_ok=True)
 # In-memory job store
 jobs = {}
 
-# Lazy-loaded models
-_yolo_model = None
-_ocr_reader = None
-
-
-def get_yolo():
-    global _yolo_model
-    if _yolo_model is None:
-        _yolo_model = YOLO("yolov8n.pt")
-    return _yolo_model
-
-
-def get_ocr():
-    global _ocr_reader
-    if _ocr_reader is None:
-        _ocr_reader = easyocr.Reader(["en"], gpu=False)
-    return _ocr_reader
-
-
-def fuzzy_match_dura_bulk(text):
-    """Check if text contains something close to 'dura bulk'."""
-    text = text.lower().strip()
-    # Direct substring check
-    if "dura" in text and "bulk" in text:
-        return True
-    # Check with spaces/punctuation removed
-    cleaned = re.sub(r"[^a-z0-9]", "", text)
-    if "durabulk" in cleaned:
-        return True
-    return False
+# Load models at import time so `gunicorn --preload` shares the weights
+# with every forked worker. Warmup runs per worker (see gunicorn.conf.py).
+detector.load()
 
 
 def run_pipeline(job_id, profile_name, start_date, end_date, max_posts=100):
@@ -134,8 +106,6 @@ def run_pipeline(job_id, profile_name, start_date, end_date, max_posts=100):
 
         # --- Step 2 & 3: Detect boats + OCR ---
         job["step"] = "detecting"
-        model = get_yolo()
-        reader = get_ocr()
 
         dura_files = []
         non_dura_files = []
@@ -149,37 +119,8 @@ def run_pipeline(job_id, profile_name, start_date, end_date, max_posts=100):
             except Exception:
                 continue
 
-            # YOLO detection
-            results = model(img, verbose=False)
-            is_dura = False
-
-            for result in results:
-                for box in result.boxes:
-                    cls_id = int(box.cls[0])
-                    if cls_id != 8:  # 8 = boat in COCO
-                        continue
-
-                    # Crop boat region
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                    crop = img.crop((x1, y1, x2, y2))
-
-                    # OCR on crop
-                    crop_path = str(img_path) + "_crop.jpg"
-                    crop.save(crop_path)
-                    try:
-                        ocr_results = reader.readtext(crop_path)
-                        all_text = " ".join([r[1] for r in ocr_results])
-                        if fuzzy_match_dura_bulk(all_text):
-                            is_dura = True
-                            break
-                    except Exception:
-                        pass
-                    finally:
-                        if os.path.exists(crop_path):
-                            os.remove(crop_path)
-
-                if is_dura:
-                    break
+            # YOLO boat detection + OCR on each boat crop
+            is_dura, _, _ = detector.analyze(img, stop_on_match=True)
 
             # Sort image
             dest_dir = DURA_DIR if is_dura else NON_DURA_DIR
@@ -229,9 +170,6 @@ def run_upload_pipeline(job_id, tmp_dir):
             job["results"] = {"dura_bulk": [], "non_dura_bulk": []}
             return
 
-        model = get_yolo()
-        reader = get_ocr()
-
         dura_files = []
         non_dura_files = []
 
@@ -244,34 +182,8 @@ def run_upload_pipeline(job_id, tmp_dir):
             except Exception:
                 continue
 
-            results = model(img, verbose=False)
-            is_dura = False
-
-            for result in results:
-                for box in result.boxes:
-                    cls_id = int(box.cls[0])
-                    if cls_id != 8:
-                        continue
-
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                    crop = img.crop((x1, y1, x2, y2))
-
-                    crop_path = str(img_path) + "_crop.jpg"
-                    crop.save(crop_path)
-                    try:
-                        ocr_results = reader.readtext(crop_path)
-                        all_text = " ".join([r[1] for r in ocr_results])
-                        if fuzzy_match_dura_bulk(all_text):
-                            is_dura = True
-                            break
-                    except Exception:
-                        pass
-                    finally:
-                        if os.path.exists(crop_path):
-                            os.remove(crop_path)
-
-                if is_dura:
-                    break
+            # YOLO boat detection + OCR on each boat crop
+            is_dura, _, _ = detector.analyze(img, stop_on_match=True)
 
             dest_dir = DURA_DIR if is_dura else NON_DURA_DIR
             dest_name = f"upload_{i:04d}{img_path.suffix}"
@@ -409,4 +321,5 @@ def download_zip(category):
 
 
 if __name__ == "__main__":
+    threading.Thread(target=detector.warmup, daemon=True).start()
     app.run(debug=True, port=5001)
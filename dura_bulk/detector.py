@@ -0,0 +1,190 @@
+"""
+Shared YOLOv8 + EasyOCR detection engine for the Dura Bulk tools.
+
+Both the Flask app (app.py) and the offline script (analyze.py) use this
+module, so the boat → crop → OCR → fuzzy-match loop lives in one place.
+
+Models are loaded once per process by load(). app.py calls it at import
+time, so `gunicorn --preload` loads the weights in the master process and
+forked workers share them copy-on-write. warmup() runs one dummy inference
+through every pooled model so no real request pays for lazy initialisation.
+
+Thread safety: YOLO and EasyOCR objects are not safe to call from several
+threads at once, so each model lives in a small pool (DURA_MODEL_POOL
+instances, default 1). A job only holds a model while it is actually
+running inference: decoding, cropping and sorting happen outside the pool,
+and one job's OCR can overlap another job's YOLO pass.
+"""
+
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+YOLO_WEIGHTS = os.environ.get("DURA_YOLO_WEIGHTS", "yolov8n.pt")
+OCR_LANGS = ["en"]
+POOL_SIZE = max(1, int(os.environ.get("DURA_MODEL_POOL", "1")))
+BOAT_CLASS_ID = 8  # 8 = boat in COCO
+
+_yolo_pool = None
+_ocr_pool = None
+_load_lock = threading.Lock()
+_warm_lock = threading.Lock()
+_warm = threading.Event()
+
+
+class _ModelPool:
+    """Fixed set of model instances handed out one caller at a time."""
+
+    def __init__(self, factory, size):
+        self.size = size
+        self._items = queue.Queue()
+        for _ in range(size):
+            self._items.put(factory())
+
+    @contextmanager
+    def acquire(self):
+        item = self._items.get()
+        try:
+            yield item
+        finally:
+            self._items.put(item)
+
+    @contextmanager
+    def acquire_all(self):
+        """Hold every instance at once (one caller at a time; see warmup)."""
+        items = [self._items.get() for _ in range(self.size)]
+        try:
+            yield items
+        finally:
+            for item in items:
+                self._items.put(item)
+
+
+def _make_yolo():
+    from ultralytics import YOLO
+    return YOLO(YOLO_WEIGHTS)
+
+
+def _make_ocr():
+    import easyocr
+    return easyocr.Reader(OCR_LANGS, gpu=False)
+
+
+def load():
+    """Load the model pools (idempotent, safe to call from any thread)."""
+    global _yolo_pool, _ocr_pool
+    with _load_lock:
+        if _yolo_pool is None:
+            _yolo_pool = _ModelPool(_make_yolo, POOL_SIZE)
+        if _ocr_pool is None:
+            _ocr_pool = _ModelPool(_make_ocr, POOL_SIZE)
+
+
+def warmup():
+    """Run one throwaway inference through every pooled model."""
+    with _warm_lock:
+        if _warm.is_set():
+            return
+        load()
+        dummy = Image.new("RGB", (320, 320), (128, 128, 128))
+        with _yolo_pool.acquire_all() as models:
+            for model in models:
+                model(dummy, verbose=False)
+        with _ocr_pool.acquire_all() as readers:
+            for reader in readers:
+                reader.readtext(_bgr(dummy))
+        _warm.set()
+
+
+def is_warm():
+    return _warm.is_set()
+
+
+def fuzzy_match_dura_bulk(text):
+    """Check if text contains something close to 'dura bulk'."""
+    lower = text.lower().strip()
+    if "dura" in lower and "bulk" in lower:
+        return True
+    cleaned = re.sub(r"[^a-z0-9]", "", lower)
+    return "durabulk" in cleaned
+
+
+def detect_boats(img):
+    """Return boat bounding boxes (x1, y1, x2, y2) found in a PIL image."""
+    load()
+    with _yolo_pool.acquire() as model:
+        results = model(img, verbose=False)
+
+    boxes = []
+    for result in results:
+        for box in result.boxes:
+            if int(box.cls[0]) != BOAT_CLASS_ID:
+                continue
+            boxes.append(tuple(map(int, box.xyxy[0].tolist())))
+    return boxes
+
+
+def _bgr(img):
+    """A PIL image as the BGR array EasyOCR (OpenCV) expects."""
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+
+
+def read_text(img):
+    """OCR a PIL image and return all recognised text joined by spaces."""
+    load()
+    arr = _bgr(img)
+    with _ocr_pool.acquire() as reader:
+        ocr_results = reader.readtext(arr)
+    return " ".join([r[1] for r in ocr_results]).strip()
+
+
+def analyze(img, stop_on_match=False):
+    """Detect boats in a PIL image and OCR each crop.
+
+    Returns (is_dura_bulk, boats_found, ocr_texts). With stop_on_match the
+    remaining boats are skipped as soon as one crop reads "Dura Bulk".
+    """
+    boxes = detect_boats(img)
+    texts = []
+    is_dura = False
+
+    for x1, y1, x2, y2 in boxes:
+        crop = img.crop((x1, y1, x2, y2))
+        try:
+            text = read_text(crop)
+        except Exception:
+            continue
+        if text:
+            texts.append(text)
+        if fuzzy_match_dura_bulk(text):
+            is_dura = True
+            if stop_on_match:
+                break
+
+    return is_dura, len(boxes), texts
+
+
+def analyze_image(img_path):
+    """Run the full pipeline on an image file.
+    Returns (is_dura_bulk, details_string).
+    """
+    try:
+        img = Image.open(img_path).convert("RGB")
+    except Exception as e:
+        return False, f"Could not open image: {e}"
+
+    is_dura, boats_found, texts = analyze(img)
+    combined_text = " | ".join(texts)
+
+    details = f"boats={boats_found}"
+    if combined_text:
+        details += f", ocr_text=\"{combined_text}\""
+
+    return is_dura, details
@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the Dura Bulk detector.
+
+preload_app loads app.py (and with it the YOLO + EasyOCR weights) once in
+the master process; forked workers share those pages copy-on-write. Each
+worker then runs its own warmup inference in the background so the first
+request it serves is not slowed down by lazy initialisation.
+"""
+
+import threading
+
+preload_app = True
+timeout = 300
+
+
+def post_fork(server, worker):
+    import detector
+    threading.Thread(target=detector.warmup, daemon=True).start()
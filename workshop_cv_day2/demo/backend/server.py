@@ -1,13 +1,30 @@
 """
 FastAPI backend for ICE Detection (DeepFace ethnicity analysis).
 
+Image decoding and DeepFace run on a small pool of worker threads
+(INFERENCE_WORKERS, default 2), never on the event loop, so one slow
+RetinaFace call doesn't stall other requests or /health. TensorFlow's
+thread pools belong to the process and are shared by those workers;
+they keep TensorFlow's default size (all cores), so a lone request can
+use the whole machine (TF_NUM_INTRAOP_THREADS changes it). When
+MAX_PENDING requests are already waiting or running, more are answered
+503 straight away instead of queueing. Models are loaded at
+startup (in the background; requests wait for it), so the first
+request doesn't pay for it.
+
 Run:
     cd backend
     pip install -r requirements.txt
     python server.py
 """
 
+import asyncio
 import io
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
 import numpy as np
 from PIL import Image
 from fastapi import FastAPI, File, UploadFile, HTTPException
@@ -15,7 +32,44 @@ from fastapi.middleware.cors import CORSMiddleware
 from deepface import DeepFace
 import uvicorn
 
-app = FastAPI(title="CV Workshop Day 2 — Backend")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 2))
+MAX_PENDING = int(os.environ.get("MAX_PENDING", 8))  # waiting + running; more get a 503
+
+pool = ThreadPoolExecutor(INFERENCE_WORKERS, thread_name_prefix="inference")
+pending = 0              # requests waiting for or running on the pool (event loop only)
+warmed = asyncio.Event()
+models_loaded = False
+
+
+def warm_up():
+    """Load the face detector and race model by analyzing a blank image."""
+    DeepFace.analyze(
+        img_path=np.zeros((224, 224, 3), dtype=np.uint8),
+        actions=["race"],
+        detector_backend="retinaface",
+        enforce_detection=False,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    async def warm():
+        global models_loaded
+        try:
+            await asyncio.get_running_loop().run_in_executor(pool, warm_up)
+            models_loaded = True
+        except Exception:
+            traceback.print_exc()  # requests will load the models themselves
+        finally:
+            warmed.set()
+
+    task = asyncio.create_task(warm())
+    yield
+    task.cancel()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="CV Workshop Day 2 — Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,21 +79,41 @@ app.add_middleware(
 )
 
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+async def run_inference(fn, *args):
+    """Run fn on the inference pool, or answer 503 right away if it's saturated."""
+    global pending
+    if pending >= MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server busy, please try again in a moment",
+                            headers={"Retry-After": "2"})
+    pending += 1
+    try:
+        await warmed.wait()
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        pending -= 1
 
 
-@app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    """Analyze uploaded image for faces and ethnicity predictions."""
+def decode_image(contents):
     try:
-        contents = await file.read()
         img = Image.open(io.BytesIO(contents)).convert("RGB")
-        img_array = np.array(img)
+        return np.array(img)
     except Exception:
         raise HTTPException(status_code=400, detail="Could not read image file")
 
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "ready": warmed.is_set() and models_loaded,
+        "pending": pending,
+        "workers": INFERENCE_WORKERS,
+    }
+
+
+def analyze_faces(contents):
+    img_array = decode_image(contents)
+
     try:
         results = DeepFace.analyze(
             img_path=img_array,
@@ -65,22 +139,18 @@ async def analyze(file: UploadFile = File(...)):
     return {"faces": faces, "count": len(faces)}
 
 
-@app.post("/detect")
-async def detect(file: UploadFile = File(...)):
-    """
-    Detect Nazi symbols in an uploaded image.
-    Replace the placeholder logic below with your own YOLO / object-detection model.
-    Returns: { detections: [{ x, y, w, h, label, confidence }] }
-    """
-    try:
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents)).convert("RGB")
-        img_array = np.array(img)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Could not read image file")
+@app.post("/analyze")
+async def analyze(file: UploadFile = File(...)):
+    """Analyze uploaded image for faces and ethnicity predictions."""
+    contents = await file.read()
+    return await run_inference(analyze_faces, contents)
+
+
+def detect_symbols(contents):
+    img_array = decode_image(contents)
 
     # ——— Placeholder: replace with your trained model ———
-    # Example with ultralytics YOLO:
+    # Example with ultralytics YOLO (load the model once, at module level):
     #   from ultralytics import YOLO
     #   model = YOLO("path/to/nazi_symbol_detector.pt")
     #   results = model(img_array)
@@ -100,6 +170,17 @@ async def detect(file: UploadFile = File(...)):
     return {"detections": detections}
 
 
+@app.post("/detect")
+async def detect(file: UploadFile = File(...)):
+    """
+    Detect Nazi symbols in an uploaded image.
+    Replace the placeholder logic in detect_symbols with your own YOLO / object-detection model.
+    Returns: { detections: [{ x, y, w, h, label, confidence }] }
+    """
+    contents = await file.read()
+    return await run_inference(detect_symbols, contents)
+
+
 if __name__ == "__main__":
     print("Starting backend on http://localhost:8000")
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,58 @@
+"""
+Batches of predictions started together by /api/batch/<model>.
+
+A batch is just the list of what each of its inputs became: a prediction
+id, or the error that kept it from starting. The list is written to a
+JSON file in a directory every gunicorn worker shares, since the batch
+may be polled through a different worker than the one that started it.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from events import VALID_ID
+
+BATCH_PREFIX = "batch-"
+
+
+class BatchStore:
+    def __init__(self, directory, max_age=24 * 3600):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._created = 0
+
+    def create(self, items):
+        """Store a batch's items ({"id"} or {"error"} each) and return its id."""
+        batch_id = BATCH_PREFIX + uuid.uuid4().hex[:24]
+        path = self.dir / f"{batch_id}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(items))
+        os.replace(tmp, path)
+        self._created += 1
+        if self._created % 100 == 0:
+            self.prune()
+        return batch_id
+
+    def get(self, batch_id):
+        """The items of a batch, or None if it's unknown or expired."""
+        if not VALID_ID.match(batch_id):
+            return None
+        try:
+            return json.loads((self.dir / f"{batch_id}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def prune(self):
+        """Delete batches older than max_age."""
+        cutoff = time.time() - self.max_age
+        for path in self.dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
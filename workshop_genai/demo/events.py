@@ -0,0 +1,67 @@
+"""
+Prediction status events delivered by Replicate webhooks.
+
+The webhook request can land on any gunicorn worker, while the browser's
+event stream may be held open by another, so the latest status of each
+prediction is written to a small JSON file in a directory every worker
+shares. Waiters in the same process are woken immediately; waiters in
+other workers see the file on their next check (wait() returns after at
+most `timeout` seconds).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+VALID_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+class PredictionEvents:
+    def __init__(self, directory, max_age=24 * 3600):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._changed = threading.Condition()
+        self._published = 0
+
+    def _path(self, prediction_id):
+        if not VALID_ID.match(prediction_id):
+            raise ValueError(f"Invalid prediction id: {prediction_id!r}")
+        return self.dir / f"{prediction_id}.json"
+
+    def publish(self, prediction_id, status):
+        """Record the latest status dict of a prediction and wake local waiters."""
+        path = self._path(prediction_id)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(status))
+        os.replace(tmp, path)
+        with self._changed:
+            self._published += 1
+            self._changed.notify_all()
+        if self._published % 100 == 0:
+            self.prune()
+
+    def latest(self, prediction_id):
+        """The last published status, or None if no webhook has arrived yet."""
+        try:
+            return json.loads(self._path(prediction_id).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def wait(self, timeout):
+        """Block until something is published in this process or `timeout` passes."""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def prune(self):
+        """Delete events older than max_age."""
+        cutoff = time.time() - self.max_age
+        for path in self.dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
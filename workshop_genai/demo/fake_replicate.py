@@ -0,0 +1,375 @@
+"""
+In-process stand-in for the parts of the replicate client server.py uses.
+
+Start the server against it to try changes without a token or cost:
+
+    REPLICATE_FAKE=1 python server.py
+
+Predictions report "starting" for FAKE_QUEUE_SECONDS, then "processing"
+for FAKE_RUN_SECONDS, then "succeeded" with a placeholder output URL
+(served, FAKE_OUTPUT_KB in size, when running as an HTTP server).
+Upstream call counts (and bytes uploaded, as "files.bytes") are kept
+in `calls` so caching can be checked.
+
+Timings are distributions, sampled per call or per prediction (see
+sampler()): "2" is fixed, "uniform:1,3", "exp:2" is exponential with
+mean 2, "lognormal:2,0.5" has median 2. FAKE_LATENCY_SECONDS is the
+duration of each API call. Failures can be injected too:
+
+    FAKE_ERROR_RATE      fraction of API calls answered with a 500
+    FAKE_THROTTLE_RATE   fraction of prediction creates answered with a 429
+    FAKE_MAX_RUNNING     creates beyond this many unfinished predictions
+                         get a 429, like an account concurrency limit
+    FAKE_FAIL_RATE       fraction of predictions that end "failed"
+
+Predictions created with a webhook get "start" and "completed" callbacks
+POSTed to it, like Replicate does, signed with REPLICATE_WEBHOOK_SECRET
+when that is set. To try push delivery locally:
+
+    REPLICATE_FAKE=1 PUBLIC_URL=http://127.0.0.1:8000 python server.py
+
+The async_* methods server_async.py calls are there too. For load tests,
+where the upstream should be a real HTTP server with its own connection
+handling, run it standalone and point the replicate client at it:
+
+    python fake_replicate.py --port 9000 --run lognormal:8,0.6 --max-running 20
+    REPLICATE_BASE_URL=http://127.0.0.1:9000 REPLICATE_API_TOKEN=fake python server_async.py
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import traceback
+import urllib.request
+from collections import Counter
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from replicate.exceptions import ReplicateError
+
+QUEUE_SECONDS = os.environ.get("FAKE_QUEUE_SECONDS", "1")
+RUN_SECONDS = os.environ.get("FAKE_RUN_SECONDS", "3")
+LATENCY_SECONDS = os.environ.get("FAKE_LATENCY_SECONDS", "0.05")  # per API call
+ERROR_RATE = float(os.environ.get("FAKE_ERROR_RATE", 0))
+THROTTLE_RATE = float(os.environ.get("FAKE_THROTTLE_RATE", 0))
+MAX_RUNNING = int(os.environ.get("FAKE_MAX_RUNNING", 0))  # 0: no limit
+FAIL_RATE = float(os.environ.get("FAKE_FAIL_RATE", 0))
+OUTPUT_KB = int(os.environ.get("FAKE_OUTPUT_KB", 512))  # size of each output file in HTTP mode
+# Models the official-model endpoint accepts; others need a version, like on Replicate
+OFFICIAL_MODELS = set(os.environ.get("FAKE_OFFICIAL_MODELS", "black-forest-labs/flux-schnell").split(","))
+
+
+def sampler(spec, rng=random):
+    """A function returning durations in seconds, from a number or a spec
+    string: "2", "uniform:1,3", "exp:2" (mean) or "lognormal:2,0.5" (median, sigma)."""
+    if isinstance(spec, (int, float)):
+        return lambda: spec
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    args = [float(a) for a in params.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(*args)
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / args[0])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Unknown distribution: {spec!r}")
+
+
+class FakeReplicate:
+    def __init__(self, queue_seconds=QUEUE_SECONDS, run_seconds=RUN_SECONDS, latency=LATENCY_SECONDS,
+                 error_rate=ERROR_RATE, throttle_rate=THROTTLE_RATE, max_running=MAX_RUNNING,
+                 fail_rate=FAIL_RATE, seed=None):
+        self._random = random.Random(seed)
+        self.queue_seconds = sampler(queue_seconds, self._random)
+        self.run_seconds = sampler(run_seconds, self._random)
+        self.latency = sampler(latency, self._random)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_running = max_running
+        self.fail_rate = fail_rate
+        self.output_base = "https://example.invalid"  # serve() points this at itself
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+        self._created = {}  # prediction id -> SimpleNamespace(created, created_wall, queue, run, failed, model, input)
+        self._lock = threading.Lock()
+        self.predictions = SimpleNamespace(
+            create=self._create_prediction, get=self._get_prediction,
+            async_create=self._async_create_prediction, async_get=self._async_get_prediction)
+        self.files = SimpleNamespace(create=self._create_file, async_create=self._async_create_file)
+        self.models = SimpleNamespace(get=self._get_model, async_get=self._async_get_model)
+
+    def _count(self, name):
+        """Count a call and return how long it takes (raising an injected error)."""
+        with self._lock:
+            self.calls[name] += 1
+            latency = self.latency()
+            failed = self._random.random() < self.error_rate
+        if failed:
+            with self._lock:
+                self.calls["errors"] += 1
+            raise ReplicateError(status=500, detail="Fake upstream error")
+        return latency
+
+    def _call(self, name):
+        time.sleep(self._count(name))
+
+    async def _async_call(self, name):
+        await asyncio.sleep(self._count(name))
+
+    def _create_prediction(self, **kwargs):
+        self._call("predictions.create")
+        return self._new_prediction(**kwargs)
+
+    async def _async_create_prediction(self, **kwargs):
+        await self._async_call("predictions.create")
+        return self._new_prediction(**kwargs)
+
+    def _new_prediction(self, version=None, model=None, input=None, webhook=None,
+                        webhook_events_filter=None, **kwargs):
+        if model and model not in OFFICIAL_MODELS:
+            raise ReplicateError(status=404, detail=f"{model} is not an official model")
+        with self._lock:
+            now = time.monotonic()
+            running = sum(now - p.created < p.queue + p.run for p in self._created.values()) if self.max_running else 0
+            if self._random.random() < self.throttle_rate or (self.max_running and running >= self.max_running):
+                self.calls["throttled"] += 1
+                raise ReplicateError(status=429, detail="Request was throttled.")
+            prediction_id = f"fake{next(self._ids):06d}"
+            self._created[prediction_id] = SimpleNamespace(
+                created=now, created_wall=time.time(), queue=self.queue_seconds(), run=self.run_seconds(),
+                failed=self._random.random() < self.fail_rate, model=model or version, input=input or {})
+        if webhook:
+            threading.Thread(target=self._deliver_webhooks, daemon=True,
+                             args=(prediction_id, webhook, webhook_events_filter or ["completed"])).start()
+        return self._prediction(prediction_id)
+
+    def _deliver_webhooks(self, prediction_id, url, events_filter):
+        p = self._created[prediction_id]
+        if "start" in events_filter:
+            time.sleep(p.queue)
+            self._post_webhook(url, prediction_id)
+            time.sleep(p.run)
+        else:
+            time.sleep(p.queue + p.run)
+        if "completed" in events_filter:
+            self._post_webhook(url, prediction_id)
+
+    def _post_webhook(self, url, prediction_id):
+        p = self._prediction(prediction_id)
+        body = json.dumps({"id": p.id, "status": p.status, "output": p.output, "error": p.error,
+                           "created_at": p.created_at, "started_at": p.started_at,
+                           "completed_at": p.completed_at})
+        headers = {"Content-Type": "application/json"}
+        secret = os.environ.get("REPLICATE_WEBHOOK_SECRET")
+        if secret:
+            webhook_id, timestamp = f"msg_{prediction_id}_{p.status}", str(int(time.time()))
+            key = base64.b64decode(secret.split("_", 1)[1])
+            signature = hmac.new(key, f"{webhook_id}.{timestamp}.{body}".encode(), hashlib.sha256).digest()
+            headers.update({
+                "webhook-id": webhook_id,
+                "webhook-timestamp": timestamp,
+                "webhook-signature": "v1," + base64.b64encode(signature).decode(),
+            })
+        try:
+            req = urllib.request.Request(url, data=body.encode(), headers=headers, method="POST")
+            urllib.request.urlopen(req, timeout=10).close()
+        except Exception:
+            traceback.print_exc()
+
+    def _get_prediction(self, prediction_id):
+        self._call("predictions.get")
+        return self._prediction(prediction_id)
+
+    async def _async_get_prediction(self, prediction_id):
+        await self._async_call("predictions.get")
+        return self._prediction(prediction_id)
+
+    def _prediction(self, prediction_id):
+        with self._lock:
+            p = self._created.get(prediction_id)
+        if p is None:
+            raise RuntimeError(f"Prediction {prediction_id} not found")
+        age = time.monotonic() - p.created
+        status, output, error = "starting", None, None
+        started_at = completed_at = None
+        if age >= p.queue:
+            status = "processing"
+            started_at = _timestamp(p.created_wall + p.queue)
+        if age >= p.queue + p.run:
+            completed_at = _timestamp(p.created_wall + p.queue + p.run)
+            if p.failed:
+                status, error = "failed", "Fake prediction failure"
+            else:
+                status, output = "succeeded", [f"{self.output_base}/outputs/{prediction_id}/output.webp"]
+        return SimpleNamespace(id=prediction_id, status=status, output=output, error=error,
+                               model=p.model, input=p.input, created_at=_timestamp(p.created_wall),
+                               started_at=started_at, completed_at=completed_at)
+
+    def _create_file(self, file, **kwargs):
+        self._call("files.create")
+        return self._file(file)
+
+    async def _async_create_file(self, file, **kwargs):
+        await self._async_call("files.create")
+        return self._file(file)
+
+    def _file(self, file):
+        data = file.read()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        with self._lock:
+            self.calls["files.bytes"] += len(data)
+        expires_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 24 * 3600))
+        return SimpleNamespace(id=f"file{digest}", size=len(data), expires_at=expires_at,
+                               urls={"get": f"https://example.invalid/files/{digest}"})
+
+    def _get_model(self, ref):
+        self._call("models.get")
+        return self._model(ref)
+
+    async def _async_get_model(self, ref):
+        await self._async_call("models.get")
+        return self._model(ref)
+
+    def _model(self, ref):
+        return SimpleNamespace(latest_version=SimpleNamespace(id=hashlib.sha256(ref.encode()).hexdigest()))
+
+
+# ── Standalone HTTP server speaking the Replicate REST API ───────────
+
+def _timestamp(t):
+    """ISO 8601 in UTC with microseconds, like Replicate's timestamps."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + f".{int(t % 1 * 1e6):06d}Z"
+
+
+def _prediction_json(p, base_url):
+    official = "/" in (p.model or "")  # created by model name rather than version
+    return {
+        "id": p.id, "model": p.model if official else "",
+        "version": "" if official else p.model, "status": p.status,
+        "input": p.input, "output": p.output, "logs": "", "error": p.error, "metrics": {},
+        "created_at": p.created_at, "started_at": p.started_at, "completed_at": p.completed_at,
+        "urls": {"get": f"{base_url}/v1/predictions/{p.id}",
+                 "cancel": f"{base_url}/v1/predictions/{p.id}/cancel"},
+    }
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like api.replicate.com
+    fake = None                    # set by serve()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    @property
+    def _base_url(self):
+        return f"http://{self.headers.get('Host', 'localhost')}"
+
+    def do_GET(self):
+        if m := re.fullmatch(r"/outputs/([^/]+)/([^/]+)", self.path):
+            body = hashlib.sha256(m[1].encode()).digest() * (OUTPUT_KB * 1024 // 32)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/webp")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        try:
+            if m := re.fullmatch(r"/v1/predictions/([^/]+)", self.path):
+                p = self.fake.predictions.get(m[1])
+                return self._send(200, _prediction_json(p, self._base_url))
+            if m := re.fullmatch(r"/v1/models/([^/]+)/([^/]+)", self.path):
+                version = self.fake.models.get(f"{m[1]}/{m[2]}").latest_version
+                return self._send(200, {
+                    "url": f"https://replicate.com/{m[1]}/{m[2]}", "owner": m[1], "name": m[2],
+                    "description": None, "visibility": "public", "github_url": None,
+                    "paper_url": None, "license_url": None, "run_count": 0,
+                    "cover_image_url": None, "default_example": None,
+                    "latest_version": {"id": version.id, "created_at": _timestamp(time.time()),
+                                       "cog_version": "0.9.0", "openapi_schema": {}},
+                })
+        except RuntimeError as e:
+            return self._send(404, {"detail": str(e), "status": 404})
+        except ReplicateError as e:
+            return self._send(e.status or 500, {"detail": e.detail, "status": e.status})
+        self._send(404, {"detail": "Not found", "status": 404})
+
+    def do_POST(self):
+        body = self._body()
+        try:
+            if self.path == "/v1/files":
+                message = BytesParser().parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+                part = next(p for p in message.walk() if p.get_param("name", header="content-disposition") == "content")
+                f = self.fake.files.create(io.BytesIO(part.get_payload(decode=True)))
+                return self._send(201, {
+                    "id": f.id, "name": part.get_filename() or "upload", "content_type": part.get_content_type(),
+                    "size": f.size, "etag": f.id, "checksums": {}, "metadata": {},
+                    "created_at": _timestamp(time.time()), "expires_at": f.expires_at, "urls": f.urls,
+                })
+            data = json.loads(body or b"{}")
+            params = {"input": data.get("input"), "webhook": data.get("webhook"),
+                      "webhook_events_filter": data.get("webhook_events_filter")}
+            if self.path == "/v1/predictions":
+                p = self.fake.predictions.create(version=data.get("version"), **params)
+                return self._send(201, _prediction_json(p, self._base_url))
+            if m := re.fullmatch(r"/v1/models/([^/]+)/([^/]+)/predictions", self.path):
+                p = self.fake.predictions.create(model=f"{m[1]}/{m[2]}", **params)
+                return self._send(201, _prediction_json(p, self._base_url))
+        except ReplicateError as e:
+            return self._send(e.status or 500, {"detail": e.detail, "status": e.status})
+        self._send(404, {"detail": "Not found", "status": 404})
+
+
+def serve(port, fake=None):
+    """Serve the Replicate REST API from a FakeReplicate until interrupted."""
+    FakeHandler.fake = fake or FakeReplicate()
+    FakeHandler.fake.output_base = f"http://127.0.0.1:{port}"
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeHandler)
+    server.daemon_threads = True
+    print(f"Fake Replicate API at http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Replicate API over HTTP.",
+                                     epilog='Durations: "2", "uniform:1,3", "exp:2" or "lognormal:2,0.5".')
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default=LATENCY_SECONDS, help="seconds per API call")
+    parser.add_argument("--queue", default=QUEUE_SECONDS, help="seconds a prediction is starting")
+    parser.add_argument("--run", default=RUN_SECONDS, help="seconds a prediction is processing")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="fraction of calls failing with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=THROTTLE_RATE, help="fraction of creates throttled")
+    parser.add_argument("--max-running", type=int, default=MAX_RUNNING,
+                        help="throttle creates beyond this many unfinished predictions (0: no limit)")
+    parser.add_argument("--fail-rate", type=float, default=FAIL_RATE, help="fraction of predictions that fail")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    serve(args.port, FakeReplicate(args.queue, args.run, args.latency, args.error_rate,
+                                   args.throttle_rate, args.max_running, args.fail_rate, args.seed))
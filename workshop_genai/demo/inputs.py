@@ -0,0 +1,138 @@
+"""
+Request body -> model input, for every /api/<model> start endpoint
+(and each input of /api/batch/<model>).
+
+Shared by server.py (Flask) and server_async.py (ASGI), so both validate
+requests the same way. Each builder returns the model input with images
+still as the browser sent them (data URI or URL); the fields listed in
+IMAGE_FIELDS are replaced with uploaded file URLs by the server.
+"""
+
+
+class BadRequest(ValueError):
+    """Invalid request body; answered with a 400 and the message."""
+
+
+def _prompt(body):
+    prompt = (body.get("prompt") or "").strip()
+    if not prompt:
+        raise BadRequest("Prompt is required")
+    return prompt
+
+
+def _image(body, field, message="Image is required"):
+    image = body.get(field)
+    if not image:
+        raise BadRequest(message)
+    return image
+
+
+def _seed(body, model_input):
+    if body.get("seed") is not None:
+        try:
+            model_input["seed"] = int(body["seed"])
+        except (TypeError, ValueError):
+            raise BadRequest("Seed must be a whole number")
+    return model_input
+
+
+def txt2img(body):
+    return _seed(body, {
+        "prompt": _prompt(body), "num_outputs": 1, "output_format": "webp",
+    })
+
+
+def img2img(body):
+    image = _image(body, "image")
+    return {
+        "positive_prompt": _prompt(body), "image": image,
+        "denoising": body.get("strength", 0.7),
+    }
+
+
+def img2txt(body):
+    return {"image": _image(body, "image"), "task": "image_captioning"}
+
+
+def photomaker(body):
+    image = _image(body, "image", "Face image is required")
+    prompt = _prompt(body)
+    if "img" not in prompt.lower():
+        prompt = f"a photo of a person img, {prompt}"
+    return {
+        "prompt": prompt, "input_image": image,
+        "style_name": body.get("style", "(No style)"),
+        "num_outputs": min(body.get("num_outputs", 2), 4),
+    }
+
+
+def img3d(body):
+    return {
+        "image": _image(body, "image"), "steps": 50, "guidance_scale": 5.5,
+        "octree_resolution": 256, "remove_background": True,
+    }
+
+
+def txt3d(body):
+    return _seed(body, {
+        "prompt": _prompt(body), "batch_size": 1, "render_mode": "nerf",
+        "render_size": 256, "guidance_scale": 15, "save_mesh": True,
+    })
+
+
+def faceswap(body):
+    return {
+        "swap_image": _image(body, "swap_image", "Source face image is required"),
+        "input_image": _image(body, "target_image", "Target image is required"),
+    }
+
+
+def pose(body):
+    image = _image(body, "image", "Pose reference image is required")
+    return {"image": image, "prompt": _prompt(body), "num_samples": "1"}
+
+
+BUILDERS = {
+    "txt2img": txt2img,
+    "img2img": img2img,
+    "img2txt": img2txt,
+    "photomaker": photomaker,
+    "img3d": img3d,
+    "txt3d": txt3d,
+    "faceswap": faceswap,
+    "pose": pose,
+}
+
+# Input fields holding an image to upload before the prediction starts
+IMAGE_FIELDS = {
+    "img2img": ["image"],
+    "img2txt": ["image"],
+    "photomaker": ["input_image"],
+    "img3d": ["image"],
+    "faceswap": ["swap_image", "input_image"],
+    "pose": ["image"],
+}
+
+
+def build_input(model_key, body):
+    """Validate a start request and return its model input (images not yet uploaded)."""
+    if not isinstance(body, dict):
+        raise BadRequest("Expected a JSON object")
+    return BUILDERS[model_key](body)
+
+
+def build_batch(model_key, body, max_inputs):
+    """Validate a /api/batch/<model> request ({"inputs": [start request, ...]})
+    and return its model inputs; one bad input rejects the whole batch."""
+    inputs = body.get("inputs") if isinstance(body, dict) else None
+    if not isinstance(inputs, list) or not inputs:
+        raise BadRequest("Expected a non-empty list of inputs")
+    if len(inputs) > max_inputs:
+        raise BadRequest(f"At most {max_inputs} inputs per batch")
+    model_inputs = []
+    for number, item in enumerate(inputs, 1):
+        try:
+            model_inputs.append(build_input(model_key, item))
+        except BadRequest as e:
+            raise BadRequest(f"Input {number}: {e}")
+    return model_inputs
@@ -9,9 +9,11 @@
  *   Tab 7: Face Swap (codeplugtech/face-swap)
  *   Tab 8: Pose Transfer (ControlNet-Pose)
  *
- * All API calls use async polling to avoid Render's 30s timeout:
+ * All API calls are async to avoid Render's 30s timeout:
  *   1. POST to /api/<model> → returns { prediction_id }
- *   2. Poll GET /api/prediction/<id> every 2s until succeeded/failed
+ *   2. Listen on /api/prediction/<id>/events (Server-Sent Events) until
+ *      succeeded/failed, or poll GET /api/prediction/<id> every 2s if the
+ *      stream is unavailable
  */
 
 /* ================================================================
@@ -21,6 +23,14 @@ const API_BASE = window.location.hostname === 'localhost' || window.location.hos
   ? ''
   : 'https://genai-workshop-api.onrender.com';
 
+// Identifies this browser to the server's fair-share queue, so a class
+// behind one IP address still takes turns per participant
+const CLIENT_ID = localStorage.getItem('clientId') || (() => {
+  const id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+  localStorage.setItem('clientId', id);
+  return id;
+})();
+
 /* ================================================================
    Utilities
    ================================================================ */
@@ -61,7 +71,7 @@ async function runPrediction(endpoint, body, onStatus, onProgress) {
 
   const startRes = await fetch(`${API_BASE}${endpoint}`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { 'Content-Type': 'application/json', 'X-Client-Id': CLIENT_ID },
     body: JSON.stringify(body)
   });
 
@@ -69,37 +79,111 @@ async function runPrediction(endpoint, body, onStatus, onProgress) {
   if (!startRes.ok) throw new Error(startData.error || 'Request failed');
   if (!startData.prediction_id) throw new Error('No prediction ID returned');
 
-  // Step 2: Poll for completion
+  // Step 2: Wait for completion
   const predId = startData.prediction_id;
   onStatus('Processing...');
   onProgress(20);
 
-  const maxAttempts = 180; // 6 minutes max (180 * 2s)
-  for (let i = 0; i < maxAttempts; i++) {
-    await new Promise(r => setTimeout(r, 2000));
+  const result = await waitForPrediction(predId, onStatus, onProgress);
+  if (result.status === 'succeeded') {
+    onProgress(100);
+    onStatus('Done!');
+    return resolveOutputUrls(result.output);
+  }
+  throw new Error(result.error || 'Prediction failed');
+}
 
-    const pollRes = await fetch(`${API_BASE}/api/prediction/${predId}`);
-    const pollData = await pollRes.json();
+/**
+ * Outputs come back as server paths (/api/output/...) served from the
+ * server's output cache; point them at API_BASE.
+ */
+function resolveOutputUrls(output) {
+  if (typeof output === 'string') {
+    return output.startsWith('/api/') ? `${API_BASE}${output}` : output;
+  }
+  if (Array.isArray(output)) return output.map(resolveOutputUrls);
+  if (output && typeof output === 'object') {
+    return Object.fromEntries(Object.entries(output).map(([k, v]) => [k, resolveOutputUrls(v)]));
+  }
+  return output;
+}
 
-    if (pollData.status === 'succeeded') {
-      onProgress(100);
-      onStatus('Done!');
-      return pollData.output;
-    }
+/**
+ * Request body for a text prompt. The example prompt a tab starts with
+ * gets a fixed seed, so the server can answer repeats of it from its
+ * result cache (RESULT_CACHE=1); edited prompts stay unseeded and give a
+ * new result every time.
+ */
+const PRESET_SEED = 42;
 
-    if (pollData.status === 'failed') {
-      throw new Error(pollData.error || 'Prediction failed');
-    }
+function promptBody(textarea) {
+  const prompt = textarea.value.trim();
+  return prompt === textarea.defaultValue.trim() ? { prompt, seed: PRESET_SEED } : { prompt };
+}
 
-    // Update progress bar (20% to 90% over time)
-    const pct = Math.min(20 + Math.round((i / maxAttempts) * 70), 90);
-    onProgress(pct);
+const MAX_WAIT_MS = 6 * 60 * 1000; // 6 minutes max
+const TERMINAL_STATUSES = ['succeeded', 'failed', 'canceled'];
 
-    if (pollData.status === 'processing') {
-      onStatus('Model is generating...');
-    } else {
-      onStatus('Waiting for model to start...');
-    }
+function reportPending(data, startedAt, onStatus, onProgress) {
+  // Update progress bar (20% to 90% over time)
+  const pct = Math.min(20 + Math.round(((Date.now() - startedAt) / MAX_WAIT_MS) * 70), 90);
+  onProgress(pct);
+
+  if (data.status === 'processing') {
+    onStatus('Model is generating...');
+  } else if (data.status === 'queued') {
+    onStatus(data.position ? `In the queue (${data.position} ahead of you)...` : 'Next in the queue...');
+  } else {
+    onStatus('Waiting for model to start...');
+  }
+}
+
+/**
+ * Resolve with the final status of a prediction. Updates are pushed over
+ * Server-Sent Events; if the stream can't be opened, fall back to polling.
+ */
+function waitForPrediction(predId, onStatus, onProgress) {
+  const startedAt = Date.now();
+  if (!window.EventSource) return pollPrediction(predId, startedAt, onStatus, onProgress);
+
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_BASE}/api/prediction/${predId}/events`);
+    const timer = setTimeout(() => {
+      source.close();
+      reject(new Error('Generation timed out. Please try again.'));
+    }, MAX_WAIT_MS);
+
+    source.onmessage = (e) => {
+      const data = JSON.parse(e.data);
+      if (TERMINAL_STATUSES.includes(data.status)) {
+        clearTimeout(timer);
+        source.close();
+        resolve(data);
+      } else {
+        reportPending(data, startedAt, onStatus, onProgress);
+      }
+    };
+
+    source.onerror = () => {
+      // EventSource reconnects by itself when a stream ends; CLOSED means
+      // it gave up (e.g. the endpoint is missing), so poll instead.
+      if (source.readyState === EventSource.CLOSED) {
+        clearTimeout(timer);
+        pollPrediction(predId, startedAt, onStatus, onProgress).then(resolve, reject);
+      }
+    };
+  });
+}
+
+async function pollPrediction(predId, startedAt, onStatus, onProgress) {
+  while (Date.now() - startedAt < MAX_WAIT_MS) {
+    await new Promise(r => setTimeout(r, 2000));
+
+    const pollRes = await fetch(`${API_BASE}/api/prediction/${predId}`);
+    const pollData = await pollRes.json();
+
+    if (TERMINAL_STATUSES.includes(pollData.status)) return pollData;
+    reportPending(pollData, startedAt, onStatus, onProgress);
   }
 
   throw new Error('Generation timed out. Please try again.');
@@ -115,7 +199,8 @@ const TextToImage = {
 
   async generate() {
     const btn = document.getElementById('btn-generate');
-    const prompt = document.getElementById('txt2img-prompt').value.trim();
+    const promptEl = document.getElementById('txt2img-prompt');
+    const prompt = promptEl.value.trim();
     if (!prompt) return;
 
     btn.disabled = true;
@@ -131,7 +216,7 @@ const TextToImage = {
     try {
       const output = await runPrediction(
         '/api/txt2img',
-        { prompt },
+        promptBody(promptEl),
         msg => { status.textContent = msg; },
         pct => { fill.style.width = pct + '%'; }
       );
@@ -554,7 +639,8 @@ const TextTo3D = {
 
   async generate() {
     const btn = document.getElementById('btn-txt3d');
-    const prompt = document.getElementById('txt3d-prompt').value.trim();
+    const promptEl = document.getElementById('txt3d-prompt');
+    const prompt = promptEl.value.trim();
     if (!prompt) return;
 
     btn.disabled = true;
@@ -570,7 +656,7 @@ const TextTo3D = {
     try {
       const output = await runPrediction(
         '/api/txt3d',
-        { prompt },
+        promptBody(promptEl),
         msg => { status.textContent = msg; },
         pct => { fill.style.width = pct + '%'; }
       );
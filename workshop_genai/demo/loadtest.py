@@ -0,0 +1,191 @@
+"""
+Load test for the workshop API: N simulated participants at once.
+
+Each client repeatedly does what the browser does: POST a prompt (and
+an image, for image models) to start a prediction, then poll
+/api/prediction/<id> every --poll-interval seconds until it finishes.
+Participants join over --ramp seconds and each sends its own
+X-Client-Id, as separate browsers do. Every HTTP request's latency is
+recorded, as is each prediction's time from start to a finished status.
+At the end, p50/p99 per request kind (start, poll) and overall are
+printed with throughput, then prediction outcomes, errors by kind, and
+the server's own /metrics.
+
+Run against the fake upstream so nothing is billed, e.g. comparing the
+two server variants with 100 clients:
+
+    python fake_replicate.py --port 9000 &
+
+    REPLICATE_BASE_URL=http://127.0.0.1:9000 REPLICATE_API_TOKEN=fake \\
+        gunicorn server:app --workers 2 --threads 32 --bind 127.0.0.1:8000 &
+    python loadtest.py --clients 100
+
+    REPLICATE_BASE_URL=http://127.0.0.1:9000 REPLICATE_API_TOKEN=fake \\
+        uvicorn server_async:app --workers 2 --port 8000 &
+    python loadtest.py --clients 100
+
+fake_replicate.py --help lists the upstream latency and failure
+distributions it can simulate (slow runs, throttling, errors).
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import math
+import os
+import random
+import ssl
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from PIL import Image
+
+TERMINAL = ("succeeded", "failed", "canceled")
+IMAGE_MODELS = {"img2img", "img2txt"}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list (q in 0..100)."""
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def make_jpeg(edge):
+    """A noisy edge x edge JPEG, about as large as a phone photo of that size."""
+    buf = io.BytesIO()
+    Image.effect_noise((edge, edge), 64).convert("RGB").save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+
+def image_data_uri(jpeg, unique=True):
+    """A data URI of the JPEG; random trailing bytes (ignored by decoders) make each one distinct."""
+    raw = jpeg + os.urandom(16) if unique else jpeg
+    return "data:image/jpeg;base64," + base64.b64encode(raw).decode()
+
+
+def request_body(args):
+    body = {"prompt": "a watercolor painting of a lighthouse"}
+    if args.model in IMAGE_MODELS:
+        body["image"] = image_data_uri(args.jpeg, unique=not args.same_image)
+    return body
+
+
+def error_kind(e):
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP {e.response.status_code}"
+    return type(e).__name__
+
+
+async def participant(args, ssl_context, deadline, stats):
+    # A client (and keep-alive connection) per participant, like separate
+    # browsers; one shared pool of --clients connections costs more CPU
+    # in httpcore's pool bookkeeping than the server under test uses.
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    headers = {"X-Client-Id": uuid.uuid4().hex}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, verify=ssl_context,
+                                 headers=headers) as client:
+        await run_participant(client, args, deadline, stats)
+
+
+async def run_participant(client, args, deadline, stats):
+    latencies, errors, outcomes = stats["latencies"], stats["errors"], stats["outcomes"]
+    while time.monotonic() < deadline:
+        started = t0 = time.perf_counter()
+        try:
+            r = await client.post(f"/api/{args.model}", json=request_body(args))
+            r.raise_for_status()
+            latencies["start"].append(time.perf_counter() - t0)
+            prediction_id = r.json()["prediction_id"]
+        except Exception as e:
+            errors[error_kind(e)] += 1
+            await asyncio.sleep(args.poll_interval)
+            continue
+
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(f"/api/prediction/{prediction_id}")
+                r.raise_for_status()
+                latencies["poll"].append(time.perf_counter() - t0)
+                status = r.json()["status"]
+                if status in TERMINAL:
+                    outcomes[status] += 1
+                    stats["done"].append(time.perf_counter() - started)
+                    break
+            except Exception as e:
+                errors[error_kind(e)] += 1
+            if time.monotonic() >= deadline:
+                outcomes["unfinished"] += 1
+                return
+
+
+def print_table(title, rows):
+    print(f"\n{title:<11} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, values, elapsed in rows:
+        rate = f"{len(values) / elapsed:>8.1f}" if elapsed else f"{'':>8}"
+        print(f"{kind:<11} {len(values):>7} {rate} "
+              f"{percentile(values, 50) * 1000:>8.1f} {percentile(values, 99) * 1000:>8.1f} "
+              f"{(max(values) if values else float('nan')) * 1000:>8.1f}")
+
+
+async def print_server_metrics(args):
+    """The server's own view (see scheduler.py and telemetry.py), if it reports one."""
+    async with httpx.AsyncClient(base_url=args.url, timeout=10) as client:
+        try:
+            health = (await client.get("/health")).json()
+            r = await client.get("/metrics")
+            r.raise_for_status()
+        except httpx.HTTPError:
+            return
+    if health.get("scheduler"):
+        print("\nserver scheduler:", ", ".join(f"{k} {v}" for k, v in health["scheduler"].items()))
+    print(f"\nserver /metrics, last {r.json()['window_seconds']:.0f}s (seconds)")
+    for model_key, metrics in r.json()["models"].items():
+        for metric, v in metrics.items():
+            print(f"  {model_key:<10} {metric:<7} n={v['count']:<6} p50 {v['p50']:<8} p99 {v['p99']:<8} max {v['max']}")
+
+
+async def main(args):
+    args.jpeg = make_jpeg(args.image_px)
+    stats = {"latencies": {"start": [], "poll": []}, "done": [],
+             "errors": Counter(), "outcomes": Counter()}
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        (await client.get("/health")).raise_for_status()
+    images = f", {len(args.jpeg) / 1e6:.1f} MB images" if args.model in IMAGE_MODELS else ""
+    print(f"{args.clients} clients for {args.duration:.0f}s against {args.url}, "
+          f"{args.model}{images} ...")
+    started = time.monotonic()
+    deadline = started + args.duration
+    ssl_context = ssl.create_default_context()
+    await asyncio.gather(*(participant(args, ssl_context, deadline, stats) for _ in range(args.clients)))
+    elapsed = time.monotonic() - started
+
+    latencies = stats["latencies"]
+    latencies["all"] = latencies["start"] + latencies["poll"]
+    print_table("requests", [(kind, values, elapsed) for kind, values in latencies.items()])
+    print_table("predictions", [("done", stats["done"], elapsed)])
+    print("outcomes:", ", ".join(f"{name} x{count}" for name, count in sorted(stats["outcomes"].items())) or "none")
+    if stats["errors"]:
+        print("errors:", ", ".join(f"{name} x{count}" for name, count in sorted(stats["errors"].items())))
+    await print_server_metrics(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the workshop API with concurrent clients.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp", type=float, default=0, help="seconds over which clients join")
+    parser.add_argument("--model", default="img2img", choices=["txt2img", "img2img", "img2txt"])
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds, as in js/app.js")
+    parser.add_argument("--image-px", type=int, default=1024, help="edge of the square test image")
+    parser.add_argument("--same-image", action="store_true",
+                        help="send one image every time (exercises the upload cache)")
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
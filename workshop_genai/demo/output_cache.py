@@ -0,0 +1,264 @@
+"""
+Local disk cache of prediction outputs, served by /api/output/<key>/<name>.
+
+Replicate output URLs point at its CDN, expire after about an hour, and
+every browser that opens a result (3D meshes especially) downloads it
+from there again. Instead, succeeded outputs are handed to the browser as
+/api/output/<key>/<name> URLs, and each output is fetched from upstream
+once: in the background as soon as the prediction succeeds, or on first
+request. Later requests are served from disk with Range support, an ETag
+and a year-long Cache-Control (an output never changes).
+
+Only URLs the server itself registered can be fetched, so the endpoint
+is not an open proxy. Layout inside the cache directory, shared by all
+gunicorn workers:
+    <key>.json   {"url", "name", then "content_type", "size" once fetched}
+    <key>        the downloaded file
+    <key>.part   download in progress (at most one per key across workers)
+
+Files are evicted least recently served first once they total more than
+`max_bytes`; their small .json records stay (for `record_ttl`), so an
+evicted output is fetched again if its upstream URL still works. An
+output larger than `max_bytes` on its own is not cached at all: get()
+raises TooLarge, and the browser is redirected to the upstream URL.
+
+A request that finds the output being downloaded (by another worker, or
+another request in this one) waits at most `wait_timeout` seconds for it,
+then gets a TimeoutError, so it is answered before gunicorn's worker
+timeout kills it.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+
+import httpx
+
+VALID_KEY = re.compile(r"^[0-9a-f]{32}$")
+PART_TIMEOUT = 600  # a .part file older than this belongs to a dead download
+
+
+class TooLarge(Exception):
+    """The output is bigger than the whole cache; serve it from `url` instead."""
+
+    def __init__(self, url):
+        super().__init__(f"output is larger than the cache ({url})")
+        self.url = url
+
+
+def _name(url):
+    name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)[:100] or "output"
+
+
+class OutputCache:
+    def __init__(self, directory, max_bytes=1 << 30, record_ttl=7 * 24 * 3600, prefetch_workers=4,
+                 wait_timeout=90):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.record_ttl = record_ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._prefetch = ThreadPoolExecutor(prefetch_workers, thread_name_prefix="output-prefetch")
+        self.hits = 0
+        self.fetched = 0
+        self.bytes_fetched = 0
+        self.errors = 0
+
+    # ── Registration (when a prediction's output is returned) ────────
+
+    def register(self, url, prefetch=True):
+        """The /api/output path that will serve `url`."""
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        name = _name(url)
+        record = self.dir / f"{key}.json"
+        if not record.exists():
+            tmp = record.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps({"url": url, "name": name}))
+            os.replace(tmp, record)
+            if prefetch:
+                self._prefetch.submit(self._prefetch_one, key)
+        return f"/api/output/{key}/{name}"
+
+    def proxy(self, output):
+        """Replace every URL in a prediction output with its /api/output path."""
+        if isinstance(output, str):
+            return self.register(output) if output.startswith(("http://", "https://")) else output
+        if isinstance(output, list):
+            return [self.proxy(v) for v in output]
+        if isinstance(output, dict):
+            return {k: self.proxy(v) for k, v in output.items()}
+        return output
+
+    # ── Lookup ───────────────────────────────────────────────────────
+
+    def record(self, key):
+        """The stored record for a key, or None if it was never registered."""
+        if not VALID_KEY.match(key):
+            return None
+        try:
+            return json.loads((self.dir / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def cached(self, key):
+        """(path, record) if the output is on disk, else None."""
+        record = self.record(key)
+        path = self.dir / key
+        if record is None or "size" not in record or not path.exists():
+            return None
+        try:
+            os.utime(path)  # mtime is the LRU clock
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.hits += 1
+        return path, record
+
+    def get(self, key):
+        """(path, record) for a registered output, fetching it if needed; None if unknown.
+
+        Raises TooLarge for an output too big to cache, TimeoutError if
+        another download of it doesn't finish within wait_timeout."""
+        hit = self.cached(key)
+        if hit:
+            return hit
+        record = self.record(key)
+        if record is None:
+            return None
+        if record.get("too_large"):
+            raise TooLarge(record["url"])
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeout:
+                raise TimeoutError("output is still downloading, please try again")
+
+        try:
+            result = self._fetch(key)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _prefetch_one(self, key):
+        try:
+            self.get(key)
+        except Exception:
+            pass  # counted in errors; the browser's request will retry
+
+    # ── Download and eviction ────────────────────────────────────────
+
+    def _fetch(self, key):
+        part = self.dir / f"{key}.part"
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fd = os.open(part, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                break
+            except FileExistsError:
+                # Another worker is downloading it; wait for that to finish
+                try:
+                    if time.time() - part.stat().st_mtime > PART_TIMEOUT:
+                        part.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.2)
+                hit = self.cached(key)
+                if hit:
+                    return hit
+                if time.monotonic() > deadline:
+                    raise TimeoutError("output is still downloading, please try again")
+
+        record = self.record(key)
+        try:
+            with os.fdopen(fd, "wb") as f, httpx.stream("GET", record["url"], follow_redirects=True,
+                                                         timeout=httpx.Timeout(10.0, read=60.0)) as r:
+                r.raise_for_status()
+                if int(r.headers.get("content-length") or 0) > self.max_bytes:
+                    raise TooLarge(record["url"])
+                size = 0
+                for chunk in r.iter_bytes(1 << 16):
+                    f.write(chunk)
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise TooLarge(record["url"])
+                    os.utime(part)  # keep it fresh for PART_TIMEOUT
+            content_type = r.headers.get("content-type", "").split(";")[0]
+            if content_type in ("", "application/octet-stream"):
+                content_type = mimetypes.guess_type(record["name"])[0] or "application/octet-stream"
+
+            # Record first, so a worker that sees the file also sees its size
+            record.update(content_type=content_type, size=size, fetched=time.time())
+            self._write_record(key, record)
+            os.replace(part, self.dir / key)
+        except TooLarge:
+            part.unlink(missing_ok=True)
+            self._write_record(key, {**record, "too_large": True})
+            raise
+        except Exception:
+            part.unlink(missing_ok=True)
+            with self._lock:
+                self.errors += 1
+            raise
+
+        with self._lock:
+            self.fetched += 1
+            self.bytes_fetched += size
+        self._evict(keep=key)
+        return self.dir / key, record
+
+    def _write_record(self, key, record):
+        tmp = self.dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_text(json.dumps(record))
+        os.replace(tmp, self.dir / f"{key}.json")
+
+    def _evict(self, keep=None):
+        """Delete the least recently served files beyond max_bytes (never `keep`,
+        the file about to be served)."""
+        files, total = [], 0
+        cutoff = time.time() - self.record_ttl
+        for path in self.dir.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if VALID_KEY.match(path.name):
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            elif path.suffix == ".json" and stat.st_mtime < cutoff and not (self.dir / path.stem).exists():
+                path.unlink(missing_ok=True)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path.name == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "fetched": self.fetched,
+                "mb_fetched": round(self.bytes_fetched / 1e6, 1),
+                "errors": self.errors,
+            }
@@ -0,0 +1,143 @@
+"""
+On-disk memoization of prediction outputs (opt-in with RESULT_CACHE=1).
+
+The same demo prompts get submitted over and over during a workshop.
+Requests that give a seed (so the same input is meant to give the same
+output) are keyed by their model version plus their normalized input,
+and once a prediction succeeds its output is stored under that key.
+Later identical requests get the stored output straight away, and
+identical requests made while the first one is still running join it
+instead of starting another. The page sends a fixed seed with each tab's
+example prompt (promptBody in js/app.js), so those are what repeat.
+
+Layout inside the cache directory, shared by all gunicorn workers:
+    done/<key>.json          {"model", "input", "output", "created"}
+    running/<key>            prediction id of the in-flight run
+    running/<prediction id>  its key
+
+Entries older than `ttl` are ignored (Replicate output URLs expire
+after about an hour) and the oldest are deleted beyond `max_entries`.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+RUNNING_TTL = 600  # forget in-flight runs that never reported back
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _write(path, text):
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+class ResultCache:
+    def __init__(self, directory, ttl=3000, max_entries=1000):
+        self.dir = Path(directory)
+        self.done = self.dir / "done"
+        self.running = self.dir / "running"
+        self.done.mkdir(parents=True, exist_ok=True)
+        self.running.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.stored = 0
+
+    @staticmethod
+    def key(version, model_input):
+        blob = json.dumps({"version": version, "input": _normalize(model_input)}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, count=True):
+        """Stored output for a key, or None if missing or expired."""
+        try:
+            entry = json.loads((self.done / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            entry = None
+        if entry is not None and time.time() - entry["created"] > self.ttl:
+            entry = None
+        if count and entry is not None:
+            self._count("hits")
+        return entry["output"] if entry is not None else None
+
+    def running_id(self, key):
+        """Prediction id of an identical run still in progress, if any."""
+        path = self.running / key
+        try:
+            if time.time() - path.stat().st_mtime < RUNNING_TTL:
+                self._count("joined")
+                return path.read_text()
+        except FileNotFoundError:
+            pass
+        return None
+
+    def expect(self, prediction_id, key, model, model_input):
+        """Remember that `prediction_id` will produce the output for `key`."""
+        self._count("misses")
+        _write(self.running / key, prediction_id)
+        _write(self.running / prediction_id, json.dumps({"key": key, "model": model, "input": model_input}))
+
+    def complete(self, prediction_id, result):
+        """Record a terminal status; successful outputs are stored under their key."""
+        path = self.running / prediction_id
+        try:
+            pending = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return
+        key = pending["key"]
+        if result.get("status") == "succeeded":
+            _write(self.done / f"{key}.json", json.dumps({
+                "model": pending["model"], "input": pending["input"],
+                "output": result.get("output"), "created": time.time(),
+            }))
+            self._count("stored")
+            self._evict()
+        for p in (path, self.running / key):
+            p.unlink(missing_ok=True)
+
+    def _evict(self):
+        entries = []
+        for path in self.done.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:  # evicted by another worker
+                pass
+        entries.sort()
+        cutoff = time.time() - self.ttl
+        for i, (mtime, path) in enumerate(entries):
+            if len(entries) - i > self.max_entries or mtime < cutoff:
+                path.unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.joined + self.misses
+            return {
+                "hits": self.hits,
+                "joined": self.joined,
+                "misses": self.misses,
+                "stored": self.stored,
+                "hit_rate": round((self.hits + self.joined) / lookups, 3) if lookups else None,
+            }
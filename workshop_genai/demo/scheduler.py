@@ -0,0 +1,376 @@
+"""
+Fair-share scheduler in front of predictions.create, for server.py.
+
+When a whole class clicks "generate" at once, starting every prediction
+straight away runs into Replicate's rate and concurrency limits. Instead:
+
+  - Each model has a concurrency cap: at most `cap` of its predictions
+    are running at once, across all gunicorn workers. A slot is a file
+    in active/<model>/ (claimed under a lock file) that is removed when
+    the prediction finishes, or after RUN_TIMEOUT if nobody reports it.
+  - A request that finds no free slot is queued and answered with a
+    "queued-<hex>" id. /api/prediction/<id> reports {"status": "queued",
+    "position": n} until it starts, then the real prediction's status.
+  - Queues are per model and per client, served round-robin, so one
+    participant clicking ten times doesn't push everyone else back.
+  - Upstream throttling (HTTP 429) pauses the model's queue with
+    exponential backoff and puts the job back at the front. The model's
+    cap also drops to the number of its predictions running when the 429
+    came (the limit Replicate actually allows) and creeps back up by one
+    per round of successful starts, so the queue keeps starts at that
+    limit instead of bursting into it and backing off.
+
+Queues live in the worker that received the request (fairness is per
+worker); job records and slots are files any worker can read:
+    jobs/<queued id>.json       {"status": "queued", "position"} or
+                                {"status": "started", "prediction_id"} or
+                                {"status": "failed", "error"}
+    active/<model>/<id>         a running prediction (or a claim-* being started)
+
+Job records older than `max_age` are deleted every 100 enqueued requests.
+"""
+
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from replicate.exceptions import ReplicateError
+
+from events import VALID_ID
+from status_cache import TERMINAL
+
+QUEUED_PREFIX = "queued-"
+THROTTLED = {429}
+RUN_TIMEOUT = 900     # a slot nobody reported on for this long is freed
+TICK = 0.5            # dispatcher wake-up interval (slots freed by other workers)
+CHECK_SECONDS = 5     # how often this worker checks on predictions it started
+
+
+class _Job:
+    def __init__(self, job_id, model_key, model_input, client, since):
+        self.id = job_id
+        self.model_key = model_key
+        self.model_input = model_input
+        self.client = client
+        self.queued_at = since
+        self.position = None
+
+
+def _write(path, data):
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+class Scheduler:
+    def __init__(self, directory, start, status, caps=None, default_cap=6,
+                 queue_timeout=180, max_backoff=30, starters=8, max_age=3600):
+        """start(model_key, model_input, since) starts a prediction and returns
+        its id (since: time.monotonic() when the request came in);
+        status(prediction_id) returns its current status dict."""
+        self.dir = Path(directory)
+        self.jobs = self.dir / "jobs"
+        self.active = self.dir / "active"
+        self.jobs.mkdir(parents=True, exist_ok=True)
+        self.active.mkdir(parents=True, exist_ok=True)
+        self.start = start
+        self.status = status
+        self.caps = caps or {}
+        self.default_cap = default_cap
+        self.queue_timeout = queue_timeout
+        self.max_backoff = max_backoff
+        self.max_age = max_age
+        self._cond = threading.Condition()
+        self._queues = {}    # model -> OrderedDict(client -> deque of _Job), in round-robin order
+        self._backoff = {}   # model -> (resume at, consecutive throttles)
+        self._learned = {}   # model -> cap learned from throttling (a float; grows back)
+        self._mine = {}      # prediction id -> model, for ones this worker started
+        self._checked = 0.0
+        self._pool = ThreadPoolExecutor(starters, thread_name_prefix="scheduler")
+        self.started = 0
+        self.queued = 0
+        self.throttled = 0
+        self.expired = 0
+        self._dispatcher_pid = None
+
+    def _dispatch(self):
+        """Start this process's dispatcher thread if it isn't running (lock held).
+
+        Started on first use rather than here: with gunicorn --preload this
+        module is imported before the workers fork, and threads don't survive
+        a fork."""
+        if self._dispatcher_pid != os.getpid():
+            self._dispatcher_pid = os.getpid()
+            threading.Thread(target=self._run, name="scheduler", daemon=True).start()
+        self._cond.notify()
+
+    def cap(self, model_key):
+        cap = self.caps.get(model_key, self.default_cap)
+        return min(cap, int(self._learned.get(model_key, cap)))
+
+    # ── Slots (shared by all workers) ────────────────────────────────
+
+    def reserve(self, model_key, queue_first=True):
+        """Claim a slot for model_key, or None if it's at its cap.
+
+        With queue_first, also None while this worker has requests
+        waiting for the model or it is backing off, so they go first.
+        """
+        if queue_first:
+            with self._cond:
+                if self._queues.get(model_key) or self._paused(model_key):
+                    return None
+        directory = self.active / model_key
+        directory.mkdir(exist_ok=True)
+        with open(self.active / f"{model_key}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            now, running = time.time(), 0
+            for path in directory.iterdir():
+                try:
+                    if now - path.stat().st_mtime > RUN_TIMEOUT:
+                        path.unlink(missing_ok=True)
+                    else:
+                        running += 1
+                except FileNotFoundError:
+                    pass
+            if running >= self.cap(model_key):
+                return None
+            claim = directory / f"claim-{uuid.uuid4().hex}"
+            claim.touch()
+            return claim
+
+    def started_on(self, claim, model_key, prediction_id):
+        """Turn a claim into the slot of the prediction it started."""
+        slot = self.active / model_key / prediction_id
+        try:
+            os.replace(claim, slot)
+        except FileNotFoundError:
+            slot.touch()  # the claim was reaped as stale meanwhile; it's running now
+        with self._cond:
+            self._mine[prediction_id] = model_key
+            self.started += 1
+            self._backoff.pop(model_key, None)
+            if model_key in self._learned:
+                learned = self._learned[model_key] + 1 / self._learned[model_key]
+                if learned >= self.caps.get(model_key, self.default_cap):
+                    del self._learned[model_key]
+                else:
+                    self._learned[model_key] = learned
+            self._dispatch()  # keeps an eye on it until it finishes
+
+    def release(self, claim):
+        """Give back a claim whose prediction didn't start."""
+        claim.unlink(missing_ok=True)
+        with self._cond:
+            self._cond.notify()
+
+    def finished(self, prediction_id):
+        """Free the slot of a prediction that reached a terminal status."""
+        if not VALID_ID.match(prediction_id):
+            return
+        for directory in self.active.iterdir():
+            if directory.is_dir():
+                (directory / prediction_id).unlink(missing_ok=True)
+        with self._cond:
+            self._mine.pop(prediction_id, None)
+            self._cond.notify()
+
+    # ── Throttling ───────────────────────────────────────────────────
+
+    @staticmethod
+    def is_throttle(error):
+        return isinstance(error, ReplicateError) and error.status in THROTTLED
+
+    def throttle(self, model_key):
+        """Back off starting model_key after Replicate throttled a start."""
+        running = sum(not path.name.startswith("claim-") for path in (self.active / model_key).iterdir())
+        with self._cond:
+            self._learned[model_key] = max(1, running)
+            _, strikes = self._backoff.get(model_key, (0, 0))
+            delay = min(self.max_backoff, 2 ** strikes) * random.uniform(0.75, 1.25)
+            self._backoff[model_key] = (time.monotonic() + delay, strikes + 1)
+            self.throttled += 1
+
+    def _paused(self, model_key):
+        resume_at, _ = self._backoff.get(model_key, (0, 0))
+        return time.monotonic() < resume_at
+
+    # ── Queue ────────────────────────────────────────────────────────
+
+    def enqueue(self, model_key, model_input, client, since=None):
+        """Queue a request until its model has a free slot; returns its queued id."""
+        job = _Job(QUEUED_PREFIX + uuid.uuid4().hex[:24], model_key, model_input, client,
+                   since or time.monotonic())
+        with self._cond:
+            self._queues.setdefault(model_key, OrderedDict()).setdefault(client, deque()).append(job)
+            self.queued += 1
+            self._update_positions(model_key)
+            self._dispatch()
+        if self.queued % 100 == 0:
+            self.prune()
+        return job.id
+
+    def job(self, job_id):
+        """The record of a queued request, or None if unknown."""
+        if not VALID_ID.match(job_id):
+            return None
+        try:
+            return json.loads((self.jobs / f"{job_id}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def prune(self):
+        """Delete job records older than max_age."""
+        cutoff = time.time() - self.max_age
+        for path in self.jobs.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _update_positions(self, model_key):
+        """Rewrite the queued records whose place in line changed (lock held)."""
+        clients = list(self._queues.get(model_key, {}).values())
+        for rank, jobs in enumerate(clients):
+            for index, job in enumerate(jobs):
+                # Jobs served before this one: `index` rounds of every other
+                # client, plus this round for the clients ahead of it
+                ahead = index + sum(min(len(other), index + (i < rank))
+                                    for i, other in enumerate(clients) if i != rank)
+                if ahead != job.position:
+                    try:
+                        _write(self.jobs / f"{job.id}.json", {"status": "queued", "position": ahead})
+                    except OSError:
+                        traceback.print_exc()  # tried again on the next change
+                        continue
+                    job.position = ahead
+
+    def _pop(self, model_key):
+        """Next job for model_key, round-robin across clients (lock held)."""
+        clients = self._queues[model_key]
+        client, jobs = next(iter(clients.items()))
+        job = jobs.popleft()
+        del clients[client]
+        if jobs:
+            clients[client] = jobs  # to the back of the round
+        if not clients:
+            del self._queues[model_key]
+        return job
+
+    def _requeue(self, job):
+        """Put a throttled job back at the front of the line (lock held)."""
+        clients = self._queues.setdefault(job.model_key, OrderedDict())
+        clients.setdefault(job.client, deque()).appendleft(job)
+        clients.move_to_end(job.client, last=False)
+
+    def _start_job(self, job, claim):
+        try:
+            prediction_id = self.start(job.model_key, job.model_input, job.queued_at)
+        except Exception as e:
+            self.release(claim)
+            if self.is_throttle(e):
+                self.throttle(job.model_key)
+                with self._cond:
+                    self._requeue(job)
+                    self._update_positions(job.model_key)
+                return
+            traceback.print_exc()
+            _write(self.jobs / f"{job.id}.json", {"status": "failed", "error": str(e)})
+            return
+        try:
+            self.started_on(claim, job.model_key, prediction_id)
+        except Exception:
+            traceback.print_exc()
+            self.release(claim)  # rather than hold the slot until RUN_TIMEOUT
+        # It's running upstream either way; the client must learn its id
+        _write(self.jobs / f"{job.id}.json", {"status": "started", "prediction_id": prediction_id})
+
+    # ── Dispatcher thread ────────────────────────────────────────────
+
+    def _run(self):
+        while True:
+            try:
+                self._tick()
+            except Exception:
+                traceback.print_exc()  # e.g. a full disk; keep serving the queue
+                time.sleep(TICK)
+
+    def _tick(self):
+        with self._cond:
+            self._cond.wait(TICK)
+            self._expire()
+            waiting = [m for m in self._queues if not self._paused(m)]
+        for model_key in waiting:
+            while True:
+                claim = self.reserve(model_key, queue_first=False)
+                if claim is None:
+                    break
+                with self._cond:
+                    if model_key not in self._queues:
+                        job = None
+                    else:
+                        job = self._pop(model_key)
+                        self._update_positions(model_key)
+                if job is None:
+                    self.release(claim)
+                    break
+                self._pool.submit(self._start_job, job, claim)
+        if time.monotonic() - self._checked >= CHECK_SECONDS:
+            self._checked = time.monotonic()
+            self._check_mine()
+
+    def _expire(self):
+        """Fail queued jobs that have waited longer than queue_timeout (lock held)."""
+        cutoff = time.monotonic() - self.queue_timeout
+        for model_key in list(self._queues):
+            for client, jobs in list(self._queues[model_key].items()):
+                while jobs and jobs[0].queued_at < cutoff:
+                    # Recorded before it leaves the queue, so a failed write is retried
+                    _write(self.jobs / f"{jobs[0].id}.json",
+                           {"status": "failed", "error": "The server is busy, please try again"})
+                    jobs.popleft()
+                    self.expired += 1
+                if not jobs:
+                    del self._queues[model_key][client]
+            if not self._queues[model_key]:
+                del self._queues[model_key]
+
+    def _check_mine(self):
+        """Look up predictions this worker started, so their slots are freed
+        even if no browser is polling them (or their webhook went elsewhere)."""
+        with self._cond:
+            mine = list(self._mine.items())
+        for prediction_id, model_key in mine:
+            if not (self.active / model_key / prediction_id).exists():
+                with self._cond:
+                    self._mine.pop(prediction_id, None)  # finished in another worker
+                continue
+            self._pool.submit(self._check, prediction_id)
+
+    def _check(self, prediction_id):
+        try:
+            if self.status(prediction_id)["status"] in TERMINAL:
+                self.finished(prediction_id)
+        except Exception:
+            traceback.print_exc()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "started": self.started,
+                "queued": self.queued,
+                "waiting": {m: sum(map(len, q.values())) for m, q in self._queues.items()},
+                "throttled": self.throttled,
+                "expired": self.expired,
+                "backing_off": [m for m in self._backoff if self._paused(m)],
+                "learned_caps": {m: int(cap) for m, cap in self._learned.items()},
+            }
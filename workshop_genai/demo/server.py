@@ -1,32 +1,90 @@
 """
 Workshop API Server — proxies requests to Replicate API.
 
-Uses async predictions + polling to avoid Render's 30s request timeout.
-The frontend calls /api/<model> to start a prediction, then polls
-/api/prediction/<id> until it completes.
+Uses async predictions to avoid Render's 30s request timeout. The
+frontend calls /api/<model> to start a prediction, then listens on
+/api/prediction/<id>/events (Server-Sent Events) until it completes,
+falling back to polling /api/prediction/<id>.
+
+When the server knows its public URL (PUBLIC_URL, or RENDER_EXTERNAL_URL
+on Render), every prediction is created with a webhook, and completion
+is pushed to the browser as soon as Replicate calls it. Set
+REPLICATE_WEBHOOK_SECRET (from replicate.webhooks.default.secret()) to
+verify webhook signatures.
+
+RESULT_CACHE=1 memoizes outputs on disk (see result_cache.py), so
+repeated demo prompts come back instantly without an upstream call.
+
+Starting predictions goes through a fair-share scheduler (see
+scheduler.py): at most MODEL_CONCURRENCY predictions per model run at
+once, further requests wait in per-participant round-robin queues with a
+"queued-..." id, and throttled starts are retried with backoff.
+
+/api/batch/<model> starts several inputs for one model at once and
+/api/batch/<id> reports on all of them in one response.
+
+/metrics reports rolling per-model percentiles of upload, start, queue
+and run time (see telemetry.py).
+
+Output files are handed to the browser as /api/output/... URLs and
+served from a local disk cache (see output_cache.py; OUTPUT_CACHE=0
+returns Replicate's URLs instead).
 
 Images are uploaded to Replicate's file service first (fast), then
 the file URL is passed to the prediction (no huge base64 in JSON).
+Each is shrunk to what its model uses and stripped of metadata first
+(see ingest.py).
 
 Local:
     pip install flask flask-cors replicate
     export REPLICATE_API_TOKEN="r8_your_token_here"
     python server.py
 
+Without a token (fake_replicate.py stands in for Replicate):
+    REPLICATE_FAKE=1 python server.py
+
 Render:
     Set REPLICATE_API_TOKEN in Render environment variables.
-    Start command: gunicorn server:app --timeout 120 --workers 2
+    Start command: gunicorn server:app --timeout 120 --workers 2 --threads 32 --preload
+    (threads, because every open event stream holds one)
+
+server_async.py serves the same routes from an ASGI app (uvicorn), with
+upstream calls awaited over a shared connection pool instead of holding
+a thread each; loadtest.py compares the two.
 """
 
-import base64
-import io
+import json
 import os
+import tempfile
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, redirect, send_file
 from flask_cors import CORS
 
 import replicate
+from replicate.exceptions import ReplicateError
+from replicate.webhook import Webhooks, WebhookSigningSecret, WebhookValidationError
+
+import ingest
+from batches import BatchStore
+from events import VALID_ID, PredictionEvents
+from inputs import IMAGE_FIELDS, BadRequest, build_batch, build_input
+from output_cache import OutputCache, TooLarge
+from result_cache import ResultCache
+from scheduler import QUEUED_PREFIX, Scheduler
+from status_cache import StatusCache, TERMINAL
+from telemetry import Telemetry
+from upload_cache import UploadCache
+from versions import VersionResolver
+
+# The replicate module, or a local stand-in with the same surface
+if os.environ.get("REPLICATE_FAKE"):
+    from fake_replicate import FakeReplicate
+    api = FakeReplicate()
+else:
+    api = replicate
 
 app = Flask(__name__)
 CORS(app)
@@ -38,6 +96,13 @@ def handle_error(e):
     traceback.print_exc()
     return jsonify({"error": str(e)}), 500
 
+@app.errorhandler(ReplicateError)
+def handle_replicate_error(e):
+    traceback.print_exc()
+    if e.status == 429:
+        return jsonify({"error": THROTTLED_MESSAGE}), 429, {"Retry-After": "5"}
+    return jsonify({"error": str(e)}), 500
+
 @app.errorhandler(404)
 def handle_404(e):
     return jsonify({"error": "Not found"}), 404
@@ -47,6 +112,9 @@ def handle_500(e):
     return jsonify({"error": "Internal server error"}), 500
 
 
+THROTTLED_MESSAGE = "Replicate is busy right now, please try again in a moment"
+
+
 # ── Replicate model identifiers ──────────────────────────────────────
 MODELS = {
     "txt2img": "black-forest-labs/flux-schnell",
@@ -60,245 +128,566 @@ MODELS = {
 }
 
 
-def upload_data_uri(data_uri):
+# Repeat uploads of the same image reuse the URL it was first uploaded to
+upload_cache = UploadCache(max_entries=int(os.environ.get("UPLOAD_CACHE_SIZE", 500)))
+
+
+def prepare_upload(data_uri, model_key):
+    """Decode and normalize an image (see ingest.py) unless it was uploaded before.
+
+    Returns (upload cache key, cached URL or None, file object, mime type, file name).
+    """
+    raw, digest = ingest.decode_data_uri(data_uri)
+    max_edge = ingest.MAX_EDGE.get(model_key)
+    key = f"{digest}:{max_edge}"
+    url = upload_cache.get(key)
+    if url:
+        raw.close()
+        return key, url, None, None, None
+    return (key, None) + ingest.normalize(raw, max_edge)
+
+
+def upload_images(model_key, model_input):
+    """Replace the request's images with uploaded file URLs, timing it."""
+    fields = IMAGE_FIELDS.get(model_key, [])
+    if not fields:
+        return
+    t0 = time.monotonic()
+    for field in fields:
+        model_input[field] = upload_data_uri(model_input[field], model_key)
+    telemetry.record(model_key, "upload", time.monotonic() - t0)
+
+
+def upload_data_uri(data_uri, model_key):
     """Convert a data URI or URL to a Replicate file upload URL."""
     # If it's already a URL (not a data URI), return it directly
     if data_uri.startswith("http://") or data_uri.startswith("https://"):
         return data_uri
 
-    if "," not in data_uri:
-        raise ValueError("Invalid image data: expected a data URI (data:image/...) or a URL")
+    key, url, file_obj, mime, name = prepare_upload(data_uri, model_key)
+    if url:
+        return url
 
-    header, b64data = data_uri.split(",", 1)
-    mime = header.split(":")[1].split(";")[0] if ":" in header else "image/jpeg"
-    ext = mime.split("/")[1].replace("jpeg", "jpg")
-    raw = base64.b64decode(b64data)
-    file_obj = io.BytesIO(raw)
-    file_obj.name = f"upload.{ext}"
-    uploaded = replicate.files.create(file_obj, content_type=mime)
+    uploaded = api.files.create(file_obj, filename=name, content_type=mime)
+    file_obj.close()
+    upload_cache.put(key, uploaded.urls["get"], getattr(uploaded, "expires_at", None))
     return uploaded.urls["get"]
 
 
 def resolve_version(model_ref):
-    """Resolve a model reference to a version hash."""
-    if ":" in model_ref:
-        return model_ref.split(":")[1]
-    # Official model — look up latest version
-    model = replicate.models.get(model_ref)
-    return model.latest_version.id
+    """Look up the latest version hash of an unpinned model (None if it has none)."""
+    model = api.models.get(model_ref)
+    return model.latest_version.id if model.latest_version else None
 
 
-# Resolve all versions at startup so requests are fast
 # Official models (no colon) use the model parameter directly;
-# community models (with colon) use a pinned version hash.
-print("Resolving model versions...")
-VERSIONS = {}
-OFFICIAL = {}
-ERRORS = {}
-for key, ref in MODELS.items():
+# community models (with colon) use a pinned version hash. Unpinned
+# community models are resolved to their latest version on first use,
+# so nothing here waits on Replicate at startup.
+VERSIONS = {key: ref.split(":", 1)[1] for key, ref in MODELS.items() if ":" in ref}
+OFFICIAL = {key: ref for key, ref in MODELS.items() if ":" not in ref}
+versions = VersionResolver(
+    resolve_version,
+    os.environ.get("VERSION_CACHE", os.path.join(tempfile.gettempdir(), "workshop_genai_versions.json")),
+    ttl=float(os.environ.get("VERSION_CACHE_TTL", 6 * 3600)),
+)
+
+
+# ── Webhooks ─────────────────────────────────────────────────────────
+# Public base URL Replicate can reach; without one there are no webhooks
+# and event streams poll upstream on the browser's behalf.
+PUBLIC_URL = (os.environ.get("PUBLIC_URL") or os.environ.get("RENDER_EXTERNAL_URL") or "").rstrip("/")
+WEBHOOK_SECRET = os.environ.get("REPLICATE_WEBHOOK_SECRET")
+
+events = PredictionEvents(
+    os.environ.get("EVENTS_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_events")))
+
+
+def webhook_args():
+    if not PUBLIC_URL:
+        return {}
+    return {
+        "webhook": f"{PUBLIC_URL}/api/webhook/replicate",
+        "webhook_events_filter": ["start", "completed"],
+    }
+
+
+# ── Result memoization (opt-in) ──────────────────────────────────────
+# Identical seeded requests (same model version and input) are
+# answered from disk with a synthetic "cached-<key>" prediction.
+CACHED_PREFIX = "cached-"
+result_cache = None
+if os.environ.get("RESULT_CACHE", "") not in ("", "0"):
+    result_cache = ResultCache(
+        os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_results")),
+        ttl=float(os.environ.get("RESULT_CACHE_TTL", 3000)),
+        max_entries=int(os.environ.get("RESULT_CACHE_SIZE", 1000)),
+    )
+
+
+# ── Telemetry ────────────────────────────────────────────────────────
+# Upload, start, queue and run time per model, shared by all workers;
+# /metrics reports percentiles over the last METRICS_WINDOW seconds.
+telemetry = Telemetry(
+    os.environ.get("TELEMETRY_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_telemetry")),
+    window=float(os.environ.get("METRICS_WINDOW", 900)),
+)
+
+
+# ── Output proxy ─────────────────────────────────────────────────────
+# Succeeded outputs are fetched once into a size-bounded disk cache and
+# served from /api/output/<key>/<name> instead of Replicate's CDN.
+OUTPUT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+output_cache = None
+if os.environ.get("OUTPUT_CACHE", "1") not in ("", "0"):
+    output_cache = OutputCache(
+        os.environ.get("OUTPUT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_outputs")),
+        max_bytes=int(float(os.environ.get("OUTPUT_CACHE_MB", 1024)) * 1e6),
+    )
+
+
+def create_prediction(model_key, model_input):
+    ref = MODELS[model_key]
+    target = versions.target(ref)
     try:
-        if ":" in ref:
-            VERSIONS[key] = resolve_version(ref)
-            print(f"  {key}: {VERSIONS[key][:12]}...")
-        else:
-            OFFICIAL[key] = ref
-            print(f"  {key}: official ({ref})")
+        return api.predictions.create(input=model_input, **target, **webhook_args())
+    except ReplicateError as e:
+        if "model" not in target or e.status not in (404, 422):
+            raise
+    # Not an official model: run its latest version (remembered from now on)
+    try:
+        version = versions.resolve(ref)
     except Exception as e:
-        ERRORS[key] = str(e)
-        print(f"  {key}: FAILED — {e}")
-print("Done.\n")
-
-
-def start_prediction(model_key, model_input):
-    """Start an async prediction and return its ID immediately."""
-    if model_key in OFFICIAL:
-        prediction = replicate.predictions.create(
-            model=OFFICIAL[model_key],
-            input=model_input,
-        )
-        return prediction.id
-
-    version = VERSIONS.get(model_key)
-    if not version:
-        err = ERRORS.get(model_key, "unknown error")
-        raise ValueError(f"Model '{model_key}' failed to load: {err}")
-    prediction = replicate.predictions.create(
-        version=version,
-        input=model_input,
-    )
+        raise ValueError(f"Model '{model_key}' failed to load: {e}")
+    return api.predictions.create(input=model_input, version=version, **webhook_args())
+
+
+def result_key(model_key, model_input):
+    """Result cache key for a request, or None if it shouldn't be memoized.
+
+    Only seeded requests are: without a seed, the same prompt is meant to
+    give a new image each time. The key uses the version the prediction
+    will run when it's known (pinned, or already resolved); official
+    models run their latest version and are keyed by name, so their
+    entries last at most RESULT_CACHE_TTL across a new release. Nothing
+    is looked up here, so memoization doesn't change how predictions are
+    created.
+    """
+    if not result_cache or model_input.get("seed") is None:
+        return None
+    ref = MODELS[model_key]
+    return ResultCache.key(versions.target(ref).get("version", ref), model_input)
+
+
+def memoized_prediction(model_key, model_input):
+    """ID of a stored or still-running identical prediction, if any."""
+    key = result_key(model_key, model_input)
+    if key is None:
+        return None
+    if result_cache.get(key) is not None:
+        return CACHED_PREFIX + key
+    return result_cache.running_id(key)
+
+
+def expect_result(prediction_id, model_key, model_input):
+    key = result_key(model_key, model_input)
+    if key is not None:
+        result_cache.expect(prediction_id, key, MODELS[model_key], model_input)
+
+
+def begin_prediction(model_key, model_input, since):
+    """Create a prediction upstream and return its ID (since: time.monotonic()
+    when the request came in, for the start time metric)."""
+    prediction = create_prediction(model_key, model_input)
+    note_started(prediction.id, model_key, model_input, since)
     return prediction.id
 
 
-# ── Start endpoints (return prediction ID immediately) ───────────────
+def note_started(prediction_id, model_key, model_input, since):
+    """Bookkeeping (on disk) for a prediction Replicate just accepted."""
+    expect_result(prediction_id, model_key, model_input)
+    telemetry.started(prediction_id, model_key)
+    telemetry.record(model_key, "start", time.monotonic() - since)
+
+
+# ── Scheduling ───────────────────────────────────────────────────────
+# At most MODEL_CONCURRENCY predictions per model run at once across all
+# workers (MODEL_CONCURRENCY_<KEY>, e.g. MODEL_CONCURRENCY_IMG3D, for one
+# model; 0 turns the scheduler off). Requests beyond that are queued,
+# round-robin per participant, under a "queued-<hex>" id. A request still
+# queued after QUEUE_TIMEOUT seconds fails with "busy"; the page gives up
+# on a prediction after 6 minutes in all (MAX_WAIT_MS in js/app.js), so
+# this leaves it half of that to run.
+MODEL_CONCURRENCY = int(os.environ.get("MODEL_CONCURRENCY", 8))
+scheduler = None
+if MODEL_CONCURRENCY > 0:
+    scheduler = Scheduler(
+        os.environ.get("SCHEDULER_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_scheduler")),
+        begin_prediction,
+        lambda prediction_id: status_cache.get(prediction_id),
+        caps={key: int(os.environ[f"MODEL_CONCURRENCY_{key.upper()}"]) for key in MODELS
+              if f"MODEL_CONCURRENCY_{key.upper()}" in os.environ},
+        default_cap=MODEL_CONCURRENCY,
+        queue_timeout=float(os.environ.get("QUEUE_TIMEOUT", 180)),
+    )
 
-@app.route("/api/txt2img", methods=["POST"])
-def txt2img():
-    body = request.get_json()
-    prompt = body.get("prompt", "").strip()
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
 
-    pred_id = start_prediction("txt2img", {
-        "prompt": prompt, "num_outputs": 1, "output_format": "webp",
-    })
-    return jsonify({"prediction_id": pred_id})
+def client_id(headers, remote_addr):
+    """Who a request is from, for fair queuing: the page's X-Client-Id, else its IP."""
+    client = headers.get("X-Client-Id", "")[:64]
+    if not client:
+        client = headers.get("X-Forwarded-For", "").split(",")[0].strip()
+    return client or remote_addr or "-"
+
+
+def start_prediction(model_key, model_input, client):
+    """Start an async prediction (or queue it) and return its ID immediately."""
+    since = time.monotonic()
+    known = memoized_prediction(model_key, model_input)
+    if known:
+        return known
+    if not scheduler:
+        return begin_prediction(model_key, model_input, since)
+
+    claim = scheduler.reserve(model_key)
+    if claim:
+        try:
+            prediction_id = begin_prediction(model_key, model_input, since)
+        except Exception as e:
+            scheduler.release(claim)
+            if not scheduler.is_throttle(e):
+                raise
+            scheduler.throttle(model_key)  # and wait in the queue below
+        else:
+            scheduler.started_on(claim, model_key, prediction_id)
+            return prediction_id
+    return scheduler.enqueue(model_key, model_input, client, since)
 
 
-@app.route("/api/img2img", methods=["POST"])
-def img2img():
-    body = request.get_json()
-    prompt = body.get("prompt", "").strip()
-    image = body.get("image")
-    strength = body.get("strength", 0.7)
+# ── Start endpoints (return prediction ID immediately) ───────────────
+# One route per MODELS key; request validation lives in inputs.py.
 
-    if not image:
-        return jsonify({"error": "Image is required"}), 400
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
+@app.route("/api/<model_key>", methods=["POST"])
+def start(model_key):
+    if model_key not in MODELS:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        model_input = build_input(model_key, request.get_json())
+        upload_images(model_key, model_input)
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
 
-    image_url = upload_data_uri(image)
-    pred_id = start_prediction("img2img", {
-        "positive_prompt": prompt, "image": image_url,
-        "denoising": strength,
-    })
+    pred_id = start_prediction(model_key, model_input, client_id(request.headers, request.remote_addr))
     return jsonify({"prediction_id": pred_id})
 
 
-@app.route("/api/img2txt", methods=["POST"])
-def img2txt():
-    body = request.get_json()
-    image = body.get("image")
-    if not image:
-        return jsonify({"error": "Image is required"}), 400
+# ── Poll endpoint (frontend checks this every 2s) ────────────────────
 
-    image_url = upload_data_uri(image)
-    pred_id = start_prediction("img2txt", {
-        "image": image_url, "task": "image_captioning",
-    })
-    return jsonify({"prediction_id": pred_id})
+def poll_response(status, output=None, error=None):
+    """The status dict returned to the browser for a prediction."""
+    result = {
+        "status": status,
+    }
 
+    if status == "succeeded":
+        result["output"] = output_cache.proxy(output) if output_cache else output
+    elif status == "failed":
+        result["error"] = error or "Prediction failed"
+
+    return result
+
+
+def memoized_status(prediction_id):
+    """The poll response for a "cached-<key>" id, or None for a real prediction."""
+    if not (prediction_id.startswith(CACHED_PREFIX) and result_cache):
+        return None
+    output = result_cache.get(prediction_id[len(CACHED_PREFIX):], count=False)
+    if output is None:
+        return poll_response("failed", error="Cached result expired, please try again")
+    return poll_response("succeeded", output)
+
+
+def queued_status(prediction_id):
+    """For a "queued-<hex>" id: (poll response, id) while it waits or if it
+    failed to start, (None, prediction id) once it has started.
+    Other ids come back as (None, id)."""
+    if not (scheduler and prediction_id.startswith(QUEUED_PREFIX)):
+        return None, prediction_id
+    job = scheduler.job(prediction_id)
+    if job is None:
+        return poll_response("failed", error="Unknown request, please try again"), prediction_id
+    if job["status"] == "started":
+        return None, job["prediction_id"]
+    if job["status"] == "queued":
+        return {"status": "queued", "position": job["position"]}, prediction_id
+    return poll_response("failed", error=job["error"]), prediction_id
+
+
+def local_status(prediction_id):
+    """(poll response, id) for an id answered without asking Replicate (a
+    memoized result, or a request still queued), else (None, id to fetch)."""
+    result = memoized_status(prediction_id)
+    if result is not None:
+        return result, prediction_id
+    return queued_status(prediction_id)
+
+
+def prediction_status(prediction):
+    """The poll response for a prediction fetched from Replicate, remembered
+    (see remember_result) once it has finished."""
+    result = poll_response(prediction.status, prediction.output, prediction.error)
+    remember_result(prediction.id, result, prediction.created_at, prediction.started_at,
+                    prediction.completed_at)
+    return result
+
+
+def fetch_status(prediction_id):
+    """Fetch a prediction from Replicate and reduce it to the poll response."""
+    result, prediction_id = local_status(prediction_id)
+    if result is not None:
+        return result
+    return prediction_status(api.predictions.get(prediction_id))
+
+
+def remember_result(prediction_id, result, created_at=None, started_at=None, completed_at=None):
+    """Once a prediction has finished: record its queue and run time, free
+    its scheduler slot, and store its output in the result cache, if
+    that's enabled."""
+    if result["status"] not in TERMINAL:
+        return
+    telemetry.finished(prediction_id, created_at, started_at, completed_at)
+    if scheduler:
+        scheduler.finished(prediction_id)
+    if result_cache:
+        result_cache.complete(prediction_id, result)
+
+
+# Tabs polling the same prediction within the TTL share one upstream call;
+# finished predictions are answered from memory.
+status_cache = StatusCache(
+    fetch_status,
+    ttl=float(os.environ.get("STATUS_CACHE_TTL", 1.0)),
+    max_terminal=int(os.environ.get("STATUS_CACHE_SIZE", 2000)),
+)
 
-@app.route("/api/photomaker", methods=["POST"])
-def photomaker():
-    body = request.get_json()
-    prompt = body.get("prompt", "").strip()
-    image = body.get("image")
-    style = body.get("style", "(No style)")
-    num_outputs = body.get("num_outputs", 2)
 
-    if not image:
-        return jsonify({"error": "Face image is required"}), 400
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
+@app.route("/api/prediction/<prediction_id>")
+def get_prediction(prediction_id):
+    return jsonify(status_cache.get(prediction_id))
 
-    if "img" not in prompt.lower():
-        prompt = f"a photo of a person img, {prompt}"
 
-    image_url = upload_data_uri(image)
-    pred_id = start_prediction("photomaker", {
-        "prompt": prompt, "input_image": image_url,
-        "style_name": style, "num_outputs": min(num_outputs, 4),
-    })
-    return jsonify({"prediction_id": pred_id})
+@app.route("/api/output/<key>/<name>")
+def output_file(key, name):
+    """A prediction output from the local cache (fetched from Replicate on first use)."""
+    if not output_cache:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        hit = output_cache.get(key)
+    except TooLarge as e:
+        return redirect(e.url)  # too big to keep; Replicate serves it
+    except Exception as e:
+        return jsonify({"error": f"Output unavailable: {e}"}), 502
+    if hit is None:
+        return jsonify({"error": "Not found"}), 404
 
+    path, record = hit
+    response = send_file(path, mimetype=record["content_type"], etag=key,
+                         download_name=record["name"], conditional=True)
+    response.headers["Cache-Control"] = OUTPUT_CACHE_CONTROL
+    return response
 
-@app.route("/api/img3d", methods=["POST"])
-def img3d():
-    body = request.get_json()
-    image = body.get("image")
-    if not image:
-        return jsonify({"error": "Image is required"}), 400
 
-    image_url = upload_data_uri(image)
-    pred_id = start_prediction("img3d", {
-        "image": image_url, "steps": 50, "guidance_scale": 5.5,
-        "octree_resolution": 256, "remove_background": True,
-    })
-    return jsonify({"prediction_id": pred_id})
+# ── Batches ──────────────────────────────────────────────────────────
+# POST /api/batch/<model> {"inputs": [...]} starts up to BATCH_MAX
+# predictions concurrently (through the scheduler, like single starts);
+# GET /api/batch/<id> returns all their statuses in one response.
+BATCH_MAX = int(os.environ.get("BATCH_MAX", 8))
+batches = BatchStore(
+    os.environ.get("BATCHES_DIR", os.path.join(tempfile.gettempdir(), "workshop_genai_batches")))
+batch_pool = ThreadPoolExecutor(32, thread_name_prefix="batch")
 
 
-@app.route("/api/txt3d", methods=["POST"])
-def txt3d():
-    body = request.get_json()
-    prompt = body.get("prompt", "").strip()
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
+def start_batch_item(model_key, model_input, client):
+    """Upload one batch input's images and start it: {"id": ...} or {"error": ...}."""
+    try:
+        upload_images(model_key, model_input)
+        return {"id": start_prediction(model_key, model_input, client)}
+    except BadRequest as e:
+        return {"error": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        if isinstance(e, ReplicateError) and e.status == 429:
+            return {"error": THROTTLED_MESSAGE}
+        return {"error": str(e)}
+
+
+def batch_response(items, results):
+    """The poll response for a batch: overall status and progress, and each
+    prediction's status in input order. results[i] is the status of
+    items[i], None for an item that never started."""
+    predictions = []
+    for item, result in zip(items, results):
+        if result is None:
+            result = poll_response("failed", error=item["error"])
+        predictions.append({"id": item.get("id"), **result})
+
+    statuses = [p["status"] for p in predictions]
+    pending = [s for s in statuses if s not in TERMINAL]
+    if pending:
+        status = min(pending, key=lambda s: STATUS_RANK.get(s, 0))  # the furthest behind
+    else:
+        status = "succeeded" if "succeeded" in statuses else "failed"
+    return {
+        "status": status,
+        "total": len(predictions),
+        "done": len(predictions) - len(pending),
+        "succeeded": statuses.count("succeeded"),
+        "failed": statuses.count("failed") + statuses.count("canceled"),
+        "predictions": predictions,
+    }
 
-    pred_id = start_prediction("txt3d", {
-        "prompt": prompt, "batch_size": 1, "render_mode": "nerf",
-        "render_size": 256, "guidance_scale": 15, "save_mesh": True,
-    })
-    return jsonify({"prediction_id": pred_id})
 
+@app.route("/api/batch/<model_key>", methods=["POST"])
+def start_batch(model_key):
+    if model_key not in MODELS:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        model_inputs = build_batch(model_key, request.get_json(), BATCH_MAX)
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
 
-@app.route("/api/faceswap", methods=["POST"])
-def faceswap():
-    body = request.get_json()
-    swap_image = body.get("swap_image")
-    target_image = body.get("target_image")
+    client = client_id(request.headers, request.remote_addr)
+    items = list(batch_pool.map(lambda model_input: start_batch_item(model_key, model_input, client),
+                                model_inputs))
+    return jsonify({"batch_id": batches.create(items), "prediction_ids": [item.get("id") for item in items]})
 
-    if not swap_image:
-        return jsonify({"error": "Source face image is required"}), 400
-    if not target_image:
-        return jsonify({"error": "Target image is required"}), 400
 
-    swap_url = upload_data_uri(swap_image)
-    target_url = upload_data_uri(target_image)
-    pred_id = start_prediction("faceswap", {
-        "swap_image": swap_url,
-        "input_image": target_url,
-    })
-    return jsonify({"prediction_id": pred_id})
+@app.route("/api/batch/<batch_id>")
+def get_batch(batch_id):
+    items = batches.get(batch_id)
+    if items is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    results = list(batch_pool.map(lambda item: status_cache.get(item["id"]) if "id" in item else None, items))
+    return jsonify(batch_response(items, results))
 
 
-@app.route("/api/pose", methods=["POST"])
-def pose():
-    body = request.get_json()
-    image = body.get("image")
-    prompt = body.get("prompt", "").strip()
+# ── Push delivery (webhook in, Server-Sent Events out) ───────────────
 
-    if not image:
-        return jsonify({"error": "Pose reference image is required"}), 400
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
+STREAM_SECONDS = 25      # end each stream before Render's 30s limit; the browser reconnects
+HEARTBEAT_SECONDS = 5    # resend the current status this often, for progress bars
+FALLBACK_POLL_SECONDS = 10 if PUBLIC_URL else 2  # upstream check in case a webhook is lost
+STATUS_RANK = {"queued": -1, "starting": 0, "processing": 1}   # anything else is terminal
 
-    image_url = upload_data_uri(image)
-    pred_id = start_prediction("pose", {
-        "image": image_url,
-        "prompt": prompt,
-        "num_samples": "1",
-    })
-    return jsonify({"prediction_id": pred_id})
 
+def read_webhook(headers, body):
+    """Check a webhook delivery and return (prediction id, status dict).
 
-# ── Poll endpoint (frontend checks this every 2s) ────────────────────
+    The status is None when the delivery is unsigned: it could come from
+    anyone, so it's only taken as a hint to fetch the real status. Raises
+    WebhookValidationError for a bad signature, BadRequest for a bad id.
+    """
+    if WEBHOOK_SECRET:
+        Webhooks.validate(headers=headers, body=body,
+                          secret=WebhookSigningSecret(key=WEBHOOK_SECRET), tolerance=300)
 
-@app.route("/api/prediction/<prediction_id>")
-def get_prediction(prediction_id):
-    prediction = replicate.predictions.get(prediction_id)
+    data = json.loads(body)
+    prediction_id = data.get("id", "")
+    if not VALID_ID.match(prediction_id):
+        raise BadRequest("Invalid prediction id")
+    if not WEBHOOK_SECRET:
+        return prediction_id, None
 
-    result = {
-        "status": prediction.status,
-    }
+    result = poll_response(data.get("status"), data.get("output"), data.get("error"))
+    remember_result(prediction_id, result, data.get("created_at"), data.get("started_at"),
+                    data.get("completed_at"))
+    return prediction_id, result
 
-    if prediction.status == "succeeded":
-        result["output"] = prediction.output
-    elif prediction.status == "failed":
-        result["error"] = prediction.error or "Prediction failed"
 
-    return jsonify(result)
+@app.route("/api/webhook/replicate", methods=["POST"])
+def replicate_webhook():
+    try:
+        prediction_id, result = read_webhook(dict(request.headers), request.get_data(as_text=True))
+    except WebhookValidationError as e:
+        return jsonify({"error": f"Invalid webhook: {e}"}), 401
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    if result is None:
+        result = fetch_status(prediction_id)
+    status_cache.put(prediction_id, result)
+    events.publish(prediction_id, result)
+    return "", 204
+
+
+@app.route("/api/prediction/<prediction_id>/events")
+def prediction_events(prediction_id):
+    """Stream status changes for one prediction as Server-Sent Events.
+
+    Webhook deliveries are pushed as soon as they arrive; the status cache
+    is checked every FALLBACK_POLL_SECONDS in case one never does. A
+    queued request is followed to its prediction once it starts.
+    """
+    if not VALID_ID.match(prediction_id):
+        return jsonify({"error": "Invalid prediction id"}), 400
+
+    def stream():
+        yield "retry: 1000\n\n"
+        deadline = time.monotonic() + STREAM_SECONDS
+        sent, sent_at, checked_at = None, 0.0, float("-inf")
+        watch_id = prediction_id
+        while True:
+            now = time.monotonic()
+            queued, watch_id = queued_status(watch_id)
+            result = queued or events.latest(watch_id)
+            if (queued is None and (result is None or result["status"] not in TERMINAL)
+                    and now - checked_at >= FALLBACK_POLL_SECONDS):
+                checked_at = now
+                try:
+                    fetched = status_cache.get(watch_id)
+                    if result is None or STATUS_RANK.get(fetched["status"], 2) >= STATUS_RANK.get(result["status"], 2):
+                        result = fetched
+                except Exception:
+                    traceback.print_exc()
+
+            if result is not None and (result != sent or now - sent_at >= HEARTBEAT_SECONDS):
+                yield f"data: {json.dumps(result)}\n\n"
+                sent, sent_at = result, now
+                if result["status"] in TERMINAL:
+                    return
+            if now >= deadline:
+                return
+            events.wait(0.5)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # ── Debug / health ────────────────────────────────────────────────────
 
-@app.route("/health")
-def health():
-    return jsonify({
+def health_status():
+    return {
         "status": "ok",
         "version": 4,
         "models_loaded": list(VERSIONS.keys()) + list(OFFICIAL.keys()),
-        "models_failed": ERRORS,
-    })
+        "models_failed": {key: versions.errors[ref] for key, ref in MODELS.items() if ref in versions.errors},
+        "status_cache": status_cache.stats(),
+        "upload_cache": upload_cache.stats(),
+        "result_cache": result_cache.stats() if result_cache else None,
+        "output_cache": output_cache.stats() if output_cache else None,
+        "scheduler": scheduler.stats() if scheduler else None,
+        "webhooks": bool(PUBLIC_URL),
+    }
+
+
+@app.route("/health")
+def health():
+    return jsonify(health_status())
+
+
+@app.route("/metrics")
+def metrics():
+    """Per-model latency percentiles over the last METRICS_WINDOW seconds."""
+    return jsonify({"window_seconds": telemetry.window, "models": telemetry.stats()})
 
 
 if __name__ == "__main__":
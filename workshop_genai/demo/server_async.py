@@ -0,0 +1,399 @@
+"""
+Async (ASGI) variant of server.py — same routes, same behaviour.
+
+Under sync gunicorn every request holds a worker thread for as long as
+its upstream call takes, so one slow upload of a large photo stalls the
+polls queued behind it. Here each request awaits its Replicate calls on
+the event loop instead, over one keep-alive connection pool shared by
+the whole process (UPSTREAM_CONNECTIONS, default 200), so hundreds of
+upstream calls can be in flight per worker.
+
+The model table, request validation, caches, scheduler and webhook
+checks are the ones in server.py; only request handling and upstream
+I/O are async. Their bookkeeping reads and writes small files shared
+with the other workers, so it runs in threads (asyncio.to_thread), off
+the event loop. Queued predictions are started by the scheduler's own
+threads with server.py's sync client; their status is then polled
+through this module's status cache like any other, so each prediction
+is polled upstream once, not once per cache.
+
+Local:
+    pip install -r requirements.txt
+    export REPLICATE_API_TOKEN="r8_your_token_here"
+    python server_async.py
+
+Render:
+    Start command: uvicorn server_async:app --host 0.0.0.0 --port $PORT --workers 2
+
+Load test against a local fake upstream (see loadtest.py):
+    python fake_replicate.py --port 9000
+    REPLICATE_BASE_URL=http://127.0.0.1:9000 REPLICATE_API_TOKEN=fake python server_async.py
+    python loadtest.py --clients 100
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import os
+import time
+import traceback
+from contextlib import asynccontextmanager
+
+import httpx
+import replicate
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from replicate.exceptions import ReplicateError
+from replicate.webhook import WebhookValidationError
+from starlette.exceptions import HTTPException
+
+import server
+from events import VALID_ID
+from inputs import IMAGE_FIELDS, BadRequest, build_batch, build_input
+from output_cache import TooLarge
+from server import (
+    BATCH_MAX, FALLBACK_POLL_SECONDS, HEARTBEAT_SECONDS, MODELS, OUTPUT_CACHE_CONTROL, STATUS_RANK,
+    STREAM_SECONDS, THROTTLED_MESSAGE, batch_response, batches, client_id, events, local_status,
+    memoized_prediction, note_started, output_cache, prediction_status, queued_status, read_webhook,
+    scheduler, telemetry, upload_cache, versions, webhook_args,
+)
+from status_cache import StatusCache, TERMINAL
+
+UPSTREAM_CONNECTIONS = int(os.environ.get("UPSTREAM_CONNECTIONS", 200))
+POOL_SHARD_SIZE = 16
+
+
+class ShardedTransport(httpx.AsyncBaseTransport):
+    """Keep-alive connection pool split into shards of POOL_SHARD_SIZE.
+
+    httpcore's pool does bookkeeping quadratic in its connection count on
+    every request; with a hundred connections busy that costs more CPU than
+    the requests themselves, so requests go round-robin to small pools.
+    """
+
+    def __init__(self, connections):
+        limits = httpx.Limits(max_connections=POOL_SHARD_SIZE,
+                              max_keepalive_connections=POOL_SHARD_SIZE, keepalive_expiry=60)
+        self.shards = [httpx.AsyncHTTPTransport(limits=limits)
+                       for _ in range(max(1, -(-connections // POOL_SHARD_SIZE)))]
+        self._next = itertools.cycle(self.shards)
+
+    async def handle_async_request(self, request):
+        return await next(self._next).handle_async_request(request)
+
+    async def aclose(self):
+        for shard in self.shards:
+            await shard.aclose()
+
+
+if os.environ.get("REPLICATE_FAKE"):
+    api = server.api  # FakeReplicate has the async_* methods as well
+else:
+    # replicate wraps the transport it's given in its retry transport (a
+    # limits= argument would be ignored). Only async methods are used, so
+    # the client's sync half never sees it.
+    api = replicate.Client(
+        timeout=httpx.Timeout(10.0, read=60.0, write=60.0, pool=30.0),
+        transport=ShardedTransport(UPSTREAM_CONNECTIONS),
+    )
+
+@asynccontextmanager
+async def lifespan(app):
+    if scheduler:
+        # The scheduler checks on the predictions it started from its own
+        # threads; send those lookups through this process's status cache
+        loop = asyncio.get_running_loop()
+        scheduler.status = lambda prediction_id: asyncio.run_coroutine_threadsafe(
+            status_cache.aget(prediction_id), loop).result()
+    yield
+
+
+app = FastAPI(title="GenAI Workshop API", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+# ── Errors — always JSON, in the same shape as server.py ─────────────
+# (a middleware rather than an Exception handler, which Starlette follows
+# by re-raising, so uvicorn would drop the keep-alive connection)
+@app.middleware("http")
+async def handle_error(request, call_next):
+    try:
+        return await call_next(request)
+    except Exception as e:
+        traceback.print_exc()
+        if isinstance(e, ReplicateError) and e.status == 429:
+            return JSONResponse({"error": THROTTLED_MESSAGE}, status_code=429, headers={"Retry-After": "5"})
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.exception_handler(HTTPException)
+async def handle_http_error(request, e):
+    return JSONResponse({"error": e.detail}, status_code=e.status_code)
+
+
+# ── Upstream calls ───────────────────────────────────────────────────
+
+async def upload_data_uri(data_uri, model_key):
+    """Convert a data URI or URL to a Replicate file upload URL."""
+    if data_uri.startswith("http://") or data_uri.startswith("https://"):
+        return data_uri
+
+    # Decoding and resizing a large photo is CPU work; not on the loop
+    key, url, file_obj, mime, name = await asyncio.to_thread(server.prepare_upload, data_uri, model_key)
+    if url:
+        return url
+
+    uploaded = await api.files.async_create(file_obj, filename=name, content_type=mime)
+    file_obj.close()
+    upload_cache.put(key, uploaded.urls["get"], getattr(uploaded, "expires_at", None))
+    return uploaded.urls["get"]
+
+
+async def create_prediction(model_key, model_input):
+    ref = MODELS[model_key]
+    target = versions.target(ref)
+    try:
+        return await api.predictions.async_create(input=model_input, **target, **webhook_args())
+    except ReplicateError as e:
+        if "model" not in target or e.status not in (404, 422):
+            raise
+    # Not an official model: run its latest version (looked up once, in a thread)
+    try:
+        version = await asyncio.to_thread(versions.resolve, ref)
+    except Exception as e:
+        raise ValueError(f"Model '{model_key}' failed to load: {e}")
+    return await api.predictions.async_create(input=model_input, version=version, **webhook_args())
+
+
+async def upload_images(model_key, model_input):
+    """Replace the request's images with uploaded file URLs, concurrently."""
+    fields = IMAGE_FIELDS.get(model_key, [])
+    if not fields:
+        return
+    t0 = time.monotonic()
+    urls = await asyncio.gather(*(upload_data_uri(model_input[f], model_key) for f in fields))
+    model_input.update(zip(fields, urls))
+    await asyncio.to_thread(telemetry.record, model_key, "upload", time.monotonic() - t0)
+
+
+async def begin_prediction(model_key, model_input, since):
+    prediction = await create_prediction(model_key, model_input)
+    await asyncio.to_thread(note_started, prediction.id, model_key, model_input, since)
+    return prediction.id
+
+
+async def start_prediction(model_key, model_input, client):
+    """As server.start_prediction, starting on the event loop when a slot is free."""
+    since = time.monotonic()
+    # May look up the model's version (and reads the cache from disk)
+    known = await asyncio.to_thread(memoized_prediction, model_key, model_input)
+    if known:
+        return known
+    if not scheduler:
+        return await begin_prediction(model_key, model_input, since)
+
+    claim = await asyncio.to_thread(scheduler.reserve, model_key)  # takes a file lock
+    if claim:
+        try:
+            prediction_id = await begin_prediction(model_key, model_input, since)
+        except Exception as e:
+            await asyncio.to_thread(scheduler.release, claim)
+            if not scheduler.is_throttle(e):
+                raise
+            await asyncio.to_thread(scheduler.throttle, model_key)
+        else:
+            await asyncio.to_thread(scheduler.started_on, claim, model_key, prediction_id)
+            return prediction_id
+    return await asyncio.to_thread(scheduler.enqueue, model_key, model_input, client, since)
+
+
+async def fetch_status(prediction_id):
+    result, prediction_id = await asyncio.to_thread(local_status, prediction_id)
+    if result is not None:
+        return result
+
+    prediction = await api.predictions.async_get(prediction_id)
+    if prediction.status not in TERMINAL:
+        return prediction_status(prediction)  # nothing to record yet
+    return await asyncio.to_thread(prediction_status, prediction)
+
+
+status_cache = StatusCache(
+    fetch_status,
+    ttl=float(os.environ.get("STATUS_CACHE_TTL", 1.0)),
+    max_terminal=int(os.environ.get("STATUS_CACHE_SIZE", 2000)),
+)
+
+
+# ── Routes ───────────────────────────────────────────────────────────
+
+@app.post("/api/{model_key}")
+async def start(model_key: str, request: Request):
+    if model_key not in MODELS:
+        raise HTTPException(404, "Not found")
+    try:
+        model_input = build_input(model_key, await request.json())
+        await upload_images(model_key, model_input)
+    except BadRequest as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    pred_id = await start_prediction(model_key, model_input,
+                                     client_id(request.headers, request.client and request.client.host))
+    return {"prediction_id": pred_id}
+
+
+@app.get("/api/prediction/{prediction_id}")
+async def get_prediction(prediction_id: str):
+    return await status_cache.aget(prediction_id)
+
+
+@app.get("/api/output/{key}/{name}")
+async def output_file(key: str, name: str, request: Request):
+    """A prediction output from the local cache (fetched from Replicate on first use)."""
+    if not output_cache:
+        raise HTTPException(404, "Not found")
+    try:
+        # Reads the cache's files, and a miss downloads; both in a thread
+        hit = await asyncio.to_thread(output_cache.get, key)
+    except TooLarge as e:
+        return RedirectResponse(e.url)
+    except Exception as e:
+        return JSONResponse({"error": f"Output unavailable: {e}"}, status_code=502)
+    if hit is None:
+        raise HTTPException(404, "Not found")
+
+    path, record = hit
+    headers = {"ETag": f'"{key}"', "Cache-Control": OUTPUT_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=record["content_type"], filename=record["name"],
+                        content_disposition_type="inline", headers=headers)
+
+
+async def start_batch_item(model_key, model_input, client):
+    """As server.start_batch_item: {"id": ...} or {"error": ...}."""
+    try:
+        await upload_images(model_key, model_input)
+        return {"id": await start_prediction(model_key, model_input, client)}
+    except BadRequest as e:
+        return {"error": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        if isinstance(e, ReplicateError) and e.status == 429:
+            return {"error": THROTTLED_MESSAGE}
+        return {"error": str(e)}
+
+
+@app.post("/api/batch/{model_key}")
+async def start_batch(model_key: str, request: Request):
+    if model_key not in MODELS:
+        raise HTTPException(404, "Not found")
+    try:
+        model_inputs = build_batch(model_key, await request.json(), BATCH_MAX)
+    except BadRequest as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    client = client_id(request.headers, request.client and request.client.host)
+    items = await asyncio.gather(*(start_batch_item(model_key, model_input, client)
+                                   for model_input in model_inputs))
+    batch_id = await asyncio.to_thread(batches.create, items)
+    return {"batch_id": batch_id, "prediction_ids": [item.get("id") for item in items]}
+
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    items = await asyncio.to_thread(batches.get, batch_id)
+    if items is None:
+        raise HTTPException(404, "Unknown batch")
+
+    async def status(item):
+        return await status_cache.aget(item["id"]) if "id" in item else None
+
+    return batch_response(items, await asyncio.gather(*map(status, items)))
+
+
+@app.post("/api/webhook/replicate")
+async def replicate_webhook(request: Request):
+    body = (await request.body()).decode()
+    try:
+        prediction_id, result = await asyncio.to_thread(read_webhook, dict(request.headers), body)
+    except WebhookValidationError as e:
+        return JSONResponse({"error": f"Invalid webhook: {e}"}, status_code=401)
+    except BadRequest as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if result is None:
+        result = await fetch_status(prediction_id)
+    status_cache.put(prediction_id, result)
+    await asyncio.to_thread(events.publish, prediction_id, result)
+    return Response(status_code=204)
+
+
+def watched_status(watch_id):
+    """For the event stream: (queued poll response or None, the id to watch,
+    its status as far as known without asking Replicate)."""
+    queued, watch_id = queued_status(watch_id)
+    return queued, watch_id, queued or events.latest(watch_id)
+
+
+@app.get("/api/prediction/{prediction_id}/events")
+async def prediction_events(prediction_id: str):
+    """Server-Sent Events, as in server.py; webhook files are checked every 0.5s
+    (in a thread)."""
+    if not VALID_ID.match(prediction_id):
+        return JSONResponse({"error": "Invalid prediction id"}, status_code=400)
+
+    async def stream():
+        yield "retry: 1000\n\n"
+        deadline = time.monotonic() + STREAM_SECONDS
+        sent, sent_at, checked_at = None, 0.0, float("-inf")
+        watch_id = prediction_id
+        while True:
+            now = time.monotonic()
+            queued, watch_id, result = await asyncio.to_thread(watched_status, watch_id)
+            if (queued is None and (result is None or result["status"] not in TERMINAL)
+                    and now - checked_at >= FALLBACK_POLL_SECONDS):
+                checked_at = now
+                try:
+                    fetched = await status_cache.aget(watch_id)
+                    if result is None or STATUS_RANK.get(fetched["status"], 2) >= STATUS_RANK.get(result["status"], 2):
+                        result = fetched
+                except Exception:
+                    traceback.print_exc()
+
+            if result is not None and (result != sent or now - sent_at >= HEARTBEAT_SECONDS):
+                yield f"data: {json.dumps(result)}\n\n"
+                sent, sent_at = result, now
+                if result["status"] in TERMINAL:
+                    return
+            if now >= deadline:
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/health")
+async def health():
+    return {**server.health_status(), "status_cache": status_cache.stats(), "server": "asgi"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return {"window_seconds": telemetry.window, "models": await asyncio.to_thread(telemetry.stats)}
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 8000))
+    print(f"\n  Workshop server (async) running at: http://localhost:{port}")
+    print(f"  Press Ctrl+C to stop\n")
+    uvicorn.run(app, host="0.0.0.0", port=port)
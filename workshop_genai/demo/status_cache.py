@@ -0,0 +1,141 @@
+"""
+Prediction status cache for the /api/prediction/<id> poll endpoint.
+
+Every open tab polls its prediction every 2s, and each poll used to be a
+fresh replicate.predictions.get call. StatusCache sits in front of that:
+
+  - In-progress statuses are cached for a short TTL, so tabs polling the
+    same prediction share one upstream call per TTL.
+  - Concurrent misses for the same prediction are coalesced: one thread
+    makes the upstream call and the others wait for its result.
+  - Terminal statuses (succeeded / failed / canceled) never change, so
+    they are kept until evicted, least recently used first.
+
+server_async.py uses aget() instead of get(), with a coroutine as fetch;
+there the coalesced call runs as its own task, so a client disconnecting
+mid-poll doesn't cancel it for the others.
+
+The cache is per process; under gunicorn each worker has its own.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+TERMINAL = {"succeeded", "failed", "canceled"}
+
+
+class _Call:
+    """An upstream fetch in progress that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class StatusCache:
+    def __init__(self, fetch, ttl=1.0, max_terminal=2000):
+        """fetch(prediction_id) returns a status dict with at least a "status" key."""
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_terminal = max_terminal
+        self._lock = threading.Lock()
+        self._live = {}                # id -> (expires_at, status dict)
+        self._terminal = OrderedDict()  # id -> status dict, in LRU order
+        self._inflight = {}            # id -> _Call
+        self._tasks = {}               # id -> asyncio.Task, for aget()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, prediction_id, now):
+        if prediction_id in self._terminal:
+            self._terminal.move_to_end(prediction_id)
+            return self._terminal[prediction_id]
+        entry = self._live.get(prediction_id)
+        if entry and entry[0] > now:
+            return entry[1]
+        return None
+
+    def get(self, prediction_id):
+        with self._lock:
+            value = self._lookup(prediction_id, time.monotonic())
+            if value is not None:
+                self.hits += 1
+                return value
+            call = self._inflight.get(prediction_id)
+            leader = call is None
+            if leader:
+                call = self._inflight[prediction_id] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self.fetch(prediction_id)
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            self.put(prediction_id, call.value)
+        finally:
+            with self._lock:
+                del self._inflight[prediction_id]
+            call.done.set()
+        return call.value
+
+    async def aget(self, prediction_id):
+        with self._lock:
+            value = self._lookup(prediction_id, time.monotonic())
+            if value is not None:
+                self.hits += 1
+                return value
+            task = self._tasks.get(prediction_id)
+            if task is None:
+                task = self._tasks[prediction_id] = asyncio.ensure_future(self.fetch(prediction_id))
+                task.add_done_callback(lambda t: self._fetched(prediction_id, t))
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _fetched(self, prediction_id, task):
+        with self._lock:
+            del self._tasks[prediction_id]
+        if not task.cancelled() and task.exception() is None:
+            self.put(prediction_id, task.result())
+
+    def put(self, prediction_id, value):
+        """Store a status (e.g. one learned without polling)."""
+        with self._lock:
+            if value.get("status") in TERMINAL:
+                self._live.pop(prediction_id, None)
+                self._terminal[prediction_id] = value
+                self._terminal.move_to_end(prediction_id)
+                while len(self._terminal) > self.max_terminal:
+                    self._terminal.popitem(last=False)
+            else:
+                now = time.monotonic()
+                self._live[prediction_id] = (now + self.ttl, value)
+                if len(self._live) > self.max_terminal:
+                    # Drop expired in-progress entries so polls for abandoned
+                    # predictions can't grow the dict without bound
+                    self._live = {k: v for k, v in self._live.items() if v[0] > now}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "live": len(self._live),
+                "terminal": len(self._terminal),
+            }
@@ -0,0 +1,170 @@
+"""
+Per-model latency telemetry, reported by /metrics.
+
+For each prediction four durations are recorded, in seconds:
+
+    upload   decoding, resizing and uploading the request's images
+    start    from the request (images uploaded) until Replicate accepted
+             the prediction, including any wait in the scheduler's queue
+    queue    Replicate's "starting" phase: waiting for a worker, cold boots
+    run      Replicate's "processing" phase, until it finished
+
+queue and run come from the prediction's created_at / started_at /
+completed_at timestamps, once it reaches a terminal status; whichever
+worker sees that first records them (the started/<id> marker is removed
+exactly once).
+
+Samples are appended to one log shared by all gunicorn workers, which is
+compacted to the last `window` seconds (at most half of MAX_LOG_BYTES)
+once it grows past MAX_LOG_BYTES.
+stats() gives percentiles over that rolling window.
+"""
+
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from events import VALID_ID
+
+METRICS = ("upload", "start", "queue", "run")
+MAX_LOG_BYTES = 512 * 1024
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list (q in 0..100)."""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def _timestamp(value):
+    """Seconds since the epoch for an ISO 8601 time from Replicate, or None."""
+    if not value:
+        return None
+    # Replicate sends up to nanoseconds; datetime takes at most microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class Telemetry:
+    def __init__(self, directory, window=900):
+        self.dir = Path(directory)
+        self.started_dir = self.dir / "started"
+        self.started_dir.mkdir(parents=True, exist_ok=True)
+        self.log = self.dir / "samples.jsonl"
+        self.window = window
+        self._lock = threading.Lock()
+
+    def record(self, model_key, metric, seconds):
+        """Add one sample."""
+        line = json.dumps([round(time.time(), 3), model_key, metric, round(seconds, 4)]) + "\n"
+        with self._lock:
+            f = self._open_locked(fcntl.LOCK_SH)  # appends may interleave; compaction may not
+            with f:
+                f.write(line)
+                size = f.tell()
+        if size > MAX_LOG_BYTES:
+            self._compact()
+
+    def _open_locked(self, operation):
+        """The log opened for appending and locked, reopened if compaction
+        replaced it while we waited for the lock."""
+        while True:
+            f = open(self.log, "a")
+            fcntl.flock(f, operation)
+            try:
+                if os.stat(self.log).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def started(self, prediction_id, model_key):
+        """Remember which model a prediction runs, for finished()."""
+        if VALID_ID.match(prediction_id):
+            (self.started_dir / prediction_id).write_text(model_key)
+
+    def finished(self, prediction_id, created_at, started_at, completed_at):
+        """Record queue and run time of a prediction that reached a terminal status."""
+        if not VALID_ID.match(prediction_id):
+            return
+        marker = self.started_dir / prediction_id
+        try:
+            model_key = marker.read_text()
+            marker.unlink()
+        except FileNotFoundError:
+            return  # not started here, or already recorded
+        created, started, completed = map(_timestamp, (created_at, started_at, completed_at))
+        if created and started:
+            self.record(model_key, "queue", max(0.0, started - created))
+        if started and completed:
+            self.record(model_key, "run", max(0.0, completed - started))
+
+    def _samples(self):
+        cutoff = time.time() - self.window
+        try:
+            with open(self.log) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        samples = []
+        for line in lines:
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a concurrent append
+            if sample[0] >= cutoff:
+                samples.append(sample)
+        return samples
+
+    def _compact(self):
+        """Drop samples older than the window, and markers of predictions
+        nobody saw finish."""
+        with self._open_locked(fcntl.LOCK_EX) as f:
+            if os.fstat(f.fileno()).st_size <= MAX_LOG_BYTES:
+                return  # another worker just did it
+            # At most half the limit, so a busy window doesn't compact on every sample
+            lines = [json.dumps(sample) + "\n" for sample in self._samples()]
+            size, first = sum(map(len, lines)), 0
+            while size > MAX_LOG_BYTES // 2:
+                size -= len(lines[first])
+                first += 1
+            lines = "".join(lines[first:])
+            tmp = self.log.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(lines)
+            os.replace(tmp, self.log)
+        cutoff = time.time() - 24 * 3600
+        for path in self.started_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """{model: {metric: {count, p50, p90, p99, max}}} over the last `window` seconds."""
+        values = defaultdict(lambda: defaultdict(list))
+        for _, model_key, metric, seconds in self._samples():
+            values[model_key][metric].append(seconds)
+        result = {}
+        for model_key, metrics in sorted(values.items()):
+            result[model_key] = {}
+            for metric in METRICS:
+                if metric in metrics:
+                    v = sorted(metrics[metric])
+                    result[model_key][metric] = {
+                        "count": len(v),
+                        "p50": round(percentile(v, 50), 3),
+                        "p90": round(percentile(v, 90), 3),
+                        "p99": round(percentile(v, 99), 3),
+                        "max": round(v[-1], 3),
+                    }
+        return result
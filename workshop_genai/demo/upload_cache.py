@@ -0,0 +1,59 @@
+"""
+Uploaded-file URL cache keyed by the SHA-256 of the image bytes.
+
+Participants iterate on prompts with the same photo, and every request
+used to upload it to replicate.files again. UploadCache remembers the URL
+each distinct image was uploaded to until shortly before the file
+expires (so a queued prediction can still fetch it), keeping at most
+`max_entries` URLs, least recently used evicted first.
+
+The cache is per process; under gunicorn each worker has its own.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class UploadCache:
+    def __init__(self, max_entries=500, default_ttl=3600, margin=900):
+        """Uploads Replicate reports an expiry for are dropped `margin` seconds
+        before it; ones without are kept for default_ttl seconds."""
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (usable until, epoch seconds; url)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, url, expires_at=None):
+        """Remember an upload. expires_at is the ISO 8601 time Replicate reports, if any."""
+        until = time.time() + self.default_ttl
+        if expires_at:
+            try:
+                until = datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp() - self.margin
+            except ValueError:
+                pass
+        with self._lock:
+            self._entries[key] = (until, url)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,99 @@
+"""
+Model reference -> predictions.create target, for server.py.
+
+MODELS entries pinned to a version ("owner/name:hash") resolve locally.
+Unpinned entries ("owner/name") go to Replicate's official-model endpoint;
+if that endpoint rejects one (community models need a version), its
+latest version is looked up with models.get and used from then on.
+
+Nothing is looked up at import, so the server binds immediately. Lookups
+happen on first use, concurrent requests for the same model share one,
+and results go to a JSON file with a TTL that every gunicorn worker (and
+the next restart) reads instead of asking again. Each worker keeps the
+file's contents in memory and reads it again at most every `reread`
+seconds, so creating a prediction doesn't touch the disk.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+
+class VersionResolver:
+    def __init__(self, lookup, path, ttl=6 * 3600, reread=30):
+        """lookup(ref) returns the latest version id of an unpinned model, or None."""
+        self.lookup = lookup
+        self.path = Path(path)
+        self.ttl = ttl
+        self.reread = reread
+        self._data = None  # the file's contents as last read or written
+        self._read_at = 0.0
+        self.errors = {}   # ref -> last lookup error
+        self._lock = threading.Lock()
+        self._inflight = {}  # ref -> Future
+
+    def _read(self, fresh=False):
+        now = time.monotonic()
+        if fresh or self._data is None or now - self._read_at >= self.reread:
+            try:
+                data = json.loads(self.path.read_text())
+            except (FileNotFoundError, ValueError):
+                data = {}
+            self._data, self._read_at = data, now
+        return self._data
+
+    def _store(self, ref, version):
+        with self._lock:
+            data = dict(self._read(fresh=True))
+            data[ref] = {"version": version, "resolved_at": time.time()}
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, indent=1))
+            os.replace(tmp, self.path)
+            self._data, self._read_at = data, time.monotonic()
+
+    def cached(self, ref):
+        """A version resolved within the TTL by any worker, or None."""
+        entry = self._read().get(ref)
+        if entry and time.time() - entry["resolved_at"] < self.ttl:
+            return entry["version"]
+        return None
+
+    def target(self, ref):
+        """Keyword arguments for predictions.create: version= when known, else model=."""
+        if ":" in ref:
+            return {"version": ref.split(":", 1)[1]}
+        version = self.cached(ref)
+        return {"version": version} if version else {"model": ref}
+
+    def resolve(self, ref):
+        """Look up (and cache) the latest version of an unpinned model."""
+        version = self.cached(ref)
+        if version:
+            return version
+
+        with self._lock:
+            future = self._inflight.get(ref)
+            leader = future is None
+            if leader:
+                future = self._inflight[ref] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            version = self.lookup(ref)
+            if not version:
+                raise ValueError(f"{ref} has no published version")
+            self._store(ref, version)
+            self.errors.pop(ref, None)
+            future.set_result(version)
+            return version
+        except Exception as e:
+            self.errors[ref] = str(e)
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[ref]